@@ -0,0 +1,27 @@
+"""
+Benchmark of the vectorized ethash dataset generation against item by item generation.
+
+Usage: python -m benchmarks.ethash_dataset [items]
+"""
+import sys
+import timeit
+
+import numpy as np
+
+from blockchain.Consensus.Pow.dataset import HASH_BYTES, generateCache, generateDataset, generate_dataset_item
+
+
+def main(items=4096):
+    cache = generateCache(1024 * HASH_BYTES, bytes(32))
+    dataset = generateDataset(items * HASH_BYTES, cache)
+    scalar = np.concatenate([generate_dataset_item(cache, index) for index in range(items)])
+    assert dataset.tobytes() == scalar.tobytes()
+
+    scalar_time = timeit.timeit(lambda: [generate_dataset_item(cache, index) for index in range(items)], number=1)
+    vectorized_time = timeit.timeit(lambda: generateDataset(items * HASH_BYTES, cache), number=1)
+    print(f"    item by item: {scalar_time * 1e3:9.2f} ms ({items / scalar_time:10.0f} items/s)")
+    print(f"      vectorized: {vectorized_time * 1e3:9.2f} ms ({items / vectorized_time:10.0f} items/s)")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 4096)
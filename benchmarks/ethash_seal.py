@@ -0,0 +1,46 @@
+"""
+Hashrate of the multi-process nonce search for 1 to N processes.
+
+Usage: python -m benchmarks.ethash_seal [hashes per process] [max processes]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from blockchain.Consensus.Pow.consensus import sealContext, sealWorker
+from blockchain.Consensus.Pow.dataset import generateCache, generateDataset, memoryMapAndGenerate
+
+
+def main(hashes=1000, max_processes=os.cpu_count()):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "0-test.dataset")
+        cache = generateCache(1024, bytes(32))
+        memoryMapAndGenerate(path, 32 * 1024, lambda out: generateDataset(32 * 1024, cache, out=out))
+
+        context = sealContext()
+        for processes in range(1, max_processes + 1):
+            abort = context.Event()
+            workers = []
+            start = time.time()
+            for i in range(processes):
+                reader, writer = context.Pipe(duplex=False)
+                # A target of 0 is never met: each worker hashes its whole range.
+                worker = context.Process(target=sealWorker, args=(path, bytes(32), 0, i * hashes, hashes, abort, writer))
+                worker.start()
+                writer.close()
+                workers.append((worker, reader))
+            done = 0
+            for worker, reader in workers:
+                try:
+                    while True:
+                        done += reader.recv()[1]
+                except EOFError:
+                    worker.join()
+            elapsed = time.time() - start
+            print(f"{processes:3d} processes: {done / elapsed:10.0f} H/s")
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*args)
@@ -1,21 +1,28 @@
+import math
+import multiprocessing
 import os
 import queue
 import random
 import threading
-from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 from queue import Queue
 
+import numpy as np
 import rlp
 from repoze.lru import LRUCache
 
 from blockchain.Consensus import *
 import time
 
-from blockchain.Consensus.Pow.dataset import Dataset
+from blockchain.Consensus.Pow.dataset import Cache, Dataset, fnv, keccak512
+from blockchain.Consensus.Pow.hashrate import HashrateMeter
+from blockchain.Consensus.Pow.remote import RemoteSealer, WorkServer
 from blockchain.Consensus.consensus import Engine, ChainHeaderReader, ChainReader
 from blockchain.block import Block, BlockHeader
 from blockchain.storage import Storage
-from kademlia.crypto import sha3, fvn, fvnHash
+from kademlia.crypto import sha3
 
 params = {
     "DifficultyBoundDivisor": 2048,
@@ -33,30 +40,61 @@ params = {
     "epochLength": 30000
 }
 
+# Nombre de hashs calculés par un processus de minage entre deux vérifications de l'arrêt
+SEAL_CHECK_INTERVAL = 64
+
 
 class ProofOfWork(Engine):
 
-    def __init__(self):
+    def __init__(self, dataset_dir="", datasets_on_disk=2, caches_on_disk=3, caches_in_mem=3, datasets_in_mem=1,
+                 pregenerate_after=0.5, process_sealing=True, test=False):
+        # Répertoire des caches et datasets ethash ("" = en mémoire uniquement) et nombre d'epochs gardées sur disque
+        self.dataset_dir = dataset_dir
+        self.datasets_on_disk = datasets_on_disk
+        self.caches_on_disk = caches_on_disk
+        # Fraction de l'epoch courante à partir de laquelle le dataset de la suivante est généré en arrière-plan
+        self.pregenerate_after = pregenerate_after
+        # Tailles de cache et de dataset réduites, pour les tests
+        self.test = test
+        # Recherche de nonce dans des processus séparés quand le dataset est sur disque
+        self.process_sealing = process_sealing
         self.fakeFull = False
         self.maxUncles = 2
+        # 0 : un thread ou processus par cœur, < 0 : minage uniquement par les mineurs externes
         self.threads = 0
         self.rand = None
         self.lock = threading.Lock()
         self.update = threading.Event()
-        self.caches = LRUCache(params["epochLength"])
-        self.datasets = LRUCache(params["epochLength"])
+        self.hashrate_meter = HashrateMeter()
+        # Clés : numéros d'epoch
+        self.caches = LRUCache(caches_in_mem)
+        self.datasets = LRUCache(datasets_in_mem)
+        # Dataset de l'epoch suivante, en cours de génération ou prêt
+        self.future = None
+        # Débit de la dernière vérification par verify_headers
+        self.verify_stats = None
+        # Tâches publiées aux mineurs externes, voir start_remote_sealer
+        self.remote = None
+        self.work_server = None
+        # Pool de processus de vérification des sceaux, partagé par les appels à verify_headers
+        self.verify_pool = None
+        # Processus de minage, démarrés une fois et réutilisés d'une tâche à l'autre, voir seal_processes
+        self.seal_pool = None
+        self.seal_pool_size = 0
+        self.seal_abort = None
+        self.seal_progress = None
 
     def author(self, header) -> tuple:
         return header.beneficiary, None
 
     def verify_header(self, chain, header) -> bool:
         number = header.number
-        if chain.get_header(header.hash, number) is not None:
+        if getHeader(chain, header.hash, number) is not None:
             return False
-        parent = chain.get_header(header.parent_hash, number - 1)
+        parent = getHeader(chain, header.parent_hash, number - 1)
         if parent is None:
             return False
-        return verifyHeader(chain, header, parent, False, int(time.time()))
+        return verifyHeader(chain, header, parent, False, int(time.time())) and self.verify_seal(header)
 
     def verify_headers(self, chain, headers) -> tuple:
         if self.fakeFull or len(headers) == 0:
@@ -68,26 +106,94 @@ class ProofOfWork(Engine):
         abort = Queue()
         results = Queue(maxsize=len(headers))
         unixNow = int(time.time())
+        workers = self.threads if self.threads > 0 else os.cpu_count()
+
+        def pipeline():
+            # Les règles structurelles sont vérifiées ici, dans l'ordre ; les sceaux, coûteux, dans un pool de
+            # workers. Au plus `window` vérifications sont en cours, leurs résultats sont publiés dans l'ordre.
+            start = time.time()
+            window = deque()
+            published = 0
+            executor = None
+            try:
+                executor = self._seal_verifier(headers[0].number, workers)
+                for i, header in enumerate(headers):
+                    if not abort.empty():
+                        return
+                    if i > 0 and headers[i - 1].hash == header.parent_hash:
+                        parent = headers[i - 1]
+                    else:
+                        parent = chain.get_header(header.parent_hash, header.number - 1)
+
+                    if parent is None:
+                        error = f"parent not found: {header.parent_hash.hex()}"
+                    elif not verifyHeader(chain, header, parent, False, unixNow):
+                        error = f"invalid header #{header.number}"
+                    else:
+                        error = None
+                    window.append((header, error, None if error else self._submit_seal(executor, header)))
+
+                    while window and (len(window) >= 4 * workers or i == len(headers) - 1):
+                        if not abort.empty():
+                            return
+                        header, error, sealed = window.popleft()
+                        if sealed is not None and not sealed.result():
+                            error = f"invalid seal #{header.number}"
+                        if not window and i == len(headers) - 1:
+                            self._record_verify_stats(len(headers), time.time() - start)
+                        results.put(error)
+                        published += 1
+            except Exception as e:
+                # L'appelant attend un résultat par en-tête : les en-têtes restants sont refusés
+                print(f"Header verification failed: {e!r}")
+                if isinstance(e, BrokenProcessPool):
+                    self._drop_verify_pool(executor)
+                for _ in range(len(headers) - published):
+                    results.put(f"verification failed: {e!r}")
+            finally:
+                for _, _, sealed in window:
+                    if sealed is not None:
+                        sealed.cancel()
+                if isinstance(executor, ThreadPoolExecutor):
+                    executor.shutdown(wait=False, cancel_futures=True)
+
+        threading.Thread(target=pipeline, daemon=True).start()
+        return abort, results
 
-        def worker():
-            for i, header in enumerate(headers):
-                if i == 0:
-                    parent = chain.get_header(header.parent_hash, header.number - 1)
-                elif headers[i - 1].hash != header.parent_hash:
-                    parent = headers[i - 1]
-
-                error = None
-                if parent is None:
-                    error = f"parent not found: {header.parent_hash.hex()}"
-                else:
-                    error = verifyHeader(chain, header, parent, False, unixNow)
-
-                if not abort.empty():
-                    return
-                results.put(error)
+    def _record_verify_stats(self, count, elapsed):
+        self.verify_stats = {
+            "headers": count,
+            "elapsed": elapsed,
+            "headers_per_sec": count / elapsed if elapsed > 0 else math.inf,
+        }
+        print(f"Verified {count} headers in {elapsed:.2f}s ({self.verify_stats['headers_per_sec']:.1f} headers/s)")
+
+    def _seal_verifier(self, number, workers):
+        # Avec un cache sur disque, chaque processus le mappe ; sinon les vérifications restent dans ce processus
+        cache = self.cache(number)
+        if self.fakeFull or not getattr(cache.cache, "filename", None):
+            return ThreadPoolExecutor(max_workers=workers)
+        with self.lock:
+            if self.verify_pool is None:
+                # Créé une fois : fork depuis un processus qui a des threads peut bloquer les processus fils
+                self.verify_pool = ProcessPoolExecutor(max_workers=workers, mp_context=workerContext())
+            return self.verify_pool
 
-        threading.Thread(target=worker).start()
-        return abort, results
+    def _drop_verify_pool(self, executor):
+        with self.lock:
+            if self.verify_pool is executor:
+                self.verify_pool = None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit_seal(self, executor, header):
+        if isinstance(executor, ThreadPoolExecutor):
+            return executor.submit(self.verify_seal, header)
+        cache = self.cache(header.number)
+        return executor.submit(
+            verifySealLight, cache.epoch, cache.cache.filename, cache.dataset_size,
+            self.seal_hash(header), header.nonce, header.difficulty
+        )
 
     def verify_uncles(self, chain, block) -> bool:
         if self.fakeFull:
@@ -131,7 +237,7 @@ class ProofOfWork(Engine):
         return True
 
     def prepare(self, chain, header) -> bool:
-        parent = chain.chainReaderHeader.get_header(header.parent_hash, header.number - 1)
+        parent = getHeader(chain, header.parent_hash, header.number - 1)
         if parent is None:
             return False
         return True
@@ -150,61 +256,164 @@ class ProofOfWork(Engine):
         return Block(BlockHeader, txs), True
 
     def seal(self, chain, block, results, stop) -> bool:
-
-        abort = threading.event()
         with self.lock:
             threads = self.threads
             if self.rand is None:
                 seed = random.SystemRandom().randint(0, 2 ** 63 - 1)
                 self.rand = random.Random(seed)
 
-        if threads <= 0:
+        if threads == 0:
             threads = os.cpu_count()
 
-        with ThreadPoolExecutor(max_workers=threads) as executor:
-
-            local_blocks = queue.Queue()
-
-            def miner_task(id, nonce):
-                try:
-                    if not abort.is_set():
-                        mined_block = self.mine(block, id, nonce, abort)
-                        if mined_block is not None:
-                            local_blocks.put(mined_block)
-                finally:
-                    pass
-
-            for i in range(threads):
+        while True:
+            self.update.clear()
+            with self.lock:
                 nonce = int(self.rand.random() * 2 ** 64)
-                executor.submit(miner_task, i, nonce)
+            self.hashrate_meter.start_work(block.header.difficulty)
+            if self.remote is not None:
+                self.remote.new_work(block, results, stop)
+
+            if threads < 0:
+                # Minage uniquement par les mineurs externes : attendre leur solution ou une nouvelle tâche
+                sealed = None
+                while not stop.is_set() and not self.update.is_set():
+                    stop.wait(0.1)
+            else:
+                dataset = self.dataset(block.header.number, False)
+                # Un dataset sur disque peut être mappé par d'autres processus, sinon la recherche reste dans ce processus
+                if self.process_sealing and getattr(dataset, "filename", None):
+                    sealed = self.seal_processes(block, dataset.filename, threads, nonce, stop)
+                else:
+                    sealed = self.seal_threads(block, threads, nonce, stop)
+
+            if sealed is not None:
+                # Un mineur externe a pu livrer ce bloc pendant la recherche locale
+                if self.remote is None or self.remote.claim(stop):
+                    self.hashrate_meter.share()
+                    results.put(sealed)
+                return True
+            if stop.is_set() or not self.update.is_set():
+                return True
+            self.hashrate_meter.stale_work()
+            # Paramètres de minage modifiés : relancer la recherche
+
+    def seal_threads(self, block, threads, nonce, stop):
+        abort = threading.Event()
+        local_blocks = queue.Queue()
+        stride = 2 ** 64 // threads
+
+        def miner_task(id, seed):
+            mined_block = self.mine(block, id, seed, abort)
+            if mined_block is not None:
+                local_blocks.put(mined_block)
+
+        executor = ThreadPoolExecutor(max_workers=threads)
+        for i in range(threads):
+            executor.submit(miner_task, i, (nonce + i * stride) % 2 ** 64)
+
+        sealed = None
+        while sealed is None and not stop.is_set() and not self.update.is_set():
+            try:
+                sealed = local_blocks.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        abort.set()
+        executor.shutdown(wait=False)
+        return sealed
 
+    def seal_processes(self, block, dataset_path, processes, nonce, stop):
+        # Chaque processus du pool reçoit (seal hash, plage de nonces) et mappe le fichier du dataset une fois ;
+        # il vérifie l'événement d'arrêt partagé tous les SEAL_CHECK_INTERVAL hashs et publie ses hashs calculés.
+        header = block.header
+        seal_hash = self.seal_hash(header)
+        target = 2 ** 256 // header.difficulty
+        stride = 2 ** 64 // processes
+        pool, abort, progress = self._seal_workers(processes)
+
+        pending = {
+            pool.submit(sealWorker, f"ethash-seal-{i}", dataset_path, seal_hash, target,
+                        (nonce + i * stride) % 2 ** 64, stride)
+            for i in range(processes)
+        }
+        found = None
+        try:
+            while pending and found is None and not stop.is_set() and not self.update.is_set():
+                done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                self._record_seal_progress(progress)
+                for future in done:
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool as e:
+                        print(f"Seal worker pool failed: {e!r}")
+                        self._drop_seal_pool(pool)
+                        return None
+                    if result is not None:
+                        found = result
+        finally:
+            # Les processus s'arrêtent au plus SEAL_CHECK_INTERVAL hashs plus tard ; l'événement n'est rouvert
+            # qu'une fois toutes les plages terminées, pour ne pas relancer une plage abandonnée
+            abort.set()
+            wait(pending)
+            abort.clear()
+            self._record_seal_progress(progress)
+
+        if found is None:
+            return None
+        print("Ethash nonce found and reported", "nonce", found)
+        return sealBlock(block, found)
+
+    def _seal_workers(self, processes):
+        with self.lock:
+            pool, size = self.seal_pool, self.seal_pool_size
+        if pool is not None and size != processes:
+            # Nombre de processus modifié (self.threads) : un nouveau pool remplace l'ancien
+            self._drop_seal_pool(pool)
+        with self.lock:
+            if self.seal_pool is None:
+                context = workerContext()
+                self.seal_abort = context.Event()
+                self.seal_progress = context.Queue()
+                self.seal_pool = ProcessPoolExecutor(
+                    max_workers=processes, mp_context=context, initializer=sealInit,
+                    initargs=(self.seal_abort, self.seal_progress)
+                )
+                self.seal_pool_size = processes
+            return self.seal_pool, self.seal_abort, self.seal_progress
+
+    def _drop_seal_pool(self, pool):
+        with self.lock:
+            if self.seal_pool is pool:
+                self.seal_abort.set()
+                self.seal_pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _record_seal_progress(self, progress):
         while True:
             try:
-                result = local_blocks.get(timeout=0.1)
-                results.put(result)
-                abort.set()
-                break
+                worker, hashes = progress.get_nowait()
             except queue.Empty:
-                if stop.is_set():
-                    abort.set()
-                    break
-                if self.update.is_set():
-                    err = self.seal(chain, block, results, stop)
-                    if not err:
-                        print("error for restart sealing")
+                return
+            self.hashrate_meter.mark(worker, hashes)
 
-        executor.shutdown(wait=False)
-        return True
+    def verify_seal(self, header) -> bool:
+        # Vérifie le nonce avec le seul cache de l'epoch : un nœud qui ne mine pas n'a pas besoin du dataset
+        if self.fakeFull:
+            return True
+        if header.difficulty <= 0:
+            return False
+        cache = self.cache(header.number)
+        _, result = hashimotoLight(cache.dataset_size, cache, self.seal_hash(header), header.nonce)
+        return int.from_bytes(result, "big") <= 2 ** 256 // header.difficulty
 
     def seal_hash(self, header) -> str:
         enc = rlp.encode([
             header.parent_hash,
-            header.uncle_hash,
-            header.coinbase,
+            header.uncles_hash,
+            header.beneficiary,
             header.state_root,
             header.transaction_root,
-            header.receipt_root,
-            header.bloom,
+            header.receipts_root,
+            header.logs_bloom,
             header.difficulty,
             header.number,
             header.gas_limit,
@@ -221,9 +430,40 @@ class ProofOfWork(Engine):
         return ["eth", "net", "web3", "miner", "admin"]
 
     def close(self) -> bool:
+        if self.work_server is not None:
+            self.work_server.close()
+            self.work_server = None
+        if self.verify_pool is not None:
+            self._drop_verify_pool(self.verify_pool)
+        if self.seal_pool is not None:
+            self._drop_seal_pool(self.seal_pool)
         return True
 
-    def mine(self, block, id, seed, abort) -> tuple[Block, bytes]:
+    def start_remote_sealer(self, address) -> WorkServer:
+        """
+        Publie les tâches de minage aux mineurs externes (eth_getWork / eth_submitWork).
+
+        Parameters:
+        ----------
+        address : tuple or str
+            (hôte, port) pour un serveur TCP, ou chemin d'un socket Unix.
+        """
+        with self.lock:
+            if self.remote is None:
+                self.remote = RemoteSealer(self)
+            if self.work_server is None:
+                self.work_server = WorkServer(self.remote, address).start()
+            return self.work_server
+
+    def hashrate(self) -> float:
+        # Hashs par seconde, moyenne exponentielle sur la dernière minute
+        return self.hashrate_meter.rate()
+
+    def mining_stats(self) -> dict:
+        # Hashrate global et par worker, blocs trouvés, temps moyen estimé avant un bloc, travaux abandonnés
+        return self.hashrate_meter.stats()
+
+    def mine(self, block, id, seed, abort) -> Block:
         header = block.header
         hash = self.seal_hash(header)
         target = 2 ** 256 // header.difficulty
@@ -240,34 +480,68 @@ class ProofOfWork(Engine):
                 break
             else:
                 attempts += 1
-                if (attempts % (1 << 15)) == 0:
-                    # hashrate.mark(attempts)
-                    # TODO Need To Implement hashrate marker later
-                    print("Hashrate", attempts)
+                if attempts == SEAL_CHECK_INTERVAL:
+                    self.hashrate_meter.mark(f"thread-{id}", attempts)
                     attempts = 0
 
                 digest, result = hashimotoFull(dataset, hash, nonce)
-                if result <= target:
+                if int.from_bytes(result, "big") <= target:
                     print("Ethash nonce found and reported", "attempts", nonce - seed, "nonce", nonce)
-                    header.nonce = nonce
-                    header.mix_hash = digest
-                    return block, dataset
-                nonce += 1
+                    self.hashrate_meter.mark(f"thread-{id}", attempts)
+                    return sealBlock(block, nonce)
+                nonce = (nonce + 1) % 2 ** 64
 
     def dataset(self, number: int, is_async: bool) -> bytes:
         epoch = number // params["epochLength"]
-        current: Dataset = self.datasets.get(epoch)
+        with self.lock:
+            current: Dataset = self.datasets.get(epoch)
+            if current is None:
+                if self.future is not None and self.future.epoch == epoch:
+                    # Généré (ou en cours de génération) en arrière-plan
+                    current, self.future = self.future, None
+                else:
+                    current = Dataset(epoch)
+                self.datasets.put(epoch, current)
 
         if is_async and not current.generated():
-            def func():
-                current.generate(dir="", limit=0, lock=False, test=False)
-
-            threading.Thread(target=func).start()
+            threading.Thread(target=self._generate, args=(current,), daemon=True).start()
         else:
-            current.generate(dir="", limit=0, lock=False, test=False)
+            self._generate(current)
+
+        if number % params["epochLength"] >= self.pregenerate_after * params["epochLength"]:
+            self.pregenerate(epoch + 1)
 
         return current.dataset
 
+    def cache(self, number: int) -> Cache:
+        epoch = number // params["epochLength"]
+        with self.lock:
+            current: Cache = self.caches.get(epoch)
+            if current is None:
+                current = Cache(epoch)
+                self.caches.put(epoch, current)
+        return current.generate(dir=self.dataset_dir, limit=self.caches_on_disk, lock=False, test=self.test)
+
+    def pregenerate(self, epoch: int) -> None:
+        # Lance la génération du dataset d'une epoch future dans un thread, une seule fois
+        with self.lock:
+            if self.datasets.get(epoch) is not None or (self.future is not None and self.future.epoch == epoch):
+                return
+            self.future = Dataset(epoch)
+            future = self.future
+        threading.Thread(target=self._generate, args=(future,), name=f"ethash-pregenerate-{epoch}", daemon=True).start()
+
+    def _generate(self, dataset: Dataset) -> None:
+        dataset.generate(dir=self.dataset_dir, limit=self.datasets_on_disk, lock=False, test=self.test)
+
+
+def getHeader(chain, hash, number):
+    # Les lecteurs d'en-têtes lèvent ValueError pour un en-tête inconnu (voir ConcreteChainHeaderReader)
+    try:
+        return chain.get_header(hash, number)
+    except ValueError:
+        return None
+
 
 def verifyHeader(chain, header: BlockHeader, parent: BlockHeader, uncle: bool, now: int) -> bool:
     if len(header.extra_data) > params["MaximumExtraDataSize"]:
@@ -307,19 +581,19 @@ def calcDifficulty(config: dict, time: int, parent: BlockHeader) -> int:
 
 
 def calcDifficultyFrontier(time: int, parent: BlockHeader) -> int:
-    adjust = parent.header.difficulty // params["DifficultyBoundDivisor"]
+    adjust = parent.difficulty // params["DifficultyBoundDivisor"]
     big_time = time
-    big_parent = parent.header.timestamp
+    big_parent = parent.timestamp
 
     if big_time - big_parent < 13:
-        diff = parent.header.difficulty + adjust
+        diff = parent.difficulty + adjust
     else:
-        diff = parent.header.difficulty - adjust
+        diff = parent.difficulty - adjust
 
     if diff < params["MinimumDifficulty"]:
         return params["MinimumDifficulty"]
 
-    period_count = (parent.header.number + 1) // params["expDiffPeriod"]
+    period_count = (parent.number + 1) // params["expDiffPeriod"]
     if period_count > 1:
         exp_diff = 2 ** (period_count - 2)
         diff += exp_diff
@@ -345,8 +619,71 @@ def accumulateRewards(config, stateDB, header, uncles):
     stateDB.add_balance(header.beneficiary, reward)
 
 
-def hashimotoFull(dataset: bytes, hash: bytes, nonce: int) -> tuple[bytes, bytes]:
-    def lookup(index) -> [int]:
+def workerContext():
+    # Les processus de minage et de vérification sont démarrés sans fork : le moteur tourne dans un processus à
+    # threads, et un fork peut y copier un verrou tenu par un autre thread
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(method)
+
+
+# État d'un processus de minage, fixé par sealInit à son démarrage
+_seal_abort = None
+_seal_progress = None
+# Datasets mappés par un processus de minage, par chemin de fichier
+_seal_datasets = LRUCache(2)
+
+
+def sealInit(abort, progress):
+    global _seal_abort, _seal_progress
+    _seal_abort, _seal_progress = abort, progress
+
+
+def sealWorker(name: str, dataset_path: str, seal_hash: bytes, target: int, first_nonce: int, count: int):
+    dataset = _seal_datasets.get(dataset_path)
+    if dataset is None:
+        dataset = np.memmap(dataset_path, dtype='<u4', mode='r')
+        _seal_datasets.put(dataset_path, dataset)
+    nonce, end = first_nonce, first_nonce + count
+    while nonce < end and not _seal_abort.is_set():
+        start = nonce
+        for nonce in range(start, min(start + SEAL_CHECK_INTERVAL, end)):
+            _, result = hashimotoFull(dataset, seal_hash, nonce % 2 ** 64)
+            if int.from_bytes(result, "big") <= target:
+                _seal_progress.put((name, nonce - start + 1))
+                return nonce % 2 ** 64
+        nonce += 1
+        _seal_progress.put((name, nonce - start))
+    return None
+
+
+# Caches mappés par un processus de vérification, par chemin de fichier
+_light_caches = LRUCache(3)
+
+
+def verifySealLight(epoch: int, cache_path: str, dataset_size: int, seal_hash: bytes, nonce: int,
+                    difficulty: int) -> bool:
+    cache = _light_caches.get(cache_path)
+    if cache is None:
+        cache = Cache.mapped(epoch, cache_path, dataset_size)
+        _light_caches.put(cache_path, cache)
+    if difficulty <= 0:
+        return False
+    _, result = hashimotoLight(dataset_size, cache, seal_hash, nonce)
+    return int.from_bytes(result, "big") <= 2 ** 256 // difficulty
+
+
+def sealBlock(block: Block, nonce: int) -> Block:
+    # Les en-têtes RLP sont immuables : le bloc scellé est une copie avec le nonce trouvé
+    return block.copy(header=block.header.copy(nonce=nonce))
+
+
+def hashimotoLight(size: int, cache: Cache, hash: bytes, nonce: int) -> tuple[bytes, bytes]:
+    # Les éléments du dataset sont recalculés depuis le cache (et gardés dans son LRU)
+    return hashimoto(hash, nonce, size, cache.item)
+
+
+def hashimotoFull(dataset, hash: bytes, nonce: int) -> tuple[bytes, bytes]:
+    def lookup(index):
         offset = index * params["hashWords"]
         return dataset[offset:offset + params["hashWords"]]
 
@@ -356,30 +693,19 @@ def hashimotoFull(dataset: bytes, hash: bytes, nonce: int) -> tuple[bytes, bytes
 def hashimoto(hash: bytes, nonce: int, size: int, lookup) -> tuple[bytes, bytes]:
     rows = size // params["mixBytes"]
 
-    seed = hash
-    seed += nonce.to_bytes(8, "little")
-    seed = sha3(seed)
-    seedHead = seed.to_bytes(32, "little")
+    seed = keccak512(hash + nonce.to_bytes(8, "little"))
+    seedHead = int.from_bytes(seed[:4], "little")
 
-    mix = []
-    for i in len(params["mixBytes"] / 4):
-        mix.append(seed[i % 16 * 4:].to_bytes(32, "little"))
+    # Le mix fait mixBytes octets : les mots de la graine répétés
+    mix = np.tile(np.frombuffer(seed, dtype='<u4'), params["mixBytes"] // params["hashBytes"])
 
-    temp = []
     for i in range(params["loopAccesses"]):
-        p = fvn(i ^ seedHead, mix[i % len(mix)]) % rows
-        for j in range(params["mixBytes"] // params["hashBytes"]):
-            temp[j * params["hashWords"]:] = lookup(2 * p + j)
-        mix = fvnHash(mix, temp)
-
-    for i in range(len(mix)):
-        mix[i // 4] = fvn(fvn(fvn(mix[i], mix[i + 1]), mix[i + 2]), mix[i + 3])
-    mix = mix[:len(mix) // 4]
-    digest = []
-
-    for i, val in enumerate(mix):
-        digest[i * 4] = val.to_bytes(32, "little")
-
-    return bytes(digest), sha3(seed + digest)
+        parent = fnv(i ^ seedHead, int(mix[i % len(mix)])) % rows
+        temp = np.concatenate([lookup(2 * parent + j) for j in range(params["mixBytes"] // params["hashBytes"])])
+        mix = fnv(mix, temp)
 
+    mix = mix.reshape(-1, 4)
+    mix = fnv(fnv(fnv(mix[:, 0], mix[:, 1]), mix[:, 2]), mix[:, 3])
+    digest = mix.astype('<u4').tobytes()
 
+    return digest, sha3(seed + digest)
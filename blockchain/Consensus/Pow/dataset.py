@@ -1,16 +1,36 @@
+import os
 import struct
 import threading
 import time
 from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
+from Crypto.Hash import keccak
+from repoze.lru import LRUCache
 from sympy import isprime
 
-from kademlia.crypto import sha3, fvn, fvnHash
+from kademlia.crypto import sha3
+
+HASH_BYTES = 64
+HASH_WORDS = 16
+MIX_BYTES = 128
+CACHE_BYTES_INIT = 1 << 24
+CACHE_BYTES_GROWTH = 1 << 17
+DATASET_BYTES_INIT = 1 << 30
+DATASET_BYTES_GROWTH = 1 << 23
+CACHE_ROUNDS = 3
+DATASET_PARENTS = 256
+FNV_PRIME = 0x01000193
+# Number of dataset items computed together by generate_dataset_items.
+DATASET_BATCH = 4096
+# Number of dataset items derived from the cache kept by a Cache.
+DATASET_ITEMS_IN_CACHE = 8192
 
 
 class Dataset:
 
     def __init__(self, epoch):
+        self.cache = None
         self.dataset = b""
         self.done = False
         self.lock = threading.Lock()
@@ -21,22 +41,40 @@ class Dataset:
         self.datasetsize = [calcDatasetSize(i) for i in range(self.max_epoch)]
 
     def generate(self, dir: str, limit: int, lock: bool, test: bool):
+        """
+        Generates (or maps from `dir`) the cache and dataset of the epoch, once.
+
+        Concurrent callers wait for the generation in progress instead of starting another one.
+        """
         if self.done:
             return self
         with self.lock:
             if not self.done:
-                def func():
-                    self.done = True
-                    csize = self.cacheSize(self.epoch * self.epoch_length + 1)
-                    dsize = self.datasetSize(self.epoch * self.epoch_length + 1)
-                    seed = self.seedHash(self.epoch * self.epoch_length + 1)
-                    if dir == "":
-                        cache = generateCache(self.epoch, seed)
-                        self.dataset = generateDataset(self.epoch, cache)
-                        return
-
-                    # TODO: Implement cache and dataset disk storage later not urgent
-                threading.Thread(target=func).start()
+                csize = self.cacheSize(self.epoch * self.epoch_length + 1)
+                dsize = self.datasetSize(self.epoch * self.epoch_length + 1)
+                seed = self.seedHash(self.epoch * self.epoch_length + 1)
+                if test:
+                    csize, dsize = 1024, 32 * 1024
+                if dir == "":
+                    self.cache = generateCache(csize, seed, self.epoch)
+                    self.dataset = generateDataset(dsize, self.cache, self.epoch)
+                else:
+                    # Files are named after the epoch and the seed, and are only ever read once
+                    # complete: a restart or another miner maps them instead of regenerating.
+                    os.makedirs(dir, exist_ok=True)
+                    path = os.path.join(dir, f"{self.epoch}-{seed[:8].hex()}")
+                    self.cache = memoryMapAndGenerate(
+                        path + ".cache", csize, lambda out: generateCache(csize, seed, self.epoch, out=out)
+                    )
+                    self.dataset = memoryMapAndGenerate(
+                        path + ".dataset", dsize, lambda out: generateDataset(dsize, self.cache, self.epoch, out=out)
+                    )
+                    if limit > 0:
+                        # The cache file written alongside each dataset goes with it
+                        for kind in ("cache", "dataset"):
+                            removeOldEpochs(dir, self.epoch - limit + 1, kind)
+                self.done = True
+        return self
 
     def generated(self) -> bool:
         return self.done
@@ -54,99 +92,272 @@ class Dataset:
         return calcDatasetSize(epoch)
 
     def seedHash(self, block) -> bytes:
-        seed = bytes(32)
-        if block < self.epoch_length:
-            return seed
-        for i in range(block // self.epoch_length):
-            seed = sha3(seed)
-        return seed
+        return epochSeed(block // self.epoch_length)
+
+
+class Cache(Dataset):
+    """
+    Dataset of an epoch reduced to its cache, for verification without the full dataset.
+
+    Dataset items are derived from the cache when they are looked up, and the last
+    `items` computed ones are kept in an LRU: the headers of a same epoch often hit the
+    same items.
+    """
+
+    def __init__(self, epoch, items=DATASET_ITEMS_IN_CACHE):
+        super().__init__(epoch)
+        self.dataset_size = 0
+        self.items = LRUCache(items)
+
+    @classmethod
+    def mapped(cls, epoch: int, path: str, dataset_size: int):
+        """Cache of an already generated cache file, e.g. in another process."""
+        cache = cls(epoch)
+        cache.cache = np.memmap(path, dtype='<u4', mode='r')
+        cache.dataset_size = dataset_size
+        cache.done = True
+        return cache
+
+    def generate(self, dir: str, limit: int, lock: bool, test: bool):
+        if self.done:
+            return self
+        with self.lock:
+            if not self.done:
+                csize = self.cacheSize(self.epoch * self.epoch_length + 1)
+                dsize = self.datasetSize(self.epoch * self.epoch_length + 1)
+                seed = self.seedHash(self.epoch * self.epoch_length + 1)
+                if test:
+                    csize, dsize = 1024, 32 * 1024
+                if dir == "":
+                    self.cache = generateCache(csize, seed, self.epoch)
+                else:
+                    # Same file as the cache of the Dataset of this epoch.
+                    os.makedirs(dir, exist_ok=True)
+                    path = os.path.join(dir, f"{self.epoch}-{seed[:8].hex()}")
+                    self.cache = memoryMapAndGenerate(
+                        path + ".cache", csize, lambda out: generateCache(csize, seed, self.epoch, out=out)
+                    )
+                    if limit > 0:
+                        removeOldEpochs(dir, self.epoch - limit + 1, "cache")
+                self.dataset_size = dsize
+                self.done = True
+        return self
+
+    def item(self, index: int) -> np.ndarray:
+        """Returns the dataset item at `index` (HASH_WORDS words)."""
+        item = self.items.get(index)
+        if item is None:
+            item = generate_dataset_item(self.cache, index)
+            self.items.put(index, item)
+        return item
+
+
+def epochSeed(epoch: int) -> bytes:
+    """Seed hash of an epoch, without generating its cache."""
+    seed = bytes(32)
+    for _ in range(epoch):
+        seed = sha3(seed)
+    return seed
 
 
 def calcCacheSize(epoch: int) -> int:
-    size = 1 << 24 + 1 << 17 * epoch - 64
-    while not isprime(size // 64):
-        size -= 2 * 64
+    size = CACHE_BYTES_INIT + CACHE_BYTES_GROWTH * epoch - HASH_BYTES
+    while not isprime(size // HASH_BYTES):
+        size -= 2 * HASH_BYTES
     return size
 
 
 def calcDatasetSize(epoch: int) -> int:
-    size = 1 << 24 + 1 << 17 * epoch - 64
-    while not isprime(size // 64):
-        size -= 2 * 64
+    size = DATASET_BYTES_INIT + DATASET_BYTES_GROWTH * epoch - MIX_BYTES
+    while not isprime(size // MIX_BYTES):
+        size -= 2 * MIX_BYTES
     return size
 
 
-def generateCache(epoch: int, seed: bytes) -> bytes:
-    print("Generating cache for epoch", epoch)
-
+def memoryMap(path: str, size: int):
+    """Maps a generated file read-only, or returns None if it is missing or truncated."""
+    try:
+        if os.path.getsize(path) != size:
+            return None
+    except OSError:
+        return None
+    return np.memmap(path, dtype='<u4', mode='r')
+
+
+def memoryMapAndGenerate(path: str, size: int, generator):
+    """
+    Maps the file at `path`, generating it first if needed.
+
+    The data is generated straight into a mapped temporary file, which is renamed once
+    complete, so readers never see a partial file.
+    """
+    mapped = memoryMap(path, size)
+    if mapped is not None:
+        return mapped
+
+    temp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    out = np.memmap(temp, dtype='<u4', mode='w+', shape=(size // 4,))
+    try:
+        generator(out)
+        out.flush()
+        del out
+        with open(temp, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(temp, path)
+    except BaseException:
+        os.remove(temp)
+        raise
+    return memoryMap(path, size)
+
+
+def removeOldEpochs(dir: str, first_kept: int, kind: str):
+    """Removes the `kind` ("cache" or "dataset") files of the epochs before `first_kept`, temporary files included."""
+    for name in os.listdir(dir):
+        epoch, _, rest = name.partition("-")
+        if epoch.isdigit() and int(epoch) < first_kept and f".{kind}" in rest:
+            try:
+                os.remove(os.path.join(dir, name))
+            except OSError as e:
+                print(f"Failed to remove old ethash file {name}: {e}")
+
+
+def keccak512(data) -> bytes:
+    return keccak.new(digest_bits=512, data=bytes(data)).digest()
+
+
+def fnv(a, b):
+    """
+    FNV mix of ethash on 32-bit words.
+
+    Works on ints as well as element-wise on uint32 NumPy arrays, where the multiplication
+    wraps around like the 32-bit version.
+    """
+    return (a * FNV_PRIME ^ b) & 0xFFFFFFFF
+
+
+def _slow_generation_warning(what: str, epoch: int) -> threading.Timer:
     start = time.time()
 
-    def func():
+    def check_time():
         elapsed = time.time() - start
-        if elapsed > 60:
-            print("Generating cache for epoch", epoch, "is taking too long")
+        print(f"Generating {what} for epoch {epoch} is taking too long, elapsed: {elapsed:.2f}s")
+
+    timer = threading.Timer(60, check_time)
+    timer.daemon = True
+    timer.start()
+    return timer
 
-    threading.Timer(60, func).start()
-    cache = bytearray(epoch)
-    for offset in range(64, len(cache), 64):
-        cache[offset:offset + 64] = sha3(cache[offset - 64:offset])
 
-    temp = bytearray(64)
-    for i in range(3):
-        for j in range(len(cache) // 64):
-            src_off = ((j - 1 + len(cache) // 64) % (len(cache) // 64)) * 64
-            dst_off = j * 64
-            xor_off = int.from_bytes(cache[dst_off:dst_off + 4], 'little') % (len(cache) // 64) * 64
-            temp = bytes(
-                a ^ b for a, b in zip(cache[src_off:src_off + 64], cache[xor_off:xor_off + 64]))
-            cache[dst_off:dst_off + 64] = sha3(temp)
+def generateCache(size: int, seed: bytes, epoch: int = 0, out: np.ndarray = None) -> np.ndarray:
+    """
+    Generates the verification cache of an epoch.
 
-    return cache
+    Returns the cache as a flat array of little-endian uint32 words, `HASH_WORDS` words per row.
+    Each round of RandMemoHash depends on the row written just before, so rows are processed
+    one by one; the XOR of two 64-byte rows is done on Python integers, which is cheaper than
+    going through NumPy for a single row. The cache is written into `out` when given.
+    """
+    print("Generating cache for epoch", epoch)
+    start = time.time()
+    timer = _slow_generation_warning("cache", epoch)
 
+    rows = size // HASH_BYTES
+    cache = [keccak512(seed)]
+    for _ in range(1, rows):
+        cache.append(keccak512(cache[-1]))
+    cache = [int.from_bytes(row, 'little') for row in cache]
 
-def generateDataset(epoch: int, cache: bytes) -> bytes:
-    print("Generating dataset for epoch", epoch)
+    for _ in range(CACHE_ROUNDS):
+        for i in range(rows):
+            # First word of the row, little-endian.
+            parent = (cache[i] & 0xFFFFFFFF) % rows
+            mixed = cache[i - 1] ^ cache[parent]
+            cache[i] = int.from_bytes(keccak512(mixed.to_bytes(HASH_BYTES, 'little')), 'little')
 
+    timer.cancel()
+    print(f"Cache for epoch {epoch} generated in {time.time() - start:.2f}s")
+    data = b''.join(row.to_bytes(HASH_BYTES, 'little') for row in cache)
+    if out is None:
+        return np.frombuffer(data, dtype='<u4').copy()
+    out[:] = np.frombuffer(data, dtype='<u4')
+    return out
+
+
+def generateDataset(size: int, cache: np.ndarray, epoch: int = 0, batch: int = DATASET_BATCH,
+                    out: np.ndarray = None) -> np.ndarray:
+    """
+    Generates the full dataset of an epoch from its cache.
+
+    Items are computed `batch` at a time by `generate_dataset_items`, in a thread pool: the
+    NumPy operations release the GIL. Returns a flat array of little-endian uint32 words,
+    `out` when given (e.g. a memory-mapped file).
+    """
+    print("Generating dataset for epoch", epoch)
     start = time.time()
-    dataset_size = 1024
-    dataset = bytearray(dataset_size)
+    timer = _slow_generation_warning("dataset", epoch)
 
-    def check_time():
-        elapsed = time.time() - start
-        if elapsed > 60:
-            print(f"Generating dataset for epoch {epoch} is taking too long, elapsed: {elapsed:.2f}s")
+    rows = size // HASH_BYTES
+    if out is None:
+        out = np.empty(rows * HASH_WORDS, dtype='<u4')
+    dataset = out.reshape(rows, HASH_WORDS)
+    cache_rows = np.asarray(cache, dtype='<u4').reshape(-1, HASH_WORDS)
 
-    timer = threading.Timer(60, check_time)
-    timer.start()
-
-    def generate_for_index(index):
-        item = generate_dataset_item(cache, index)
-        dataset[index:index + len(item)] = item
+    def generate_batch(first):
+        last = min(first + batch, rows)
+        dataset[first:last] = generate_dataset_items(cache_rows, np.arange(first, last, dtype=np.uint32))
 
     with ThreadPoolExecutor(max_workers=4) as executor:
-        executor.map(generate_for_index, range(0, dataset_size, len(cache)))
+        # Consume the results so that errors raised by the workers aren't lost.
+        list(executor.map(generate_batch, range(0, rows, batch)))
 
     timer.cancel()
-    elapsed = time.time() - start
-    print(f"Dataset for epoch {epoch} generated in {elapsed:.2f}s")
-    return dataset
+    print(f"Dataset for epoch {epoch} generated in {time.time() - start:.2f}s")
+    return out
+
+
+def generate_dataset_items(cache_rows: np.ndarray, indexes: np.ndarray) -> np.ndarray:
+    """
+    Computes several dataset items at once.
+
+    `cache_rows` is the cache as a (rows, HASH_WORDS) uint32 array. The parent selection and
+    the FNV mixing run on a (len(indexes), HASH_WORDS) array for all items together; only the
+    Keccak hashes at the start and the end are computed item by item.
+    """
+    rows = cache_rows.shape[0]
+    mix = cache_rows[indexes % rows].copy()
+    mix[:, 0] ^= indexes
+    mix = _keccak512_rows(mix)
+
+    for j in range(DATASET_PARENTS):
+        parents = fnv(indexes ^ j, mix[:, j % HASH_WORDS]) % rows
+        mix = fnv(mix, cache_rows[parents])
+
+    return _keccak512_rows(mix)
 
 
-def generate_dataset_item(cache, index):
-    rows = len(cache) // 64
-    mix = bytearray(64 * 4)
-    for i in range(64):
-        mix[i * 4:i * 4 + 4] = struct.pack('<I', cache[(index % rows) * 64 + i])
+def _keccak512_rows(rows: np.ndarray) -> np.ndarray:
+    data = rows.astype('<u4', copy=False).tobytes()
+    hashed = b''.join(keccak512(data[i:i + HASH_BYTES]) for i in range(0, len(data), HASH_BYTES))
+    return np.frombuffer(hashed, dtype='<u4').reshape(rows.shape).copy()
 
-    mix = sha3(mix)
 
-    int_mix = tuple([struct.unpack('<I', mix[i * 4:i * 4 + 4])[0] for i in range(64)])
-    for i in range(len(int_mix)):
-        parent = fvn(index ^ i, int_mix[i % 64]) % rows
-        fvnHash(int_mix, cache[parent * 64: (parent + 1) * 64])
+def generate_dataset_item(cache, index: int) -> np.ndarray:
+    """
+    Computes a single dataset item from the cache, word by word.
 
-    for i, value in enumerate(int_mix):
-        mix[i * 4:i * 4 + 4] = struct.pack('<I', value)
+    This is the reference version of `generate_dataset_items`, also cheap enough to compute
+    the few items needed to check a seal with the cache only.
+    """
+    cache = np.asarray(cache, dtype='<u4')
+    rows = len(cache) // HASH_WORDS
+    offset = (index % rows) * HASH_WORDS
+    mix = [int(word) for word in cache[offset:offset + HASH_WORDS]]
+    mix[0] ^= index
+    mix = list(struct.unpack('<16I', keccak512(struct.pack('<16I', *mix))))
 
-    return sha3(mix)
+    for j in range(DATASET_PARENTS):
+        parent = fnv(index ^ j, mix[j % HASH_WORDS]) % rows
+        parent_row = cache[parent * HASH_WORDS:(parent + 1) * HASH_WORDS]
+        mix = [fnv(a, int(b)) for a, b in zip(mix, parent_row)]
 
+    return np.frombuffer(keccak512(struct.pack('<16I', *mix)), dtype='<u4').copy()
@@ -0,0 +1,99 @@
+import math
+import threading
+import time
+
+
+class Meter:
+    """
+    Exponentially weighted rate of events per second.
+
+    Each mark decays the previous total by exp(-dt / window), so the rate follows the last
+    `window` seconds and falls back to zero when marks stop coming.
+    """
+
+    def __init__(self, window: float = 60.0):
+        self.window = window
+        self.count = 0
+        self._weighted = 0.0
+        self._last = None
+
+    def mark(self, count: int, now: float = None):
+        now = time.monotonic() if now is None else now
+        self._weighted = self._decayed(now) + count
+        self._last = now
+        self.count += count
+
+    def rate(self, now: float = None) -> float:
+        now = time.monotonic() if now is None else now
+        return self._decayed(now) / self.window
+
+    def idle(self, now: float = None) -> float:
+        """Seconds since the last mark."""
+        if self._last is None:
+            return math.inf
+        return (time.monotonic() if now is None else now) - self._last
+
+    def _decayed(self, now: float) -> float:
+        if self._last is None:
+            return 0.0
+        return self._weighted * math.exp(-(now - self._last) / self.window)
+
+
+class HashrateMeter:
+    """
+    Hashrate of the sealing workers, per worker and aggregated, with share and stale work counters.
+
+    Threads mark their hashes directly; worker processes send their counts through their pipe
+    and the sealing thread marks them, so all updates happen under `lock`.
+    """
+
+    def __init__(self, window: float = 60.0):
+        self.window = window
+        self.lock = threading.Lock()
+        self.total = Meter(window)
+        self.workers = {}
+        self.shares = 0
+        self.stale = 0
+        self.difficulty = 0
+
+    def mark(self, worker, count: int):
+        with self.lock:
+            now = time.monotonic()
+            meter = self.workers.get(worker)
+            if meter is None:
+                meter = self.workers[worker] = Meter(self.window)
+            meter.mark(count, now)
+            self.total.mark(count, now)
+
+    def start_work(self, difficulty: int):
+        with self.lock:
+            self.difficulty = difficulty
+
+    def share(self):
+        with self.lock:
+            self.shares += 1
+
+    def stale_work(self):
+        with self.lock:
+            self.stale += 1
+
+    def rate(self) -> float:
+        with self.lock:
+            return self.total.rate()
+
+    def stats(self) -> dict:
+        with self.lock:
+            now = time.monotonic()
+            rate = self.total.rate(now)
+            return {
+                "hashrate": rate,
+                "hashes": self.total.count,
+                "shares": self.shares,
+                "stale_work": self.stale,
+                # A block takes `difficulty` hashes on average.
+                "time_to_block": self.difficulty / rate if rate > 0 else math.inf,
+                "workers": {
+                    worker: {"hashrate": meter.rate(now), "hashes": meter.count, "idle": meter.idle(now)}
+                    for worker, meter in self.workers.items()
+                },
+            }
@@ -0,0 +1,151 @@
+import json
+import os
+import socketserver
+import threading
+
+from blockchain.Consensus.Pow.dataset import epochSeed
+
+
+class RemoteSealer:
+    """
+    Work packages for external miners (getWork / submitWork).
+
+    The engine hands every block it seals to `new_work`. A miner pulls the current package with
+    `get_work` and searches nonces with its own copy of the dataset; `submit_work` only checks
+    the nonce with the light cache before delivering the sealed block. When the head changes,
+    the packages built on the previous head are dropped and late submissions count as stale.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.lock = threading.Lock()
+        # seal hash -> (block, results, stop) of the seal call that published it
+        self.works = {}
+        self.current = None
+
+    def new_work(self, block, results, stop):
+        seal_hash = self.engine.seal_hash(block.header)
+        with self.lock:
+            if self.current is not None and self.current.header.parent_hash != block.header.parent_hash:
+                self.works.clear()
+            self.works[seal_hash] = (block, results, stop)
+            self.current = block
+
+    def claim(self, stop):
+        """Marks the work of a seal call as sealed. Returns False if it already was."""
+        with self.lock:
+            if stop.is_set():
+                return False
+            stop.set()
+            return True
+
+    def get_work(self):
+        """Returns [seal hash, seed hash, target, block number], hex encoded."""
+        with self.lock:
+            block = self.current
+        if block is None:
+            raise ValueError("no mining work available yet")
+        from blockchain.Consensus.Pow.consensus import params
+
+        header = block.header
+        # Only the seed is needed here: the miner generates its own cache and dataset
+        seed_hash = epochSeed(header.number // params["epochLength"])
+        target = 2 ** 256 // header.difficulty
+        return [
+            "0x" + self.engine.seal_hash(header).hex(),
+            "0x" + seed_hash.hex(),
+            "0x" + target.to_bytes(32, "big").hex(),
+            hex(header.number),
+        ]
+
+    def submit_work(self, nonce, mix_digest, seal_hash):
+        """
+        Checks a nonce found by an external miner and delivers the sealed block.
+
+        Returns False if the nonce is invalid or the work is unknown, stale or already sealed.
+        `mix_digest` is accepted for compatibility but headers don't store it.
+        """
+        from blockchain.Consensus.Pow.consensus import sealBlock
+
+        nonce = int(nonce, 16) if isinstance(nonce, str) else nonce
+        if isinstance(seal_hash, str):
+            seal_hash = bytes.fromhex(seal_hash[2:] if seal_hash.startswith("0x") else seal_hash)
+        with self.lock:
+            work = self.works.get(seal_hash)
+        if work is None or work[2].is_set():
+            self.engine.hashrate_meter.stale_work()
+            return False
+
+        block, results, stop = work
+        sealed = sealBlock(block, nonce)
+        if not self.engine.verify_seal(sealed.header):
+            return False
+        if not self.claim(stop):
+            self.engine.hashrate_meter.stale_work()
+            return False
+        self.engine.hashrate_meter.share()
+        results.put(sealed)
+        return True
+
+
+class _WorkRequestHandler(socketserver.StreamRequestHandler):
+    # One JSON-RPC request per line, one response per line.
+
+    def handle(self):
+        for line in self.rfile:
+            request = None
+            try:
+                request = json.loads(line)
+                method = self.server.methods[request["method"]]
+                response = {"id": request.get("id"), "result": method(*request.get("params", [])), "error": None}
+            except Exception as e:
+                request_id = request.get("id") if isinstance(request, dict) else None
+                response = {"id": request_id, "result": None, "error": str(e) or type(e).__name__}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _ThreadingUnixStreamServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class WorkServer:
+    """
+    Local server of the work package API (eth_getWork, eth_submitWork).
+
+    `address` is either a (host, port) tuple for TCP or a path for a Unix socket.
+    """
+
+    def __init__(self, sealer, address):
+        self.address = address
+        if isinstance(address, str):
+            if os.path.exists(address):
+                os.remove(address)
+            server_class = _ThreadingUnixStreamServer
+        else:
+            server_class = _ThreadingTCPServer
+        self.server = server_class(address, _WorkRequestHandler)
+        self.server.methods = {
+            "eth_getWork": sealer.get_work,
+            "eth_submitWork": sealer.submit_work,
+        }
+        self.thread = threading.Thread(target=self.server.serve_forever, name="ethash-work-server", daemon=True)
+
+    @property
+    def server_address(self):
+        return self.server.server_address
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.remove(self.address)
@@ -1,6 +1,7 @@
 from abc import ABC, abstractmethod
 from typing import List
 from blockchain.block import Block, BlockHeader
+from blockchain.header_index import HeaderIndex
 from blockchain.transaction import Transaction
 import threading
 import queue
@@ -66,62 +67,35 @@ class ConcreteChainHeaderReader(ChainHeaderReader):
         """
         Retourne un en-tête de bloc spécifique par hash et numéro.
         """
-        block = self._find_block(hash, number)
-        if block:
-            return block.header
+        header = self.blockchain_app.header_index.header(hash)
+        if header is not None and header.number == number:
+            return header
         raise ValueError(f"Aucun en-tête trouvé avec le hash {hash} et le numéro {number}")
 
     def get_header_by_number(self, number: int) -> BlockHeader:
         """
         Retourne un en-tête de bloc par numéro.
         """
-        block = self._find_block_by_number(number)
-        if block:
-            return block.header
+        header = self.blockchain_app.header_index.header_by_number(number)
+        if header is not None:
+            return header
         raise ValueError(f"Aucun en-tête trouvé avec le numéro {number}")
 
     def get_header_by_hash(self, hash: str) -> BlockHeader:
         """
         Retourne un en-tête de bloc par hash.
         """
-        block = self._find_block_by_hash(hash)
-        if block:
-            return block.header
+        header = self.blockchain_app.header_index.header(hash)
+        if header is not None:
+            return header
         raise ValueError(f"Aucun en-tête trouvé avec le hash {hash}")
 
     def get_td(self, hash: str, number: int) -> int:
         """
         Retourne la difficulté totale (total difficulty) pour un bloc spécifique.
         """
-        header = self.get_header(hash, number)
-        return header.difficulty
-
-    def _find_block(self, hash: str, number: int):
-        """
-        Recherche un bloc par hash et numéro.
-        """
-        for block in self.blockchain_app.chain:
-            if block.hash.hex() == hash and block.header.number == number:
-                return block
-        return None
-
-    def _find_block_by_number(self, number: int):
-        """
-        Recherche un bloc par numéro.
-        """
-        for block in self.blockchain_app.chain:
-            if block.header.number == number:
-                return block
-        return None
-
-    def _find_block_by_hash(self, hash: str):
-        """
-        Recherche un bloc par hash.
-        """
-        for block in self.blockchain_app.chain:
-            if block.hash.hex() == hash:
-                return block
-        return None
+        self.get_header(hash, number)
+        return self.blockchain_app.header_index.td(hash)
 
 
 class ChainReader(ABC):
@@ -143,7 +117,7 @@ class ConcreteChainReader(ChainReader):
         """
         Récupère un bloc spécifique par hash et numéro.
         """
-        header = self.chainReaderHeader.get_header(hash, number)
+        self.chainReaderHeader.get_header(hash, number)
         block = self._find_block(hash, number)
         if block:
             return block
@@ -152,9 +126,14 @@ class ConcreteChainReader(ChainReader):
     def _find_block(self, hash: str, number: int) -> Block:
         """
         Recherche un bloc dans la chaîne par hash et numéro.
+
+        Les blocs de la chaîne se suivent : la position se déduit du numéro.
         """
-        for blk in self.blockchain_app.chain:
-            if blk.hash.hex() == hash and blk.header.number == number:
+        chain = self.blockchain_app.chain
+        position = number - chain[0].header.number if chain else -1
+        if 0 <= position < len(chain):
+            blk = chain[position]
+            if blk.hash == HeaderIndex._hash(hash):
                 return blk
         return None
 
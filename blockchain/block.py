@@ -5,7 +5,31 @@ from blockchain.transaction import Transaction
 from .storage import Storage
 
 
-class Block(rlp.Serializable):
+class CachedEncoding:
+    """
+    Mémorise les valeurs dérivées d'un objet RLP (hash, encodages) dans `_derived`.
+
+    Les champs d'un objet rlp.Serializable ne changent que dans un contexte mutable ou par
+    écriture directe de leur attribut : toute écriture d'un champ oublie les valeurs mémorisées,
+    ainsi que l'encodage RLP que rlp.encode garde dans `_cached_rlp`.
+    """
+
+    def __setattr__(self, name, value):
+        if name in self._meta.field_attrs:
+            self.__dict__.pop('_derived', None)
+            self.__dict__.pop('_cached_rlp', None)
+            self.__dict__.pop('_hash_cache', None)
+        super().__setattr__(name, value)
+
+    def _memoize(self, key, compute, depends_on=None):
+        derived = self.__dict__.setdefault('_derived', {})
+        cached = derived.get(key)
+        if cached is None or cached[0] is not depends_on:
+            cached = derived[key] = (depends_on, compute())
+        return cached[1]
+
+
+class Block(CachedEncoding, rlp.Serializable):
     fields = [
         ("header", rlp.sedes.CountableList(rlp.sedes.binary)),
         ("transactions", rlp.sedes.CountableList(rlp.sedes.binary)),
@@ -20,10 +44,11 @@ class Block(rlp.Serializable):
 
     @property
     def hash(self) -> bytes:
-        return sha3(sha3(rlp.encode([
+        # L'encodage de l'en-tête est mémorisé par l'en-tête : s'il change, le hash du bloc est recalculé
+        return self._memoize('hash', lambda: sha3(sha3(rlp.encode([
             ("header", self.header),
             ("transactions", self.transactions)
-        ])))[::-1]
+        ])))[::-1], rlp.encode(self.header))
 
     def __repr__(self):
         return (f"<{self.__class__.__name__} "
@@ -34,7 +59,7 @@ class Block(rlp.Serializable):
 
     def add_transaction(self, tx) -> None:
         t = tx.encode_transaction
-        self.__dict__['_transactions'] += t,
+        self._transactions += t,
         self.header.transaction_storage[tx.hash] = t
         self.header.transaction_root = self.header.transaction_storage.current_root
 
@@ -48,7 +73,7 @@ class Block(rlp.Serializable):
     def validate_transactions(self) -> bool:
         for tx in self.transactions:
             tr = rlp.decode(tx, Transaction)
-            if not tr.is_valid:
+            if not tr.is_valid():
                 return False
         if self.header.transaction_root != self.header.transaction_storage.current_root:
             return False
@@ -61,7 +86,9 @@ class Block(rlp.Serializable):
 
     @property
     def encode_block(self) -> str:
-        return rlp.encode([self.header, self.transactions]).hex()
+        return self._memoize(
+            'encode_block', lambda: rlp.encode([self.header, self.transactions]).hex(), rlp.encode(self.header)
+        )
 
     @classmethod
     def decode_block(cls, hex_block: str):
@@ -79,7 +106,7 @@ class Block(rlp.Serializable):
         self.header.transaction_storage.save(d)
 
 
-class BlockHeader(rlp.Serializable):
+class BlockHeader(CachedEncoding, rlp.Serializable):
     fields = [
         ("number", rlp.sedes.big_endian_int),
         ("parent_hash", rlp.sedes.binary),
@@ -126,5 +153,5 @@ class BlockHeader(rlp.Serializable):
 
     @property
     def hash(self) -> bytes:
-        return sha3(sha3(rlp.encode(self)))[::-1]
+        return self._memoize('hash', lambda: sha3(sha3(rlp.encode(self)))[::-1])
 
@@ -1,11 +1,17 @@
 # blockchain.py
 
+import os
 import sys
 import time
 import threading
 
 from app import BaseApp
 from blockchain.storage import Storage
+from blockchain.snapshot import Snapshot
+from blockchain.header_index import HeaderIndex
+from blockchain.importer import BlockImporter, prepare_transactions
+from blockchain.executor import ParallelExecutor
+from blockchain.mpt.pruner import Pruner
 # Importations des modules nécessaires
 from kademlia.service import WiredService
 from kademlia.protocol import BaseProtocol
@@ -15,9 +21,11 @@ from kademlia.slogging import get_logger
 
 from blockchain.block import Block, BlockHeader
 from blockchain.transaction import Transaction
+from blockchain.txpool import TxPool
 from blockchain.state import State
 from blockchain.miner import Miner
 from blockchain.Consensus.Pow.consensus import ProofOfWork
+from blockchain.Consensus.consensus import ConcreteChainHeaderReader
 from blockchain.Wallet.wallet import Wallet, create_wallet
 
 # Importations supplémentaires
@@ -149,12 +157,17 @@ class BlockchainApp(BaseApp):
         super(BlockchainApp, self).__init__(config or self.default_config)
         self.state = State('global')
         self.chain = []
-        self.txpool = []
+        self.txpool = TxPool(self.config.get('txpool_size', 4096))
         self.db_path = self.config.get('data_dir', './data')
         self.current_root = self.config.get('state_root', None)
         self.consensus_engine = None
         self.wallet = None
         self.miner = None
+        self.pruner = None
+        self.snapshots = {}
+        self.header_index = None
+        self.importer = None
+        self.tx_executor = None
         self.running = False
 
     def start(self):
@@ -169,30 +182,52 @@ class BlockchainApp(BaseApp):
 
     def stop(self):
         super(BlockchainApp, self).stop()
+        if self.importer is not None:
+            self.importer.close()
         # Arrêter le mineur
         self.miner.stop_mining()
         # Attendre la fin du thread de minage
         self.mining_thread.join()
+        self.tx_executor.close()
+        if self.pruner is not None:
+            self.pruner.close()
+        self.consensus_engine.close()
+        # Les couches de différences sont en mémoire : les fusionner dans la couche disque
+        for snapshot in self.snapshots.values():
+            snapshot.flatten()
         log.info("Blockchain arrêtée.")
 
     def setup(self):
         # Initialisation du stockage, état, consensus, portefeuille, mineur
 
         self.state = State('global', storage_root=self.current_root)
-
-        # Initialiser les états des contrats et des adresses
-        self.contract_state = State('contract')
-        self.address_state = State('address')
+        # Index des en-têtes (numéro, hash, difficulté totale), stocké avec les nœuds du trie
+        self.header_index = HeaderIndex(self.state.storage.backend)
+        # Lecture des en-têtes par le moteur de consensus, au travers de l'index
+        self.header_reader = ConcreteChainHeaderReader(self)
+        # Snapshots plats des états des contrats et des adresses, stockés avec les nœuds du trie
+        self.snapshots = {
+            name: Snapshot(self.state.storage.backend, name) for name in ('contract', 'address')
+        }
+
+        # Les états des contrats et des adresses ne sont ouverts, avec leurs snapshots, qu'une fois
+        # leurs racines connues, dans load_blockchain : les ouvrir ici régénérerait les snapshots
         self.chain_state = State('chain')
 
         # Mettre à jour le global_state avec les racines des états
-        if not self.contract_state.current_state_root() is None:
-            self.state.update('contract_state', self.contract_state.current_state_root())
-        if not self.address_state.current_state_root() is None:
-            self.state.update('address_state', self.address_state.current_state_root())
-        if not self.chain_state.current_state_root() is None:
-            self.state.update('chain_state', self.chain_state.current_state_root())
-        self.consensus_engine = ProofOfWork()
+        self.store_root('chain', self.chain_state)
+        # Élagage des anciens states : conserve les racines des `prune_blocks` derniers blocs (0 = désactivé)
+        prune_blocks = self.config.get('prune_blocks', 0)
+        if prune_blocks > 0:
+            self.pruner = Pruner(self.state.storage.backend, retain=prune_blocks)
+        # Les caches et datasets ethash sont gardés sur disque et partagés entre redémarrages
+        self.consensus_engine = ProofOfWork(dataset_dir=os.path.join(self.db_path, 'ethash'))
+        # Serveur eth_getWork / eth_submitWork pour les mineurs externes : (hôte, port) ou chemin de socket Unix
+        work_server = self.config.get('work_server')
+        if work_server:
+            self.consensus_engine.start_remote_sealer(tuple(work_server) if isinstance(work_server, list) else work_server)
+        # Exécution optimiste en parallèle des transactions des blocs et des blocs candidats
+        self.tx_executor = ParallelExecutor(self.config.get('execution_workers'))
         self.wallet = create_wallet()
         self.miner = Miner(
             blockchain=self,
@@ -201,6 +236,12 @@ class BlockchainApp(BaseApp):
             handler=self  # En l'absence d'un handler séparé, nous utilisons self
         )
         self.load_blockchain()
+        # Import des blocs reçus : décodage et expéditeurs dans des workers, exécution séquentielle
+        self.importer = BlockImporter(
+            self.add_block,
+            workers=self.config.get('import_workers'),
+            max_pending=self.config.get('import_max_pending', 16)
+        )
 
         # Enregistrer le service blockchain
         self.register_service(BlockchainService(self))
@@ -217,30 +258,24 @@ class BlockchainApp(BaseApp):
             genesis_block = self.create_genesis_block()
 
         # Récupérer les racines des états depuis le global_state
-        contract_state_root = self.state.get('contract_state')
-        address_state_root = self.state.get('address_state')
-        chain_state_root = self.state.get('chain_state')
+        contract_state_root = self.stored_root('contract')
+        address_state_root = self.stored_root('address')
+        chain_state_root = self.stored_root('chain')
 
         # Recréer les états des contrats et des adresses
-        self.contract_state = State('contract', storage_root=contract_state_root)
-        self.address_state = State('address', storage_root=address_state_root)
+        self.contract_state = self.open_state('contract', storage_root=contract_state_root)
+        self.address_state = self.open_state('address', storage_root=address_state_root)
         self.chain_state = State('chain', storage_root=chain_state_root)
 
         self.chain.append(genesis_block)
         self.chain_state.update(genesis_block.hash, genesis_block.encode_block)
+        self.header_index.add(genesis_block)
 
         log.info("Blockchain initialisée avec le bloc genesis.")
 
     def create_genesis_block(self) -> Block:
-        # Initialiser les états des contrats et des adresses vides
-        self.contract_state = State('contract')
-        self.address_state = State('address')
-        self.chain_state = State('chain')
-        # Mettre à jour le global_state avec les racines des états
-        self.state.update('contract_state', self.contract_state.current_state_root())
-        self.state.update('address_state', self.address_state.current_state_root())
-        self.state.update('chain_state', self.chain_state.current_state_root())
-
+        # Les states d'une nouvelle chaîne sont vides, sans racine à enregistrer ; ceux d'une chaîne
+        # existante gardent leurs racines dans le global_state
         genesis_header = BlockHeader(
             number=0,
             parent_hash='0' * 64,
@@ -251,8 +286,8 @@ class BlockchainApp(BaseApp):
             gas_used=0,
             nonce='0' * 16,
             state_root=self.state.current_state_root(),
-            transaction_root=compute_transactions_root([]),
-            receipts_root=compute_receipts_root([]),
+            transaction_root=self.compute_transactions_root([]),
+            receipts_root=self.compute_receipts_root([]),
             logs_bloom='',
             uncles_hash='',
             extra_data='Genesis Block'
@@ -260,50 +295,120 @@ class BlockchainApp(BaseApp):
         genesis_block = Block(header=genesis_header, transactions=[])
         return genesis_block
 
+    def stored_root(self, name):
+        # Racine d'un state enregistrée dans le global_state, None tant que le state est vide
+        try:
+            return self.state.get(f'{name}_state')
+        except KeyError:
+            return None
+
+    def store_root(self, name, state):
+        # Un state vide n'a pas de racine : rien n'est enregistré
+        root = state.current_state_root()
+        if root is not None:
+            self.state.update(f'{name}_state', root)
+
+    def open_state(self, name, storage_root=None):
+        # Ouvre un state avec son snapshot, régénéré si le snapshot ne connaît pas sa racine
+        snapshot = self.snapshots.get(name)
+        state = State(name, storage_root=storage_root, snapshot=snapshot)
+        if snapshot is not None and not snapshot.knows(storage_root):
+            log.info(f"Génération du snapshot du state {name}.")
+            snapshot.generate(state.storage)
+        return state
+
     def get_latest_block(self) -> Block:
         # Récupérer le dernier bloc de la chaîne
         return self.chain[-1]
 
-    def add_block(self, block: Block) -> bool:
+    def add_block(self, block: Block, transactions=None) -> bool:
+        # Toutes les écritures du bloc (states, chaîne, index des en-têtes, snapshots) sont appliquées en un seul
+        # batch du backend : un arrêt brutal ne laisse jamais un bloc à moitié écrit. Le verrou d'écriture tenu
+        # pendant ce temps est celui de l'élagage, qui ne croise donc ni les écritures ni le comptage des racines.
+        with self.state.storage.backend.atomic():
+            return self._add_block(block, transactions)
+
+    def _add_block(self, block: Block, transactions=None) -> bool:
         # Ajouter un bloc à la chaîne après validation
-        if self.validate_block(block):
+        if self.validate_block(block, transactions):
             # Recréer les états des contrats et des adresses à partir du global_state
-            self.chain_state = State('chain', storage_root=self.state.get('chain_state'))
+            self.chain_state = State('chain', storage_root=self.stored_root('chain'))
+            with self.chain_state.batch():
+                self.chain_state.update(block.hash, block.encode_block)
+            # Une couche de différences par bloc dans les snapshots
+            self.contract_state.commit_snapshot()
+            self.address_state.commit_snapshot()
+            with self.state.batch():
+                self.store_root('chain', self.chain_state)
             self.chain.append(block)
-            self.chain_state.update(block.hash, block.encode_block)
-            self.state.update('chain_state', self.chain_state.current_state_root())
+            self.header_index.add(block)
+            # Le bloc candidat du mineur doit être reconstruit sur la nouvelle tête
+            if self.miner is not None:
+                self.miner.wake.set()
+            if self.pruner is not None:
+                self.pruner.retain(block.header.number, self.state_roots())
             log.info(f"Bloc #{block.header.number} ajouté à la blockchain.")
             return True
         else:
             log.warning(f"Échec de la validation du bloc #{block.header.number}.")
             return False
 
-    def validate_block(self, block: Block) -> bool:
+    def state_roots(self):
+        # Racines de tous les tries vivants, à conserver pour le bloc courant
+        return [
+            self.state.current_state_root(),
+            self.contract_state.current_state_root(),
+            self.address_state.current_state_root(),
+            self.chain_state.current_state_root(),
+        ]
+
+    def validate_block(self, block: Block, transactions=None) -> bool:
         # Validation du bloc selon les règles du consensus
+        # `transactions` : paires (transaction décodée, expéditeur), déjà préparées par l'import des blocs reçus
         parent_block = self.get_latest_block()
         try:
-            self.consensus_engine.verify_header(self, block.header)
             if block.header.parent_hash != parent_block.hash:
                 log.error("Le hash du parent ne correspond pas.")
                 return False
             if block.header.number != parent_block.header.number + 1:
                 log.error("Le numéro du bloc n'est pas séquentiel.")
                 return False
+            # Règles de l'en-tête (horodatage, difficulté, limite de gaz) et sceau
+            if not self.consensus_engine.verify_header(self.header_reader, block.header):
+                log.error(f"En-tête ou sceau invalide pour le bloc #{block.header.number}.")
+                return False
             # Valider les transactions
-            for tx in block.transactions:
+            if transactions is None:
+                transactions = prepare_transactions(block)
+            for tx, sender in transactions:
                 if not tx.is_valid():
                     log.error(f"Transaction invalide dans le bloc #{block.header.number}.")
                     return False
-                else:
-                    self.miner.validate_and_apply_transaction(tx)
+            # Exécution en parallèle, avec le même résultat qu'en série ; les states sont écrits une seule fois
+            address_overlay = self.address_state.overlay()
+            contract_overlay = self.contract_state.overlay()
+            results = self.tx_executor.execute(
+                self.miner.validate_and_apply_transaction, transactions, address_overlay, contract_overlay
+            )
+            if not all(result is True for result in results):
+                log.error(f"Transaction refusée à l'exécution dans le bloc #{block.header.number}.")
+                return False
+            contract_overlay.commit()
+            address_overlay.commit()
+            with self.state.batch():
+                self.store_root('contract', self.contract_state)
+                self.store_root('address', self.address_state)
             return True
         except Exception as e:
             log.error(f"Erreur lors de la validation du bloc: {e}")
             return False
 
     def handle_new_block(self, block: Block):
-        # Gestion d'un nouveau bloc reçu depuis le réseau
-        if self.add_block(block):
+        # Gestion d'un nouveau bloc reçu depuis le réseau : bloque tant que trop de blocs sont en cours d'import
+        self.importer.submit(block, self.on_block_imported)
+
+    def on_block_imported(self, block: Block, added: bool):
+        if added:
             # Si le bloc est valide et ajouté, diffuser aux autres nœuds
             self.broadcast_block(block)
             log.info(f"Bloc #{block.header.number} reçu et ajouté à la blockchain.")
@@ -316,13 +421,14 @@ class BlockchainApp(BaseApp):
 
     def new_transaction(self, transaction: Transaction):
         # Ajouter une nouvelle transaction au pool
-        if transaction.is_valid():
-            self.txpool.append(transaction)
+        if not transaction.is_valid():
+            log.warning("Transaction invalide, rejetée.")
+        elif self.txpool.add(transaction):
             # Diffuser la transaction aux pairs
             self.broadcast_transaction(transaction)
             log.info("Transaction ajoutée au pool et diffusée.")
         else:
-            log.warning("Transaction invalide, rejetée.")
+            log.warning("Transaction rejetée par le pool : déjà connue, nonce déjà pris à un prix supérieur ou pool plein.")
 
     def broadcast_block(self, block):
         blockchain_service = self.get_service(BlockchainService)
@@ -346,15 +452,15 @@ class BlockchainApp(BaseApp):
         return None
 
     def compute_transactions_root(self, transactions):
-        thx_mpt = Storage(in_memory=True)
-        for tx in transactions:
-            thx_mpt[tx.hash] = rlp.encode
+        thx_mpt = Storage.from_items(
+            ((tx.hash, rlp.encode(tx)) for tx in transactions), in_memory=True
+        )
         return thx_mpt.current_root
 
     def compute_receipts_root(self, receipts):
-        receipts_mpt = Storage(in_memory=True)
-        for receipt in receipts:
-            receipts_mpt[receipt.transaction_hash] = rlp.encode(receipt)
+        receipts_mpt = Storage.from_items(
+            ((receipt.transaction_hash, rlp.encode(receipt)) for receipt in receipts), in_memory=True
+        )
         return receipts_mpt.current_root
 
 
@@ -0,0 +1,108 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from kademlia.slogging import get_logger
+
+from .state import RecordingOverlay
+
+log = get_logger('blockchain.executor')
+
+
+class ParallelExecutor:
+    def __init__(self, workers=None):
+        """
+        Exécution optimiste des transactions d'un bloc en parallèle.
+
+        Toutes les transactions sont d'abord exécutées en même temps sur l'état d'avant le bloc,
+        chacune dans ses propres overlays qui notent les clés lues et écrites dans
+        `address_state` et `contract_state`. Les résultats sont ensuite validés dans l'ordre
+        du bloc : une transaction qui a lu une clé écrite par une transaction précédente est
+        réexécutée, seule, sur l'état à jour. L'état obtenu est celui d'une exécution en série.
+
+        Parameters:
+        ----------
+        workers : int
+            Nombre de transactions exécutées en même temps (par défaut un par cœur).
+        """
+        self.executor = ThreadPoolExecutor(workers or os.cpu_count(), thread_name_prefix="tx-execute")
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.reexecuted = 0
+
+    def execute(self, apply, transactions, address_state, contract_state, skip_failed_senders=False):
+        """
+        Exécute les transactions et écrit leurs changements dans `address_state` et `contract_state`.
+
+        Parameters:
+        ----------
+        apply : callable
+            `apply(tx, address_state, contract_state, sender)` exécute une transaction sur les
+            states donnés et retourne True si elle est acceptée, comme
+            `Miner.validate_and_apply_transaction`.
+        transactions : list of (Transaction, bytes)
+            Transactions et leurs expéditeurs, dans l'ordre du bloc.
+        address_state, contract_state : State or StateOverlay
+            States de départ, qui ne sont modifiés que pendant la validation, dans l'ordre.
+        skip_failed_senders : bool
+            Ignorer les transactions qui suivent, du même expéditeur, une transaction refusée :
+            leurs nonces ne peuvent plus être utilisés.
+
+        Returns:
+        -------
+        list of bool or None
+            Résultat de chaque transaction, None si elle a été ignorée.
+        """
+        def run(tx, sender):
+            address_overlay = RecordingOverlay(address_state)
+            contract_overlay = RecordingOverlay(contract_state)
+            try:
+                accepted = apply(tx, address_overlay, contract_overlay, sender)
+            except Exception as e:
+                log.error(f"Erreur lors de l'exécution de la transaction: {e}")
+                accepted = False
+            return accepted, address_overlay, contract_overlay
+
+        futures = [self.executor.submit(run, tx, sender) for tx, sender in transactions]
+        # Les states de départ sont partagés : rien n'y est écrit avant la fin de toutes les exécutions
+        outcomes = [future.result() for future in futures]
+
+        results = []
+        reexecuted = 0
+        # Clés écrites par les transactions déjà appliquées
+        address_written = set()
+        contract_written = set()
+        failed_senders = set()
+        for (tx, sender), outcome in zip(transactions, outcomes):
+            accepted, address_overlay, contract_overlay = outcome
+            if skip_failed_senders and sender in failed_senders:
+                results.append(None)
+                continue
+            if address_overlay.reads & address_written or contract_overlay.reads & contract_written:
+                # Exécutée sur un état dépassé : réexécuter sur l'état à jour
+                accepted, address_overlay, contract_overlay = run(tx, sender)
+                reexecuted += 1
+            if accepted:
+                address_written |= address_overlay.writes
+                contract_written |= contract_overlay.writes
+                address_overlay.commit()
+                contract_overlay.commit()
+            else:
+                failed_senders.add(sender)
+            results.append(accepted)
+
+        with self._lock:
+            self.executed += len(transactions)
+            self.reexecuted += reexecuted
+        return results
+
+    def stats(self):
+        with self._lock:
+            return {
+                "executed_transactions": self.executed,
+                "reexecuted_transactions": self.reexecuted,
+                "conflict_rate": self.reexecuted / self.executed if self.executed else 0.0,
+            }
+
+    def close(self):
+        self.executor.shutdown()
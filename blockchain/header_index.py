@@ -0,0 +1,103 @@
+import threading
+
+import rlp
+from repoze.lru import LRUCache
+
+from .block import BlockHeader
+
+
+class HeaderIndex:
+    PREFIX = b'header-index:'
+    HEADER_CACHE_SIZE = 2048
+
+    def __init__(self, backend):
+        """
+        Index des en-têtes de la chaîne : numéro -> hash, hash -> en-tête, hash -> difficulté totale.
+
+        L'index est complété à chaque bloc ajouté et écrit dans le backend des states sous un
+        préfixe propre, en une écriture par bloc. Les numéros et difficultés totales lus sont
+        gardés en mémoire, les en-têtes décodés dans un LRU : une recherche ne parcourt jamais
+        la chaîne.
+
+        Parameters:
+        ----------
+        backend : Backend
+            Backend où l'index est stocké.
+        """
+        self.backend = backend
+        self._lock = threading.RLock()
+        self._hashes = {}
+        self._tds = {}
+        self._headers = LRUCache(self.HEADER_CACHE_SIZE)
+
+    @staticmethod
+    def _hash(hash):
+        return bytes.fromhex(hash) if isinstance(hash, str) else hash
+
+    def _get(self, kind, key):
+        try:
+            return self.backend.get(self.PREFIX + kind + b':' + key)
+        except KeyError:
+            return None
+
+    def add(self, block):
+        """
+        Indexe un bloc comme bloc canonique à son numéro.
+
+        Returns:
+        -------
+        int
+            Difficulté totale de la chaîne jusqu'à ce bloc.
+        """
+        header = block.header
+        hash = block.hash
+        with self._lock:
+            parent_td = self.td(header.parent_hash) if header.number > 0 else 0
+            td = (parent_td or 0) + header.difficulty
+            number = header.number.to_bytes(8, 'big')
+            self.backend.batch(puts=[
+                (self.PREFIX + b'n:' + number, hash),
+                (self.PREFIX + b'h:' + hash, rlp.encode(header)),
+                (self.PREFIX + b't:' + hash, td.to_bytes(32, 'big')),
+            ])
+            self._hashes[header.number] = hash
+            self._tds[hash] = td
+            self._headers.put(hash, header)
+        return td
+
+    def hash_by_number(self, number):
+        """Hash du bloc canonique à ce numéro, ou None."""
+        with self._lock:
+            hash = self._hashes.get(number)
+            if hash is None:
+                hash = self._get(b'n', number.to_bytes(8, 'big'))
+                if hash is not None:
+                    self._hashes[number] = hash
+            return hash
+
+    def header(self, hash):
+        """En-tête du bloc de ce hash (bytes ou hexadécimal), ou None."""
+        hash = self._hash(hash)
+        header = self._headers.get(hash)
+        if header is None:
+            data = self._get(b'h', hash)
+            if data is None:
+                return None
+            header = rlp.decode(data, BlockHeader)
+            self._headers.put(hash, header)
+        return header
+
+    def header_by_number(self, number):
+        hash = self.hash_by_number(number)
+        return None if hash is None else self.header(hash)
+
+    def td(self, hash):
+        """Difficulté totale de la chaîne jusqu'au bloc de ce hash, ou None."""
+        hash = self._hash(hash)
+        with self._lock:
+            td = self._tds.get(hash)
+            if td is None:
+                data = self._get(b't', hash)
+                if data is not None:
+                    td = self._tds[hash] = int.from_bytes(data, 'big')
+            return td
@@ -0,0 +1,161 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import rlp
+from kademlia.slogging import get_logger
+
+from .transaction import Transaction, recover_senders, sender_recovery_pool
+
+log = get_logger('blockchain.importer')
+
+
+def decode_transaction(tx):
+    """Décode une transaction d'un bloc, sauf si elle l'est déjà (bloc miné localement)."""
+    return tx if isinstance(tx, Transaction) else rlp.decode(tx, Transaction)
+
+
+def prepare_transactions(block, executor=None):
+    """
+    Décode les transactions d'un bloc et retrouve leurs expéditeurs.
+
+    `executor` : pool de processus utilisé par `recover_senders` pour les gros blocs.
+
+    Returns:
+    -------
+    list of (Transaction, bytes)
+        Transactions décodées et leurs expéditeurs, dans l'ordre du bloc.
+    """
+    transactions = [decode_transaction(tx) for tx in block.transactions]
+    return list(zip(transactions, recover_senders(transactions, executor)))
+
+
+class BlockImporter:
+    STAGES = ("prepare", "wait", "execute")
+
+    def __init__(self, import_block, workers=None, max_pending=16, recovery_processes=None):
+        """
+        Import des blocs reçus en étapes : décodage et récupération des expéditeurs, puis exécution.
+
+        Le décodage RLP des transactions et la récupération de leurs expéditeurs (ECDSA) sont
+        lancés dans un pool de workers dès la réception d'un bloc, pendant que les blocs
+        précédents sont exécutés. L'exécution sur les states reste séquentielle, dans l'ordre de
+        réception, dans un thread dédié. Au-delà de `max_pending` blocs reçus et pas encore
+        exécutés, `submit` bloque : le pair qui envoie les blocs n'est plus lu.
+
+        Parameters:
+        ----------
+        import_block : callable
+            Exécute un bloc : `import_block(block, transactions)` avec les paires
+            (transaction, expéditeur) du bloc ; retourne True si le bloc est ajouté.
+        workers : int
+            Nombre de workers de décodage (par défaut un par cœur).
+        max_pending : int
+            Nombre maximal de blocs reçus et pas encore exécutés.
+        recovery_processes : int
+            Nombre de processus de récupération des expéditeurs des gros blocs (par défaut un par cœur).
+        """
+        self.import_block = import_block
+        self.executor = ThreadPoolExecutor(workers or os.cpu_count(), thread_name_prefix="block-prepare")
+        # Partagé par tous les blocs : les processus ne sont démarrés qu'une fois
+        self.recovery_pool = sender_recovery_pool(recovery_processes)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending = queue.Queue()
+        self._lock = threading.Lock()
+        # Temps cumulés par étape ; "wait" : attente par l'exécution d'un bloc pas encore préparé
+        self._timings = dict.fromkeys(self.STAGES, 0.0)
+        self.imported = 0
+        self.rejected = 0
+        self.transactions = 0
+        self._worker = threading.Thread(target=self._run, name="block-import", daemon=True)
+        self._worker.start()
+
+    def submit(self, block, callback=None):
+        """
+        Ajoute un bloc à l'import ; bloque tant que `max_pending` blocs sont en attente.
+
+        Parameters:
+        ----------
+        block : Block
+            Bloc reçu.
+        callback : callable
+            Appelé avec `(block, ajouté)` par le thread d'import une fois le bloc exécuté.
+        """
+        self._slots.acquire()
+        self._pending.put((block, self.executor.submit(self._prepare, block), callback))
+
+    def wait(self):
+        """Attend la fin de l'import des blocs soumis."""
+        self._pending.join()
+
+    def stats(self):
+        with self._lock:
+            stats = {f"{stage}_seconds": elapsed for stage, elapsed in self._timings.items()}
+            stats.update({
+                "imported_blocks": self.imported,
+                "rejected_blocks": self.rejected,
+                "transactions": self.transactions,
+                "pending_blocks": self._pending.qsize(),
+            })
+        execute = stats["execute_seconds"]
+        stats["transactions_per_sec"] = self.transactions / execute if execute > 0 else 0.0
+        return stats
+
+    def close(self):
+        self._pending.put(None)
+        self._worker.join()
+        self.executor.shutdown()
+        if self.recovery_pool is not None:
+            self.recovery_pool.shutdown()
+
+    def _prepare(self, block):
+        start = time.time()
+        transactions = prepare_transactions(block, self.recovery_pool)
+        return transactions, time.time() - start
+
+    def _record(self, stage, elapsed):
+        with self._lock:
+            self._timings[stage] += elapsed
+
+    def _run(self):
+        while True:
+            item = self._pending.get()
+            try:
+                if item is None:
+                    return
+                self._import(*item)
+            except Exception as e:
+                log.error(f"Erreur lors de l'import du bloc #{item[0].header.number}: {e}")
+            finally:
+                self._pending.task_done()
+
+    def _import(self, block, future, callback):
+        start = time.time()
+        try:
+            transactions, elapsed = future.result()
+        except Exception as e:
+            log.error(f"Transactions du bloc #{block.header.number} illisibles: {e}")
+            transactions = None
+        self._record("wait", time.time() - start)
+
+        added = False
+        if transactions is not None:
+            self._record("prepare", elapsed)
+            start = time.time()
+            try:
+                added = self.import_block(block, transactions)
+            except Exception as e:
+                log.error(f"Erreur lors de l'exécution du bloc #{block.header.number}: {e}")
+            self._record("execute", time.time() - start)
+
+        with self._lock:
+            if added:
+                self.imported += 1
+                self.transactions += len(transactions)
+            else:
+                self.rejected += 1
+        self._slots.release()
+        if callback is not None:
+            callback(block, added)
@@ -2,10 +2,12 @@ import threading
 import queue
 import time
 import json
+from collections import deque
 
 from blockchain.Consensus.Pow.consensus import ProofOfWork
 from blockchain.VM.code import Code
 from blockchain.block import Block, BlockHeader
+from blockchain.executor import ParallelExecutor
 from blockchain.VM.VM import VM
 from blockchain.transaction import Transaction
 
@@ -16,55 +18,38 @@ class Miner:
         self.txpool = txpool
         self.wallet = wallet
         self.handler = handler
-        self.consensus_engine = ProofOfWork()
+        self.consensus_engine = blockchain.consensus_engine or ProofOfWork()
+        self.executor = blockchain.tx_executor or ParallelExecutor()
         self.mining = False
+        # Réveille la boucle de minage : nouvelle transaction, nouveau bloc de tête, fin du scellement ou arrêt
+        self.wake = threading.Event()
+        self.builder = BlockBuilder(self)
 
     def create_block_candidate(self):
-        transactions = self.get_valid_transactions()
-        parent_block = self.blockchain.get_latest_block()
-        block_header = BlockHeader(
-            number=parent_block.header.number + 1,
-            parent_hash=parent_block.hash(),
-            beneficiary=self.wallet.get_address(),
-            difficulty=self.consensus_engine.calc_difficulty(
-                self.blockchain, int(time.time()), parent_block.header
-            ),
-            timestamp=int(time.time()),
-            gas_limit=1000000,
-            gas_used=0,
-            nonce='0' * 16,
-            state_root=self.blockchain.state.current_state_root(),
-            transaction_root=self.blockchain.compute_transactions_root(transactions),
-            receipts_root=self.blockchain.compute_receipts_root([]),
-            logs_bloom='',
-            uncles_hash='',
-            extra_data=''
-        )
-        block = Block(header=block_header, transactions=transactions)
-        self.consensus_engine.prepare(self.blockchain, block.header)
-        return block
-
-    def get_valid_transactions(self):
-        valid_transactions = []
-        for tx in self.txpool:
-            if self.validate_and_apply_transaction(tx):
-                valid_transactions.append(tx)
-            else:
-                print(f"Transaction invalide ou échec de l'application: {tx}")
-        return valid_transactions
+        self.builder.refresh()
+        return self.builder.block()
 
-    def validate_and_apply_transaction(self, tx: Transaction):
+    def validate_and_apply_transaction(self, tx: Transaction, address_state=None, contract_state=None, sender=None):
         if not tx.is_valid():
             print("Transaction invalide.")
             return False
 
-        address_state_snapshot = self.blockchain.address_state.copy()
-        contract_state_snapshot = self.blockchain.contract_state.copy()
-        sender = tx.sender
+        # Sans states fournis (overlays d'un bloc candidat), la transaction est appliquée aux states de la blockchain
+        commit_to_chain = address_state is None
+        if address_state is None:
+            address_state = self.blockchain.address_state
+        if contract_state is None:
+            contract_state = self.blockchain.contract_state
+        # Les écritures de la transaction restent en mémoire jusqu'à ce qu'elle soit acceptée
+        address_overlay = address_state.overlay()
+        contract_overlay = contract_state.overlay()
+        # L'expéditeur peut avoir été retrouvé à l'avance, par l'import des blocs
+        if sender is None:
+            sender = tx.sender
         gas_price = tx.gas_price
         gas_limit = tx.gas
 
-        sender_balance = address_state_snapshot.get(sender) or 0
+        sender_balance = address_overlay.get(sender) or 0
         max_execution_cost = gas_price * gas_limit
         if sender_balance < max_execution_cost:
             print(
@@ -86,7 +71,7 @@ class Miner:
                     print("Code du contrat manquant pour 'deploy_contract'.")
                     return False
                 contract_address = self.generate_contract_address(sender, tx.nonce)
-                contract_state_snapshot.update(contract_address, {
+                contract_overlay.update(contract_address, {
                     'code': contract_code,
                     'storage': {}
                 })
@@ -98,7 +83,7 @@ class Miner:
                     gas_used = vm.extractor.gas_used
                     vm_output = vm.get_output()
                     state_changes = self.extract_state_changes(vm_output)
-                    self.apply_state_changes(address_state_snapshot, contract_state_snapshot, state_changes)
+                    self.apply_state_changes(address_overlay, contract_overlay, state_changes)
                 except Exception as e:
                     print(f"Erreur lors de l'exécution initiale du contrat: {e}")
                     return False
@@ -110,7 +95,7 @@ class Miner:
                 if not contract_address or not func:
                     print("Adresse du contrat ou fonction manquante pour 'call_contract'.")
                     return False
-                contract_state = contract_state_snapshot.get(contract_address)
+                contract_state = contract_overlay.get(contract_address)
                 if not contract_state:
                     print(f"Contrat non trouvé à l'adresse {contract_address}.")
                     return False
@@ -126,7 +111,7 @@ class Miner:
                     gas_used = vm.extractor.gas_used
                     vm_output = vm.get_output()
                     state_changes = self.extract_state_changes(vm_output)
-                    self.apply_state_changes(address_state_snapshot, contract_state_snapshot, state_changes)
+                    self.apply_state_changes(address_overlay, contract_overlay, state_changes)
                 except Exception as e:
                     print(f"Erreur lors de l'appel du contrat: {e}")
                     return False
@@ -144,10 +129,10 @@ class Miner:
                 return False
 
             sender_balance -= (value + gas_price * gas_limit)
-            recipient_balance = address_state_snapshot.get(recipient) or 0
+            recipient_balance = address_overlay.get(recipient) or 0
             recipient_balance += value
-            address_state_snapshot.update(sender, sender_balance)
-            address_state_snapshot.update(recipient, recipient_balance)
+            address_overlay.update(sender, sender_balance)
+            address_overlay.update(recipient, recipient_balance)
 
             gas_used = 21000
 
@@ -157,12 +142,23 @@ class Miner:
                 f"Solde insuffisant pour les frais d'exécution pour l'adresse {sender}. Nécessaire: {execution_fee}, Disponible: {sender_balance}")
             return False
         sender_balance -= execution_fee
-        address_state_snapshot.update(sender, sender_balance)
-
-        self.blockchain.state.update('contract_state', contract_state_snapshot.current_state_root())
-        self.blockchain.state.update('address_state', address_state_snapshot.current_state_root())
-        self.blockchain.contract_state = contract_state_snapshot
-        self.blockchain.address_state = address_state_snapshot
+        address_overlay.update(sender, sender_balance)
+
+        if not commit_to_chain:
+            contract_overlay.commit()
+            address_overlay.commit()
+            return True
+        blockchain = self.blockchain
+        # Écriture dans les states hors de l'ajout d'un bloc : l'élagage ne reprend qu'une fois les nouvelles
+        # racines conservées, sinon il pourrait supprimer des nœuds réécrits par ce commit
+        with blockchain.state.storage.backend.write_lock:
+            contract_overlay.commit()
+            address_overlay.commit()
+            with blockchain.state.batch():
+                blockchain.store_root('contract', blockchain.contract_state)
+                blockchain.store_root('address', blockchain.address_state)
+            if blockchain.pruner is not None:
+                blockchain.pruner.retain(blockchain.get_latest_block().header.number, blockchain.state_roots())
         return True
 
     def extract_state_changes(self, vm_output):
@@ -223,25 +219,23 @@ class Miner:
         result_queue = queue.Queue()
         stop_event = threading.Event()
 
-        mining_thread = threading.Thread(
-            target=self.consensus_engine.seal,
-            args=(self.blockchain, block, result_queue, stop_event)
-        )
-        mining_thread.start()
-
-        while mining_thread.is_alive() and self.mining:
+        def seal():
             try:
-                mined_block = result_queue.get(timeout=1)
-                if mined_block:
-                    stop_event.set()
-                    mining_thread.join()
-                    return mined_block
-            except queue.Empty:
-                continue
+                self.consensus_engine.seal(self.blockchain, block, result_queue, stop_event)
+            finally:
+                self.wake.set()
+
+        mining_thread = threading.Thread(target=seal)
+        mining_thread.start()
 
+        # Attendre un bloc scellé, ou de nouvelles transactions ou une nouvelle tête : le candidat est alors mis à jour
+        self.wake.wait()
         stop_event.set()
         mining_thread.join()
-        return None
+        try:
+            return result_queue.get_nowait()
+        except queue.Empty:
+            return None
 
     def handle_mined_block(self, block):
         if self.blockchain.add_block(block):
@@ -252,46 +246,153 @@ class Miner:
             print("Échec de l'ajout du bloc miné à la blockchain.")
 
     def clear_applied_transactions(self, transactions):
-        for tx in transactions:
-            if tx in self.txpool:
-                self.txpool.remove(tx)
+        self.txpool.remove_included(transactions)
 
     def start_mining(self):
         self.mining = True
-        while self.mining:
+        while True:
+            # Effacé avant de lire le pool : une transaction arrivée pendant la mise à jour relancera la boucle
+            self.wake.clear()
+            if not self.mining:
+                break
             latest_block = self.blockchain.get_latest_block()
             block_candidate = self.create_block_candidate()
 
             if not block_candidate.transactions:
                 print("Aucune transaction valide à inclure, en attente...")
-                time.sleep(5)
+                self.wake.wait()
                 continue
 
             mined_block = self.mine_block(block_candidate)
             if mined_block:
                 self.handle_mined_block(mined_block)
-            else:
-                if self.blockchain.get_latest_block().hash() != latest_block.hash():
-                    print("La blockchain a été mise à jour, redémarrage du minage.")
-                    continue
-                else:
-                    print("Le minage a été interrompu.")
-                    break
+            elif not self.mining:
+                print("Le minage a été interrompu.")
+                break
+            elif self.blockchain.get_latest_block().hash != latest_block.hash:
+                print("La blockchain a été mise à jour, redémarrage du minage.")
+                self.consensus_engine.hashrate_meter.stale_work()
 
     def stop_mining(self):
         self.mining = False
+        self.wake.set()
         print("Arrêt du minage en cours...")
 
+    def hashrate(self):
+        return self.consensus_engine.hashrate()
 
-class Pool:
-    def __init__(self):
-        self.transactions = []
+    def mining_stats(self):
+        stats = self.consensus_engine.mining_stats()
+        stats["mining"] = self.mining
+        return stats
 
-    def add_transaction(self, transaction):
-        self.transactions.append(transaction)
 
-    def remove_transaction(self, transaction):
-        self.transactions.remove(transaction)
+class BlockBuilder:
+    def __init__(self, miner):
+        """
+        Bloc candidat tenu à jour au fil de l'arrivée des transactions.
+
+        Le builder garde l'état après les transactions du candidat dans des overlays au-dessus
+        des states de la blockchain. Une transaction arrivée dans le pool est exécutée une seule
+        fois, sur cet état, et ajoutée à la fin du candidat. Le candidat n'est reconstruit à
+        partir de tout le pool que lorsque le bloc de tête change.
+
+        Parameters:
+        ----------
+        miner : Miner
+            Mineur dont le pool, la blockchain et le moteur de consensus sont utilisés.
+        """
+        self.miner = miner
+        self.parent = None
+        self.transactions = []
+        self.address_state = None
+        self.contract_state = None
+        # Hash des transactions déjà exécutées sur le candidat, incluses ou non
+        self._seen = set()
+        self._failed_senders = set()
+        # Transactions arrivées depuis la dernière mise à jour
+        self._arrived = deque()
+        miner.txpool.subscribe(self._on_new_transaction)
+
+    def _on_new_transaction(self, tx):
+        self._arrived.append(tx)
+        self.miner.wake.set()
+
+    def reset(self, parent):
+        """Repart d'un candidat vide au-dessus de `parent`."""
+        self.parent = parent
+        self.transactions = []
+        self.address_state = self.miner.blockchain.address_state.overlay()
+        self.contract_state = self.miner.blockchain.contract_state.overlay()
+        self._seen = set()
+        self._failed_senders = set()
+        self._arrived.clear()
+
+    def refresh(self):
+        """
+        Met le candidat à jour : reconstruit sur une nouvelle tête, sinon n'exécute que les
+        transactions arrivées depuis le dernier appel.
+
+        Returns:
+        -------
+        int
+            Nombre de transactions ajoutées au candidat.
+        """
+        parent = self.miner.blockchain.get_latest_block()
+        if self.parent is None or parent.hash != self.parent.hash:
+            self.reset(parent)
+            candidates = self.miner.txpool.pending()
+        else:
+            candidates = []
+            while self._arrived:
+                tx = self._arrived.popleft()
+                if tx in self.miner.txpool:
+                    candidates.append((self.miner.txpool.sender(tx.hash), tx))
+
+        # Après un échec, les nonces suivants du même expéditeur ne peuvent plus être inclus
+        candidates = [
+            (tx, sender) for sender, tx in candidates
+            if tx.hash not in self._seen and sender not in self._failed_senders
+        ]
+        self._seen.update(tx.hash for tx, _ in candidates)
+        results = self.miner.executor.execute(
+            self.miner.validate_and_apply_transaction, candidates, self.address_state, self.contract_state,
+            skip_failed_senders=True
+        )
 
-    def get_transactions(self):
-        return self.transactions
+        added = 0
+        for (tx, sender), accepted in zip(candidates, results):
+            if accepted:
+                self.transactions.append(tx)
+                added += 1
+            elif accepted is False:
+                self._failed_senders.add(sender)
+                print(f"Transaction invalide ou échec de l'application: {tx}")
+        return added
+
+    def block(self):
+        """Bloc candidat avec les transactions appliquées jusqu'ici, prêt à être scellé."""
+        blockchain = self.miner.blockchain
+        engine = self.miner.consensus_engine
+        # Le moteur lit la configuration et les en-têtes au travers de l'index des en-têtes
+        chain = blockchain.header_reader
+        now = int(time.time())
+        block_header = BlockHeader(
+            number=self.parent.header.number + 1,
+            parent_hash=self.parent.hash,
+            beneficiary=self.miner.wallet.get_address(),
+            difficulty=engine.calc_difficulty(chain, now, self.parent.header),
+            timestamp=now,
+            gas_limit=1000000,
+            gas_used=0,
+            nonce=0,
+            state_root=blockchain.state.current_state_root() or b'',
+            transaction_root=blockchain.compute_transactions_root(self.transactions) or b'',
+            receipts_root=blockchain.compute_receipts_root([]) or b'',
+            logs_bloom=b'',
+            uncles_hash=b'',
+            extra_data=b''
+        )
+        block = Block(header=block_header, transactions=list(self.transactions))
+        engine.prepare(chain, block.header)
+        return block
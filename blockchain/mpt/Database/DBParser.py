@@ -1,60 +1,57 @@
-import json
-import os
+from .backend import Backend, open_backend
 
-class DBParser(dict):
-    def __init__(self, db_path="DB/", on_dump=False):
+
+class DBParser:
+    def __init__(self, db_path="DB/", on_dump=False, backend="sqlite"):
         """
-        Initialise le parser de base de données avec JSON.
+        Initialise l'accès à la base de données des nœuds du trie.
+
+        Les écritures sont conservées dans un cache jusqu'au prochain `dump()`,
+        les lectures sont déléguées paresseusement au backend.
 
         Parameters:
         ----------
         db_path : str
-            Chemin vers le répertoire contenant les fichiers JSON.
+            Chemin vers le répertoire de la base de données.
         on_dump : bool
-            Si True, les changements sont écrits immédiatement.
+            Si True, `commit()` écrit le cache dans le backend.
+        backend : str ou Backend
+            Type de backend ("sqlite", "lmdb", "memory") ou instance déjà ouverte.
         """
-        # get absolute path to the database
-        self.db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), db_path)
+        self.db_path = db_path
         self.cache = {}
         self.on_dump = on_dump
         self.root = None
-        if not os.path.exists(self.db_path):
-            os.makedirs(self.db_path)
-        self.load()
-
-        super().__init__()
+        if isinstance(backend, Backend):
+            self.backend = backend
+        else:
+            self.backend = open_backend(db_path, backend)
 
     def __setitem__(self, key, value):
         """
-        Définit une valeur dans la base de données.
+        Définit une valeur dans le cache d'écriture.
 
         Parameters:
         ----------
-        key : str ou bytes
-            La clé sous forme de chaîne ou de bytes.
-        value : str, bytes ou tout type sérialisable en JSON
+        key : bytes
+            La clé.
+        value : bytes
             La valeur associée à la clé.
         """
-        # Convertir les bytes en hexadécimal pour le stockage
-        if isinstance(key, bytes):
-            key = key.hex()
-        if isinstance(value, bytes):
-            value = value.hex()
-        super(DBParser, self).__setitem__(key, value)
-        self.cache[key] = value
+        self.cache[bytes(key)] = bytes(value)
 
     def __getitem__(self, key):
         """
-        Récupère une valeur de la base de données.
+        Récupère une valeur depuis le cache ou, à défaut, depuis le backend.
 
         Parameters:
         ----------
-        key : str ou bytes
-            La clé sous forme de chaîne ou de bytes.
+        key : bytes
+            La clé.
 
         Returns:
         -------
-        tout type sérialisable en JSON
+        bytes
             La valeur associée à la clé.
 
         Raises:
@@ -62,44 +59,21 @@ class DBParser(dict):
         KeyError
             Si la clé n'existe pas.
         """
-        if isinstance(key, bytes):
-            key = key.hex()
+        key = bytes(key)
         if key in self.cache:
-            value = self.cache[key]
-            return bytes.fromhex(value)
-        if key in self:
-            value = super(DBParser, self).__getitem__(key)
-            return bytes.fromhex(value)
-        raise KeyError(f"Key {key} not found.")
+            return self.cache[key]
+        return self.backend.get(key)
 
-    def load(self):
-        """
-        Charge les données de tous les fichiers JSON dans le répertoire spécifié.
-        """
-        for file in os.listdir(self.db_path):
-            if file.endswith('.json'):
-                with open(os.path.join(self.db_path, file), 'r') as f:
-                    data = json.load(f)
-                    for k, v in data.items():
-                        # Décoder les clés et valeurs hexadécimales en bytes
-                        try:
-                            k = bytes.fromhex(k)
-                        except ValueError:
-                            pass
-                        try:
-                            v = bytes.fromhex(v)
-                        except ValueError:
-                            pass
-                        self[k] = v
+    def __contains__(self, key):
+        key = bytes(key)
+        return key in self.cache or key in self.backend
 
     def dump(self):
         """
-        Sauvegarde les changements du cache dans des fichiers JSON.
+        Écrit les changements du cache dans le backend en une seule transaction.
         """
-        data = {key: value for key, value in self.cache.items()}
-        file_path = os.path.join(self.db_path, f"{self.root.hex()}.json")
-        with open(file_path, 'w') as f:
-            json.dump(data, f)
+        if self.cache:
+            self.backend.batch(puts=self.cache.items())
         self.cache.clear()
 
     def commit(self):
@@ -108,6 +82,6 @@ class DBParser(dict):
 
     def close(self):
         """
-        Méthode de fermeture (placeholder pour la compatibilité).
+        Écrit les changements en attente. Le backend reste ouvert car il est partagé.
         """
-        pass
+        self.commit()
@@ -1 +1,2 @@
+from .backend import *
 from .DBParser import *
@@ -0,0 +1,393 @@
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+try:
+    import lmdb
+except ImportError:
+    lmdb = None
+
+
+class Backend(ABC):
+    """
+    Interface d'un stockage clé-valeur pour les nœuds du trie.
+
+    Les clés et les valeurs sont des bytes. Les lectures sont paresseuses :
+    rien n'est chargé en mémoire à l'ouverture. Chaque écriture tient `write_lock`.
+    """
+
+    @property
+    def write_lock(self):
+        """
+        Verrou réentrant tenu par chaque écriture dans le backend.
+
+        Un écrivain dont plusieurs écritures doivent se suivre sans écriture d'un autre thread
+        entre elles (par exemple l'élagage, voir `Pruner`) le tient autour de l'ensemble.
+        """
+        lock = self.__dict__.get('_write_lock')
+        if lock is None:
+            lock = self.__dict__.setdefault('_write_lock', threading.RLock())
+        return lock
+
+    @contextmanager
+    def atomic(self):
+        """
+        Regroupe toutes les écritures faites dans le bloc `with` en un seul `batch`.
+
+        Les écritures sont gardées en mémoire, visibles par `get`, et appliquées ensemble à la
+        sortie du bloc : un arrêt brutal n'en laisse aucune à moitié écrite. Si une exception
+        est levée, aucune n'est appliquée. `write_lock` est tenu pendant tout le bloc ; les
+        appels imbriqués rejoignent le lot le plus externe. Les parcours (`iterate`) ne voient
+        pas les écritures en attente.
+        """
+        with self.write_lock:
+            if self.__dict__.get('_atomic') is not None:
+                yield self
+                return
+            # Clé -> valeur, ou None pour une suppression
+            self._atomic = {}
+            try:
+                yield self
+            except BaseException:
+                from ..mpt import evict_nodes
+
+                # Les nœuds écrits par un trie sont déjà dans le cache partagé : ils n'existent plus
+                evict_nodes(self, list(self._atomic))
+                self._atomic = None
+                raise
+            pending, self._atomic = self._atomic, None
+            self.batch(
+                puts=[(key, value) for key, value in pending.items() if value is not None],
+                deletes=[key for key, value in pending.items() if value is None]
+            )
+
+    def _buffer(self, puts, deletes):
+        """Ajoute des écritures au lot de `atomic` en cours. Retourne False s'il n'y en a pas."""
+        pending = self.__dict__.get('_atomic')
+        if pending is None:
+            return False
+        for key, value in puts:
+            pending[bytes(key)] = bytes(value)
+        for key in deletes:
+            pending[bytes(key)] = None
+        return True
+
+    def _buffered(self, key):
+        """Valeur de `key` dans le lot en cours, None si elle n'y est pas. Lève KeyError si elle y est supprimée."""
+        pending = self.__dict__.get('_atomic')
+        if pending is None or key not in pending:
+            return None
+        value = pending[key]
+        if value is None:
+            raise KeyError(f"Key {key.hex()} not found.")
+        return value
+
+    @abstractmethod
+    def get(self, key):
+        """Retourne la valeur associée à `key`. Lève KeyError si elle n'existe pas."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def put(self, key, value):
+        """Écrit une paire clé-valeur."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, key):
+        """Supprime une clé. Ne fait rien si elle n'existe pas."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def batch(self, puts=(), deletes=()):
+        """
+        Applique atomiquement un ensemble d'écritures et de suppressions.
+
+        Parameters:
+        ----------
+        puts : iterable de (bytes, bytes)
+            Paires clé-valeur à écrire.
+        deletes : iterable de bytes
+            Clés à supprimer.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def iterate(self):
+        """Itère sur toutes les paires (clé, valeur) stockées."""
+        raise NotImplementedError
+
+    def iterate_prefix(self, prefix):
+        """Itère sur les paires (clé, valeur) dont la clé commence par `prefix`."""
+        return ((key, value) for key, value in self.iterate() if key.startswith(prefix))
+
+    def close(self):
+        pass
+
+    def __getitem__(self, key):
+        return self.get(key)
+
+    def __setitem__(self, key, value):
+        self.put(key, value)
+
+    def __delitem__(self, key):
+        self.delete(key)
+
+    def __contains__(self, key):
+        try:
+            self.get(key)
+        except KeyError:
+            return False
+        return True
+
+
+def _prefix_end(prefix):
+    """Plus petite clé qui suit toutes les clés commençant par `prefix`, ou None s'il n'y en a pas."""
+    prefix = prefix.rstrip(b'\xff')
+    if not prefix:
+        return None
+    return prefix[:-1] + bytes([prefix[-1] + 1])
+
+
+class MemoryBackend(Backend):
+    """Stockage volatile dans un dictionnaire, utile pour les tries temporaires."""
+
+    def __init__(self):
+        self._data = {}
+
+    def get(self, key):
+        key = bytes(key)
+        value = self._buffered(key)
+        return value if value is not None else self._data[key]
+
+    def put(self, key, value):
+        self.batch(puts=[(key, value)])
+
+    def delete(self, key):
+        self.batch(deletes=[key])
+
+    def batch(self, puts=(), deletes=()):
+        with self.write_lock:
+            if self._buffer(puts, deletes):
+                return
+            data = dict(self._data)
+            for key, value in puts:
+                data[bytes(key)] = bytes(value)
+            for key in deletes:
+                data.pop(bytes(key), None)
+            self._data = data
+
+    def iterate(self):
+        return iter(list(self._data.items()))
+
+    def iterate_prefix(self, prefix):
+        return iter([(key, value) for key, value in self._data.items() if key.startswith(prefix)])
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteBackend(Backend):
+    """
+    Stockage dans un unique fichier SQLite en mode WAL.
+
+    Une seule connexion est partagée entre les threads et protégée par un verrou.
+    """
+
+    FILENAME = "trie.sqlite"
+
+    def __init__(self, db_path):
+        self.path = os.path.join(db_path, self.FILENAME)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS nodes (key BLOB PRIMARY KEY, value BLOB NOT NULL) WITHOUT ROWID")
+
+    def get(self, key):
+        value = self._buffered(bytes(key))
+        if value is not None:
+            return value
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM nodes WHERE key = ?", (bytes(key),)).fetchone()
+        if row is None:
+            raise KeyError(f"Key {bytes(key).hex()} not found.")
+        return row[0]
+
+    def put(self, key, value):
+        self.batch(puts=[(key, value)])
+
+    def delete(self, key):
+        self.batch(deletes=[key])
+
+    def batch(self, puts=(), deletes=()):
+        puts = [(bytes(k), bytes(v)) for k, v in puts]
+        deletes = [(bytes(k),) for k in deletes]
+        with self.write_lock:
+            if self._buffer(puts, [key for key, in deletes]):
+                return
+            self._write(puts, deletes)
+
+    def _write(self, puts, deletes):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany("INSERT OR REPLACE INTO nodes (key, value) VALUES (?, ?)", puts)
+                self._conn.executemany("DELETE FROM nodes WHERE key = ?", deletes)
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def iterate(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT key, value FROM nodes").fetchall()
+        return iter(rows)
+
+    def iterate_prefix(self, prefix):
+        # Parcours de l'index de la clé primaire, limité aux clés du préfixe
+        prefix = bytes(prefix)
+        end = _prefix_end(prefix)
+        with self._lock:
+            if end is None:
+                rows = self._conn.execute("SELECT key, value FROM nodes WHERE key >= ?", (prefix,)).fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT key, value FROM nodes WHERE key >= ? AND key < ?", (prefix, end)
+                ).fetchall()
+        return iter(rows)
+
+    def is_empty(self):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM nodes LIMIT 1").fetchone() is None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class LMDBBackend(Backend):
+    """Stockage dans un environnement LMDB (nécessite le paquet `lmdb`)."""
+
+    MAP_SIZE = 1 << 36
+
+    def __init__(self, db_path):
+        if lmdb is None:
+            raise ImportError("Le paquet 'lmdb' est requis pour utiliser LMDBBackend.")
+        self.path = os.path.join(db_path, "trie.lmdb")
+        self._env = lmdb.open(self.path, map_size=self.MAP_SIZE, subdir=False, lock=True)
+
+    def get(self, key):
+        value = self._buffered(bytes(key))
+        if value is not None:
+            return value
+        with self._env.begin() as txn:
+            value = txn.get(bytes(key))
+        if value is None:
+            raise KeyError(f"Key {bytes(key).hex()} not found.")
+        return value
+
+    def put(self, key, value):
+        self.batch(puts=[(key, value)])
+
+    def delete(self, key):
+        self.batch(deletes=[key])
+
+    def batch(self, puts=(), deletes=()):
+        with self.write_lock:
+            if self._buffer(puts, deletes):
+                return
+            self._write(puts, deletes)
+
+    def _write(self, puts, deletes):
+        with self._env.begin(write=True) as txn:
+            for key, value in puts:
+                txn.put(bytes(key), bytes(value))
+            for key in deletes:
+                txn.delete(bytes(key))
+
+    def iterate(self):
+        with self._env.begin() as txn:
+            return iter(list(txn.cursor()))
+
+    def iterate_prefix(self, prefix):
+        prefix = bytes(prefix)
+        items = []
+        with self._env.begin() as txn:
+            cursor = txn.cursor()
+            if cursor.set_range(prefix):
+                for key, value in cursor:
+                    if not key.startswith(prefix):
+                        break
+                    items.append((key, value))
+        return iter(items)
+
+    def is_empty(self):
+        return self._env.stat()["entries"] == 0
+
+    def close(self):
+        self._env.close()
+
+
+BACKENDS = {
+    "memory": MemoryBackend,
+    "sqlite": SQLiteBackend,
+    "lmdb": LMDBBackend,
+}
+
+_opened = {}
+_opened_lock = threading.Lock()
+
+
+def resolve_db_path(db_path):
+    """Les chemins relatifs sont résolus par rapport au répertoire du module Database."""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), db_path)
+
+
+def open_backend(db_path="DB/", kind="sqlite"):
+    """
+    Ouvre (ou réutilise) le backend associé à un répertoire.
+
+    Un même répertoire n'est ouvert qu'une seule fois par processus, de sorte que
+    construire un nouveau trie sur une base existante se fait en temps constant.
+
+    Parameters:
+    ----------
+    db_path : str
+        Chemin vers le répertoire de la base de données.
+    kind : str
+        Type de backend : "sqlite", "lmdb" ou "memory".
+
+    Returns:
+    -------
+    Backend
+        Instance du backend.
+    """
+    if kind == "memory":
+        return MemoryBackend()
+    if kind not in BACKENDS:
+        raise ValueError(f"Unknown backend {kind}.")
+
+    path = os.path.normpath(resolve_db_path(db_path))
+    with _opened_lock:
+        backend = _opened.get((path, kind))
+        if backend is None:
+            if not os.path.exists(path):
+                os.makedirs(path)
+            backend = BACKENDS[kind](path)
+            _import_json_files(path, backend)
+            _opened[(path, kind)] = backend
+    return backend
+
+
+def _import_json_files(path, backend):
+    """Importe une seule fois les anciens fichiers JSON écrits par DBParser."""
+    if not backend.is_empty():
+        return
+    for file in os.listdir(path):
+        if file.endswith('.json'):
+            with open(os.path.join(path, file), 'r') as f:
+                data = json.load(f)
+            backend.batch(puts=[(bytes.fromhex(k), bytes.fromhex(v)) for k, v in data.items()])
@@ -1,19 +1,42 @@
+import weakref
 from enum import Enum
 
+from repoze.lru import LRUCache
+
 from .Database import DBParser
 from .hash import keccak_hash
-from .nibble_path import NibblePath
+from .nibble_path import NibblePath, common_prefix_length, pack_nibbles, to_nibbles
 from .node import Node
 
+# Decoded nodes per backend, shared by all the tries opened on the same database.
+_node_caches = weakref.WeakKeyDictionary()
+
+
+def evict_nodes(backend, node_refs):
+    """ Drops deleted nodes from the decoded-node cache shared by the tries of `backend`. """
+    cache = _node_caches.get(backend)
+    if cache is not None:
+        for node_ref in node_refs:
+            cache.invalidate(node_ref)
+
+
+def _is_empty_ref(ref):
+    """ References are either bytes (hash or in-place node) or, in deferred mode, not yet hashed nodes. """
+    return isinstance(ref, bytes) and len(ref) == 0
+
+
 class MerklePatriciaTrie:
-    def __init__(self, db_path="DB/", in_memory=False, root=None, secure=False):
+    NODE_CACHE_SIZE = 8192
+
+    def __init__(self, db_path="DB/", in_memory=False, root=None, secure=False, backend=None,
+                 node_cache_size=NODE_CACHE_SIZE, deferred=False):
         """
         Crée une nouvelle instance du MPT.
 
         Parameters
         ----------
         db_path : str
-            Chemin vers la base de données LevelDB.
+            Chemin vers le répertoire de la base de données.
         in_memory : bool
             Si True, utilise uniquement le cache en mémoire sans écrire sur disque.
         root : bytes
@@ -21,21 +44,49 @@ class MerklePatriciaTrie:
             Si non fourni, l'arbre sera considéré comme vide.
         secure : bool
             (Optionnel) En mode sécurisé, toutes les clés sont hashées avec keccak256 en interne.
+        backend : str or Backend
+            (Optionnel) Backend clé-valeur ("sqlite", "lmdb", "memory") ou instance déjà ouverte.
+            Par défaut "memory" si `in_memory` est vrai, "sqlite" sinon.
+        node_cache_size : int
+            (Optionnel) Nombre de nœuds décodés gardés en cache, partagé entre les tries du même backend.
+            Le premier trie ouvert sur un backend fixe la taille. 0 désactive le cache.
+        deferred : bool
+            (Optionnel) Si True, les nœuds modifiés restent en mémoire sans être encodés ni hashés
+            jusqu'au prochain appel à `root_hash()`, `root()` ou `commit()`.
         """
-        self._storage = DBParser(db_path=db_path, on_dump=not in_memory)
+        if backend is None:
+            backend = "memory" if in_memory else "sqlite"
+        self._storage = DBParser(db_path=db_path, on_dump=not in_memory, backend=backend)
         self._root = root
         self._secure = secure
+        self._deferred = deferred
+        self._node_cache = None
+        # Decoded nodes written since the last flush. They only reach the shared cache once persisted,
+        # so other tries on the backend never see nodes that may still be rolled back.
+        self._pending_nodes = {}
+        if node_cache_size > 0:
+            self._node_cache = _node_caches.get(self.backend)
+            if self._node_cache is None:
+                self._node_cache = _node_caches.setdefault(self.backend, LRUCache(node_cache_size))
 
     def root(self):
         """ Returns a root node of the trie. Type is `bytes` if trie isn't empty and `None` othrewise. """
+        self._root = self._hash_ref(self._root)
         return self._root
 
+    @property
+    def backend(self):
+        """ Returns the key-value backend holding the trie nodes. """
+        return self._storage.backend
+
     def root_hash(self):
         """ Returns a hash of the trie's root node. For empty trie it's the hash of the RLP-encoded empty string. """
 
         if not self._root:
             return Node.EMPTY_HASH
-        elif len(self._root) == 32:
+
+        self._root = self._hash_ref(self._root)
+        if len(self._root) == 32:
             return self._root
         else:
             return keccak_hash(self._root)
@@ -131,19 +182,231 @@ class MerklePatriciaTrie:
         elif action == MerklePatriciaTrie._DeleteAction.UPDATED:
             new_root = info
             self._root = new_root
-            self._storage.root = self.root()
         elif action == MerklePatriciaTrie._DeleteAction.USELESS_BRANCH:
             _, new_root = info
             self._root = new_root
-            self._storage.root = self.root()
+
+    def items(self):
+        """
+        This method iterates over all the key-value pairs stored in the trie, in key order.
+
+        Returns
+        -------
+        iterator of (bytes, bytes)
+            Stored keys (hashed if the trie is secure) and values.
+        """
+        root = self.root()
+        if not root:
+            return
+
+        stack = [(root, b'')]
+        while stack:
+            node_ref, prefix = stack.pop()
+            node = self._get_node(node_ref)
+
+            if type(node) is Node.Leaf:
+                yield pack_nibbles(prefix + node.path.nibbles()), node.data
+            elif type(node) is Node.Extension:
+                stack.append((node.next_ref, prefix + node.path.nibbles()))
+            elif type(node) is Node.Branch:
+                if len(node.data) > 0:
+                    yield pack_nibbles(prefix), node.data
+                for idx in reversed(range(16)):
+                    if not _is_empty_ref(node.branches[idx]):
+                        stack.append((node.branches[idx], prefix + bytes([idx])))
+
+    def get_proof(self, encoded_key):
+        """
+        This method returns a Merkle proof for the provided key.
+
+        The proof is the list of RLP-encoded nodes on the path from the root to the key, root first.
+        It proves either the value associated with the key or that there is no such key.
+
+        Parameters
+        ----------
+        encoded_key: bytes
+            RLP-encoded key.
+
+        Returns
+        -------
+        list of bytes
+            Encoded nodes of the proof.
+        """
+        return self.get_multi_proof([encoded_key])
+
+    def get_multi_proof(self, encoded_keys):
+        """
+        This method returns a single Merkle proof for several keys.
+
+        Nodes shared by the paths of several keys (the upper levels of the trie) appear only once.
+
+        Parameters
+        ----------
+        encoded_keys: iterable of bytes
+            RLP-encoded keys.
+
+        Returns
+        -------
+        list of bytes
+            Encoded nodes of the proof.
+        """
+        root = self.root()
+        if root is None:
+            return []
+
+        # Node hash -> encoded node, in the order they were visited.
+        proof = {}
+        if len(root) < 32:
+            proof[keccak_hash(root)] = root
+
+        for encoded_key in encoded_keys:
+            if self._secure:
+                encoded_key = keccak_hash(encoded_key)
+            self._collect_proof(root, NibblePath(encoded_key), proof)
+
+        return list(proof.values())
+
+    def _collect_proof(self, node_ref, path, proof):
+        """ Adds the hash-referenced nodes on the path of the key to the proof. """
+        while True:
+            if len(node_ref) == 32 and node_ref not in proof:
+                proof[node_ref] = self._storage[node_ref]
+
+            node = self._get_node(node_ref)
+            if len(path) == 0 or type(node) is Node.Leaf:
+                return
+
+            if type(node) is Node.Extension:
+                if not path.starts_with(node.path):
+                    return
+                path.consume(len(node.path))
+                node_ref = node.next_ref
+            elif type(node) is Node.Branch:
+                node_ref = node.branches[path.at(0)]
+                if _is_empty_ref(node_ref):
+                    return
+                path.consume(1)
+
+    @staticmethod
+    def verify_proof(root_hash, encoded_key, proof, secure=False):
+        """
+        This method checks a Merkle proof against a root hash.
+
+        Parameters
+        ----------
+        root_hash: bytes
+            Hash of the trie's root node.
+        encoded_key: bytes
+            RLP-encoded key.
+        proof: list of bytes
+            Encoded nodes, as returned by `get_proof` or `get_multi_proof`.
+        secure: bool
+            Whether the trie hashes its keys.
+
+        Returns
+        -------
+        bytes or None
+            Value associated with the key, or None if the proof shows there is no such key.
+
+        Raises
+        ------
+        ValueError
+            ValueError is raised if the proof lacks a node needed to reach the key.
+        """
+        return MerklePatriciaTrie.verify_multi_proof(root_hash, [encoded_key], proof, secure)[encoded_key]
+
+    @staticmethod
+    def verify_multi_proof(root_hash, encoded_keys, proof, secure=False):
+        """
+        This method checks a proof for several keys at once. Each proof node is hashed only once.
+
+        Returns
+        -------
+        dict
+            Key -> value, or None for keys that are proven absent.
+
+        Raises
+        ------
+        ValueError
+            ValueError is raised if the proof lacks a node needed to reach one of the keys.
+        """
+        nodes = {keccak_hash(encoded_node): encoded_node for encoded_node in proof}
+        results = {}
+        for encoded_key in encoded_keys:
+            path = NibblePath(keccak_hash(encoded_key) if secure else encoded_key)
+            results[encoded_key] = MerklePatriciaTrie._verify_path(root_hash, path, nodes)
+        return results
+
+    @staticmethod
+    def _verify_path(root_hash, path, nodes):
+        """ Walks a proof from the root. Returns the value at the end of the path or None. """
+        if root_hash == Node.EMPTY_HASH:
+            return None
+
+        node_ref = root_hash
+        while True:
+            if len(node_ref) == 32:
+                if node_ref not in nodes:
+                    raise ValueError(f"Proof is missing node {node_ref.hex()}.")
+                node = Node.decode(nodes[node_ref])
+            else:
+                node = Node.decode(node_ref)
+
+            if type(node) is Node.Leaf:
+                return node.data if node.path == path else None
+
+            if type(node) is Node.Extension:
+                if len(path) == 0 or not path.starts_with(node.path):
+                    return None
+                path.consume(len(node.path))
+                node_ref = node.next_ref
+            elif type(node) is Node.Branch:
+                if len(path) == 0:
+                    return node.data if len(node.data) > 0 else None
+                node_ref = node.branches[path.at(0)]
+                if _is_empty_ref(node_ref):
+                    return None
+                path.consume(1)
+
+    def node_cache_stats(self):
+        """ Returns hit/miss counters of the decoded node cache shared by this trie's backend. """
+        cache = self._node_cache
+        if cache is None:
+            return {"size": 0, "entries": 0, "hits": 0, "misses": 0, "evictions": 0}
+        return {
+            "size": cache.size,
+            "entries": len(cache.data),
+            "hits": cache.hits,
+            "misses": cache.misses,
+            "evictions": cache.evictions,
+        }
 
     def _get_node(self, node_ref):
-        raw_node = None
-        if len(node_ref) == 32:
-            raw_node = self._storage[node_ref]
-        else:
-            raw_node = node_ref
-        return Node.decode(raw_node)
+        """
+        Returns the decoded node for a reference.
+
+        Hash-referenced nodes are served from the node cache when possible. Cached nodes are shared,
+        so callers must not mutate them.
+        """
+        if not isinstance(node_ref, bytes):
+            # Dirty node in deferred mode.
+            return node_ref
+        if len(node_ref) != 32:
+            return Node.decode(node_ref)
+
+        node = self._pending_nodes.get(node_ref)
+        if node is not None:
+            return node
+
+        if self._node_cache is not None:
+            node = self._node_cache.get(node_ref)
+            if node is not None:
+                return node
+
+        node = Node.decode(self._storage[node_ref])
+        if self._node_cache is not None and node_ref not in self._storage.cache:
+            self._node_cache.put(node_ref, node)
+        return node
 
     def _get(self, node_ref, path):
         """ Get support method """
@@ -167,7 +430,7 @@ class MerklePatriciaTrie:
         elif type(node) is Node.Branch:
             # If we've found a branch node, go to the appropriate branch.
             branch = node.branches[path.at(0)]
-            if len(branch) > 0:
+            if not _is_empty_ref(branch):
                 return self._get(branch, path.consume(1))
 
         # Raise error if it's a wrong node, extension with different path or branch node without appropriate branch.
@@ -187,20 +450,19 @@ class MerklePatriciaTrie:
 
             if node.path == path:
                 # Path is the same. Just change the value.
-                node.data = value
-                return self._store_node(node)
+                return self._store_node(Node.Leaf(node.path, value))
 
             # If we are here, we have to split the node.
 
             # Find the common part of the key and leaf's path.
             common_prefix = path.common_prefix(node.path)
 
-            # Cut off the common part.
+            # Cut off the common part. Decoded nodes may be cached, so their path is copied before being consumed.
             path.consume(len(common_prefix))
-            node.path.consume(len(common_prefix))
+            node_path = node.path.copy().consume(len(common_prefix))
 
             # Create branch node to split paths.
-            branch_reference = self._create_branch_node(path, value, node.path, node.data)
+            branch_reference = self._create_branch_node(path, value, node_path, node.data)
 
             # If common part isn't empty, we have to create an extension node before branch node.
             # Otherwise, we need just branch node.
@@ -226,7 +488,7 @@ class MerklePatriciaTrie:
 
             # Cut off the common part.
             path.consume(len(common_prefix))
-            node.path.consume(len(common_prefix))
+            node_path = node.path.copy().consume(len(common_prefix))
 
             # Create an empty branch node. It may have or have not the value depending on the length
             # of the rest of the key.
@@ -236,7 +498,7 @@ class MerklePatriciaTrie:
             # If needed, create leaf branch for the value we're inserting.
             self._create_branch_leaf(path, value, branches)
             # If needed, create an extension node for the rest of the extension's path.
-            self._create_branch_extension(node.path, node.next_ref, branches)
+            self._create_branch_extension(node_path, node.next_ref, branches)
 
             branch_reference = self._store_node(Node.Branch(branches, branch_value))
 
@@ -258,9 +520,10 @@ class MerklePatriciaTrie:
             idx = path.at(0)
             new_reference = self._update(node.branches[idx], path.consume(1), value)
 
-            node.branches[idx] = new_reference
+            branches = list(node.branches)
+            branches[idx] = new_reference
 
-            return self._store_node(node)
+            return self._store_node(Node.Branch(branches, node.data))
 
     def _create_branch_node(self, path_a, value_a, path_b, value_b):
         """ Creates a branch node with up to two leaves and maybe value. Returns a reference to created node. """
@@ -303,13 +566,37 @@ class MerklePatriciaTrie:
             branches[idx] = reference
 
     def _store_node(self, node):
-        """ Builds the reference from the node and if needed saves node in the storage. """
-        reference = Node.into_reference(node)
+        """
+        Builds the reference from the node and if needed saves node in the storage.
+
+        In deferred mode the node itself is returned and is encoded only when the root is hashed.
+        """
+        if self._deferred:
+            return node
+        return self._write_node(node)
+
+    def _write_node(self, node):
+        """ Encodes the node, saves it in the storage if it's hash-referenced and returns its reference. """
+        encoded_node = node.encode()
+        reference = encoded_node if len(encoded_node) < 32 else keccak_hash(encoded_node)
         if len(reference) == 32:
             self._storage.root = reference
-            self._storage[reference] = node.encode()
+            self._storage[reference] = encoded_node
+            self._pending_nodes[reference] = node
         return reference
 
+    def _hash_ref(self, ref):
+        """ Encodes and hashes a dirty node and its dirty children. Returns the resulting reference. """
+        if ref is None or isinstance(ref, bytes):
+            return ref
+
+        node = ref
+        if type(node) is Node.Extension:
+            node = Node.Extension(node.path, self._hash_ref(node.next_ref))
+        elif type(node) is Node.Branch:
+            node = Node.Branch([self._hash_ref(branch) for branch in node.branches], node.data)
+        return self._write_node(node)
+
     # Enum that shows which action was performed on the previous step of the deletion.
     class _DeleteAction(Enum):
         # Node was deleted. Returned value should be (_DeleteAction, None).
@@ -395,6 +682,9 @@ class MerklePatriciaTrie:
             idx = None
             info = None
 
+            # Work on a copy: the decoded node may be shared through the node cache.
+            node = Node.Branch(list(node.branches), node.data)
+
             assert len(path) != 0 or len(node.data) != 0, "Empty path or empty branch node in _delete"
 
             # Decide if we need to remove value of this node or go deeper.
@@ -408,14 +698,14 @@ class MerklePatriciaTrie:
                 # Store idx of the branch we're working with.
                 idx = path.at(0)
 
-                if len(node.branches[idx]) == 0:
+                if _is_empty_ref(node.branches[idx]):
                     raise KeyError
 
                 action, info = self._delete(node.branches[idx], path.consume(1))
                 node.branches[idx] = b''
 
             if action == MerklePatriciaTrie._DeleteAction.DELETED:
-                non_empty_count = sum(map(lambda x: 1 if len(x) > 0 else 0, node.branches))
+                non_empty_count = sum(map(lambda x: 0 if _is_empty_ref(x) else 1, node.branches))
 
                 if non_empty_count == 0 and len(node.data) == 0:
                     # Branch node is empty, just delete it.
@@ -453,7 +743,7 @@ class MerklePatriciaTrie:
         # Find the index of the only stored branch.
         idx = 0
         for i in range(len(branches)):
-            if len(branches[i]) > 0:
+            if not _is_empty_ref(branches[i]):
                 idx = i
                 break
 
@@ -482,10 +772,161 @@ class MerklePatriciaTrie:
 
         return MerklePatriciaTrie._DeleteAction.USELESS_BRANCH, (path, reference)
 
+    @classmethod
+    def from_sorted_items(cls, items, **kwargs):
+        """
+        Builds a trie from key-value pairs sorted by key in a single streaming pass.
+
+        Instead of going through `update` for every item, only the nodes of the final trie are built,
+        each one being encoded and stored exactly once. Only the current path (at most one open branch
+        per nibble of the key) is kept in memory. The resulting root hash is the same as with incremental
+        insertion.
+
+        Note: keys are used as is, even if `secure` is given, since hashing them would break the order.
+
+        Parameters
+        ----------
+        items: iterable of (bytes, bytes)
+            Key-value pairs, sorted by key. Keys must be unique.
+        kwargs:
+            Arguments passed to the `MerklePatriciaTrie` constructor.
+
+        Returns
+        -------
+        MerklePatriciaTrie
+            The built trie.
+
+        Raises
+        ------
+        ValueError
+            ValueError is raised if the keys aren't strictly increasing.
+        """
+        kwargs.pop("root", None)
+        trie = cls(**kwargs)
+        # Each frame is an open branch node: [depth, branches, value].
+        stack = []
+        prev_key, prev_value, prev_depth = None, None, None
+
+        def attach(frame, key, depth):
+            """ Closes the branch `frame` and links it into the parent branch opened at `depth`. """
+            frame_depth, branches, value = frame
+            reference = trie._write_node(Node.Branch(branches, value))
+            if frame_depth > depth + 1:
+                path = NibblePath.from_nibbles(key[depth + 1:frame_depth])
+                reference = trie._write_node(Node.Extension(path, reference))
+            stack[-1][1][key[depth]] = reference
+
+        def place(key, value, depth):
+            """ Puts the leaf of `key` into the branch opened at `depth`. """
+            if not stack or stack[-1][0] != depth:
+                stack.append([depth, [b''] * 16, b''])
+            if len(key) == depth:
+                stack[-1][2] = value
+            else:
+                path = NibblePath.from_nibbles(key[depth + 1:])
+                stack[-1][1][key[depth]] = trie._write_node(Node.Leaf(path, value))
+
+        for encoded_key, encoded_value in items:
+            key = to_nibbles(encoded_key)
+            if prev_key is None:
+                prev_key, prev_value = key, encoded_value
+                continue
+            if key <= prev_key:
+                raise ValueError("Keys must be sorted and unique.")
+
+            common = common_prefix_length(prev_key, key)
+            place(prev_key, prev_value, common if prev_depth is None else max(prev_depth, common))
+
+            # Branches deeper than the common prefix won't receive any other key.
+            while stack[-1][0] > common:
+                frame = stack.pop()
+                if not stack or stack[-1][0] < common:
+                    stack.append([common, [b''] * 16, b''])
+                attach(frame, prev_key, stack[-1][0])
+
+            prev_key, prev_value, prev_depth = key, encoded_value, common
+
+        if prev_key is None:
+            return trie
+
+        if prev_depth is None:
+            # Single item: the root is a leaf.
+            trie._root = trie._write_node(Node.Leaf(NibblePath.from_nibbles(prev_key), prev_value))
+            return trie
+
+        place(prev_key, prev_value, prev_depth)
+        while len(stack) > 1:
+            frame = stack.pop()
+            attach(frame, prev_key, stack[-1][0])
+
+        depth, branches, value = stack.pop()
+        root = trie._write_node(Node.Branch(branches, value))
+        if depth > 0:
+            root = trie._write_node(Node.Extension(NibblePath.from_nibbles(prev_key[:depth]), root))
+        trie._root = root
+        return trie
+
     def commit(self):
         """ Commits changes to the storage. """
-        self._storage.commit()
+        if self._storage.on_dump:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes all the pending nodes reachable from the current root in a single backend write.
+
+        Nodes that were created and then overwritten since the last flush aren't reachable anymore,
+        so they are dropped instead of being written.
+        """
+        self.root()
+        pending = self._storage.cache
+        dirty = {node_ref: pending[node_ref] for node_ref in self._reachable_pending(self._root)}
+
+        if self._root and len(self._root) < 32:
+            # In-place root: store it under its hash so the trie can be reopened from `root_hash()`.
+            dirty[self.root_hash()] = self._root
+
+        self._storage.backend.batch(puts=dirty.items())
+        if self._node_cache is not None:
+            # Cached as read back from the backend: leaf values come out RLP-decoded, not as written.
+            for node_ref in dirty:
+                if node_ref in self._pending_nodes:
+                    self._node_cache.put(node_ref, Node.decode(dirty[node_ref]))
+        pending.clear()
+        self._pending_nodes.clear()
+
+    def _reachable_pending(self, root):
+        """ Returns the references of the pending nodes reachable from `root`, which may be dirty. """
+        pending = self._storage.cache
+        reachable = set()
+        stack = [root] if root else []
+        while stack:
+            node_ref = stack.pop()
+            if isinstance(node_ref, bytes) and len(node_ref) == 32:
+                if node_ref in reachable or node_ref not in pending:
+                    # Already visited, or persisted with its whole subtree.
+                    continue
+                reachable.add(node_ref)
+
+            node = self._get_node(node_ref)
+            if type(node) is Node.Extension:
+                stack.append(node.next_ref)
+            elif type(node) is Node.Branch:
+                stack.extend(branch for branch in node.branches if branch)
+        return reachable
+
+    def checkpoint(self):
+        """ Returns the current root without hashing it, to be passed later to `reset`. """
+        return self._root
+
+    def reset(self, root):
+        """ Moves the trie back to a previous root and drops the pending nodes it can't reach anymore. """
+        self._root = root
+        reachable = self._reachable_pending(root)
+        for node_ref in [node_ref for node_ref in self._storage.cache if node_ref not in reachable]:
+            del self._storage.cache[node_ref]
+            self._pending_nodes.pop(node_ref, None)
 
     def close(self):
-        """ Closes the storage. """
-        self._storage.close()
\ No newline at end of file
+        """ Closes the storage. The backend itself is shared and stays open. """
+        self.commit()
\ No newline at end of file
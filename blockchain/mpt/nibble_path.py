@@ -1,28 +1,79 @@
+_HEX_DIGITS = b'0123456789abcdef'
+_FROM_HEX = bytes.maketrans(_HEX_DIGITS, bytes(range(16)))
+_TO_HEX = bytes.maketrans(bytes(range(16)), _HEX_DIGITS)
+
+
+def to_nibbles(data):
+    """Unpacks bytes into one nibble per byte."""
+    return bytes(data).hex().encode('ascii').translate(_FROM_HEX)
+
+
+def pack_nibbles(nibbles):
+    """Packs an even number of nibbles (one per byte) back into bytes."""
+    return bytes.fromhex(bytes(nibbles).translate(_TO_HEX).decode('ascii'))
+
+
+def common_prefix_length(a, b):
+    """Returns the length of the common prefix of two nibble strings."""
+    length = min(len(a), len(b))
+    a, b = a[:length], b[:length]
+    if a == b:
+        return length
+    diff = int.from_bytes(a, 'big') ^ int.from_bytes(b, 'big')
+    return length - 1 - (diff.bit_length() - 1) // 8
+
+
 class NibblePath:
+    """
+    Path in the trie, stored as one nibble per byte.
+
+    Nibbles are unpacked once when the path is created. Consuming or slicing a path only moves
+    offsets over the shared buffer, and comparisons are done on whole byte strings.
+    """
+    __slots__ = ('_nibbles', '_offset', '_end')
+
     ODD_FLAG = 0x10
     LEAF_FLAG = 0x20
 
     def __init__(self, data, offset=0):
-        self._data = data
+        self._nibbles = to_nibbles(data)
         self._offset = offset
+        self._end = len(self._nibbles)
+
+    @classmethod
+    def _from_buffer(cls, nibbles, offset, end):
+        path = cls.__new__(cls)
+        path._nibbles = nibbles
+        path._offset = offset
+        path._end = end
+        return path
+
+    @classmethod
+    def from_nibbles(cls, nibbles):
+        """Creates a NibblePath from a sequence of nibbles."""
+        nibbles = bytes(nibbles)
+        return cls._from_buffer(nibbles, 0, len(nibbles))
+
+    def nibbles(self):
+        """Returns the nibbles of the path, one per byte."""
+        if self._offset == 0 and self._end == len(self._nibbles):
+            return self._nibbles
+        return self._nibbles[self._offset:self._end]
 
     def __len__(self):
-        return len(self._data) * 2 - self._offset
+        return self._end - self._offset
 
     def __repr__(self):
-        return f'<NibblePath: Data: 0x{self._data.hex()}, Offset: {self._offset}>'
+        return f'<NibblePath: Nibbles: 0x{self.nibbles().translate(_TO_HEX).decode("ascii")}>'
 
     def __str__(self):
-        return f'<Hex 0x{self._data.hex()} | Raw {self._data}>'
+        return f'<Hex 0x{self.nibbles().translate(_TO_HEX).decode("ascii")}>'
 
     def __eq__(self, other):
         if not isinstance(other, NibblePath):
             return NotImplemented
 
-        if len(self) != len(other):
-            return False
-
-        return all(self.at(i) == other.at(i) for i in range(len(self)))
+        return self.nibbles() == other.nibbles()
 
     def __getitem__(self, idx):
         return self.at(idx)
@@ -52,49 +103,26 @@ class NibblePath:
         if len(other) > len(self):
             return False
 
-        return all(self.at(i) == other.at(i) for i in range(len(other)))
+        return self._nibbles.startswith(other.nibbles(), self._offset)
 
     def at(self, idx):
         """Returns nibble at the certain position."""
-        idx = idx + self._offset
+        return self._nibbles[self._offset + idx]
 
-        byte_idx = idx // 2
-        nibble_idx = idx % 2
-
-        byte = self._data[byte_idx]
-        return byte >> 4 if nibble_idx == 0 else byte & 0x0F
+    def copy(self):
+        """Returns an independent path, so consuming it doesn't affect `self`."""
+        return NibblePath._from_buffer(self._nibbles, self._offset, self._end)
 
     def consume(self, amount):
         """Cuts off nibbles at the beginning of the path."""
         self._offset += amount
         return self
 
-    @classmethod
-    def _create_new(cls, path, length):
-        """Creates a new NibblePath from a given object with a certain length."""
-        is_odd_len = length % 2 == 1
-        pos, data = 0, []
-
-        if is_odd_len:
-            data.append(path.at(pos))
-            pos += 1
-
-        while pos < length:
-            data.append(path.at(pos) * 16 + path.at(pos + 1))
-            pos += 2
-
-        offset = 1 if is_odd_len else 0
-
-        return cls(data, offset)
-
     def common_prefix(self, other):
         """Returns common part at the beginning of both paths."""
-        least_len = min(len(self), len(other))
-        common_len = next(
-            (i for i in range(least_len) if self.at(i) != other.at(i)), least_len
-        )
+        common_len = common_prefix_length(self.nibbles(), other.nibbles())
 
-        return NibblePath._create_new(self, common_len)
+        return NibblePath._from_buffer(self._nibbles, self._offset, self._offset + common_len)
 
     def encode(self, is_leaf):
         """Encode NibblePath into bytes.
@@ -102,41 +130,14 @@ class NibblePath:
         Encoded path contains prefix with flags of type and length and also may contain
         a padding nibble so the length of encoded path is always even.
         """
-        nibbles_len = len(self)
-        is_odd = nibbles_len % 2 == 1
-
-        prefix = (
-            0x00
-            + (self.ODD_FLAG + self.at(0) if is_odd else 0x00)
-            + (self.LEAF_FLAG if is_leaf else 0x00)
-        )
-        output = [prefix]
-
-        pos = nibbles_len % 2
-        while pos < nibbles_len:
-            byte = self.at(pos) * 16 + self.at(pos + 1)
-            output.append(byte)
-            pos += 2
-
-        return bytes(output)
-
-    class _Chained:
-        """Class that chains two paths."""
-
-        def __init__(self, first, second):
-            self.first = first
-            self.second = second
+        nibbles = self.nibbles()
+        is_odd = len(nibbles) % 2 == 1
 
-        def __len__(self):
-            return len(self.first) + len(self.second)
+        flags = (self.ODD_FLAG if is_odd else 0x00) + (self.LEAF_FLAG if is_leaf else 0x00)
+        prefix = bytes([flags >> 4]) if is_odd else bytes([flags >> 4, 0])
 
-        def at(self, idx):
-            if idx < len(self.first):
-                return self.first.at(idx)
-            else:
-                return self.second.at(idx - len(self.first))
+        return pack_nibbles(prefix + nibbles)
 
     def combine(self, other):
         """Merges two paths into one."""
-        chained = NibblePath._Chained(self, other)
-        return NibblePath._create_new(chained, len(chained))
\ No newline at end of file
+        return NibblePath.from_nibbles(self.nibbles() + other.nibbles())
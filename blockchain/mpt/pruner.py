@@ -0,0 +1,157 @@
+import queue
+import threading
+from collections import OrderedDict
+
+from kademlia.slogging import get_logger
+
+from .mpt import evict_nodes
+from .node import Node
+
+log = get_logger('mpt.pruner')
+
+
+def _children(node):
+    """ Returns the references stored in a node. """
+    if type(node) is Node.Extension:
+        return [node.next_ref]
+    if type(node) is Node.Branch:
+        return [branch for branch in node.branches if len(branch) > 0]
+    return []
+
+
+class Pruner:
+    def __init__(self, backend, retain=128):
+        """
+        Élagage des nœuds de trie qui ne sont plus atteignables depuis les racines conservées.
+
+        Chaque nœud compte ses références : une par racine conservée qui pointe directement
+        dessus et une par nœud parent compté. Conserver une racine ne parcourt que les nœuds
+        qui n'étaient pas encore comptés. Quand un bloc sort de la fenêtre des `retain`
+        derniers blocs, ses racines sont relâchées par un thread en arrière-plan, qui supprime
+        les nœuds dont le compteur tombe à zéro.
+
+        Les compteurs sont en mémoire : après un redémarrage, les nœuds déjà présents ne sont
+        jamais supprimés. `lock` est le verrou d'écriture du backend, tenu par chaque écriture :
+        un écrivain qui réécrit des nœuds le garde jusqu'à avoir conservé ses nouvelles racines,
+        sinon un nœud réécrit pourrait être supprimé avant d'être compté. Les nœuds supprimés
+        sont retirés du cache de nœuds décodés partagé par les tries du backend.
+
+        Parameters:
+        ----------
+        backend : Backend
+            Backend contenant les nœuds.
+        retain : int
+            Nombre de blocs dont les racines sont conservées.
+        """
+        self.backend = backend
+        self.retain_blocks = retain
+        self.lock = backend.write_lock
+        self.deleted_nodes = 0
+        self.reclaimed_bytes = 0
+        self._refs = {}
+        self._roots = OrderedDict()
+        self._jobs = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="trie-pruner", daemon=True)
+        self._worker.start()
+
+    def retain(self, number, roots):
+        """
+        Conserve les racines des states d'un bloc et relâche celles des blocs trop anciens.
+
+        Les racines ajoutées plusieurs fois pour un même bloc sont toutes relâchées avec lui.
+
+        Parameters:
+        ----------
+        number : int
+            Numéro du bloc.
+        roots : iterable of bytes
+            Racines (hash) des tries à conserver pour ce bloc.
+        """
+        roots = [root for root in roots if root]
+        with self.lock:
+            for root in roots:
+                self._increment(root)
+            self._roots.setdefault(number, []).extend(roots)
+
+            for old in [n for n in self._roots if n <= number - self.retain_blocks]:
+                self._jobs.put(self._roots.pop(old))
+
+    def wait(self):
+        """Attend la fin des suppressions en cours."""
+        self._jobs.join()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "retained_blocks": len(self._roots),
+                "tracked_nodes": len(self._refs),
+                "deleted_nodes": self.deleted_nodes,
+                "reclaimed_bytes": self.reclaimed_bytes,
+                "pending_releases": self._jobs.qsize(),
+            }
+
+    def close(self):
+        self._jobs.put(None)
+        self._worker.join()
+
+    def _read(self, node_ref):
+        if len(node_ref) < 32:
+            return node_ref
+        try:
+            return self.backend.get(node_ref)
+        except KeyError:
+            return None
+
+    def _increment(self, root):
+        stack = [root]
+        while stack:
+            node_ref = stack.pop()
+            if len(node_ref) == 32:
+                count = self._refs.get(node_ref, 0)
+                self._refs[node_ref] = count + 1
+                if count > 0:
+                    # The subtree is already counted.
+                    continue
+
+            raw_node = self._read(node_ref)
+            if raw_node is not None:
+                stack.extend(_children(Node.decode(raw_node)))
+
+    def _release(self, roots):
+        with self.lock:
+            deletes = []
+            stack = list(roots)
+            while stack:
+                node_ref = stack.pop()
+                if len(node_ref) == 32:
+                    count = self._refs.get(node_ref)
+                    if count is None:
+                        continue
+                    if count > 1:
+                        self._refs[node_ref] = count - 1
+                        continue
+                    del self._refs[node_ref]
+
+                raw_node = self._read(node_ref)
+                if raw_node is None:
+                    continue
+                if len(node_ref) == 32:
+                    deletes.append(node_ref)
+                    self.reclaimed_bytes += len(node_ref) + len(raw_node)
+                stack.extend(_children(Node.decode(raw_node)))
+
+            self.backend.batch(deletes=deletes)
+            evict_nodes(self.backend, deletes)
+            self.deleted_nodes += len(deletes)
+
+    def _run(self):
+        while True:
+            roots = self._jobs.get()
+            try:
+                if roots is None:
+                    return
+                self._release(roots)
+            except Exception as e:
+                log.error(f"Erreur lors de l'élagage du trie: {e}")
+            finally:
+                self._jobs.task_done()
@@ -0,0 +1,152 @@
+import threading
+from collections import OrderedDict
+
+import rlp
+
+
+class SnapshotMiss(Exception):
+    """Le snapshot ne connaît pas la racine demandée : la lecture doit passer par le trie."""
+
+
+class Snapshot:
+    PREFIX = b'snapshot:'
+
+    def __init__(self, backend, name, max_layers=128):
+        """
+        Vue plate clé hashée -> valeur d'un trie, tenue à jour à chaque bloc.
+
+        Le snapshot est composé d'une couche disque, stockée dans le backend du trie sous un
+        préfixe propre, et de couches de différences en mémoire, une par racine récente.
+        Les valeurs y sont gardées encodées en RLP, comme dans les feuilles du trie, et les
+        lectures les décodent : elles rendent la même valeur qu'une lecture du trie.
+        Une lecture parcourt les couches de la plus récente vers le disque, sans traverser
+        le trie. Au-delà de `max_layers` couches, la plus ancienne est fusionnée dans la
+        couche disque en une seule écriture.
+
+        Parameters:
+        ----------
+        backend : Backend
+            Backend où est stockée la couche disque.
+        name : str
+            Nom du state, utilisé comme préfixe des clés.
+        max_layers : int
+            Nombre maximal de couches de différences gardées en mémoire.
+        """
+        self.backend = backend
+        self.max_layers = max_layers
+        self._prefix = self.PREFIX + name.encode() + b':'
+        self._lock = threading.RLock()
+        # Racine -> (racine parente, {clé hashée: valeur}), de la plus ancienne à la plus récente.
+        self._layers = OrderedDict()
+        self.disk_root = self._get_marker(b'root')
+        self.generated = self._get_marker(b'generated') == b'1'
+
+    def _get_marker(self, name):
+        try:
+            return self.backend.get(self._prefix + name)
+        except KeyError:
+            return None
+
+    def knows(self, root):
+        """Indique si le snapshot peut répondre aux lectures pour cette racine."""
+        with self._lock:
+            return root in self._layers or (self.generated and root == self.disk_root)
+
+    def get(self, root, hashed_key):
+        """
+        Lit une valeur telle qu'elle est à la racine `root`.
+
+        Returns:
+        -------
+        bytes
+            Valeur associée à la clé.
+
+        Raises:
+        ------
+        KeyError
+            Si la clé n'existe pas à cette racine.
+        SnapshotMiss
+            Si le snapshot ne connaît pas cette racine.
+        """
+        with self._lock:
+            while root in self._layers:
+                parent, changes = self._layers[root]
+                if hashed_key in changes:
+                    return rlp.decode(changes[hashed_key])
+                root = parent
+            if not self.generated or root != self.disk_root:
+                raise SnapshotMiss(root)
+        return rlp.decode(self.backend.get(self._prefix + hashed_key))
+
+    def update(self, root, parent_root, changes):
+        """
+        Ajoute la couche de différences d'un bloc.
+
+        Parameters:
+        ----------
+        root : bytes
+            Racine du trie après le bloc.
+        parent_root : bytes
+            Racine du trie avant le bloc.
+        changes : dict
+            Clés hashées -> nouvelles valeurs écrites par le bloc, encodées en RLP.
+        """
+        with self._lock:
+            self._layers[root] = (parent_root, dict(changes))
+            self._layers.move_to_end(root)
+            while len(self._layers) > self.max_layers:
+                self._flatten_oldest(root)
+
+    def flatten(self):
+        """Fusionne toutes les couches menant à la racine la plus récente dans la couche disque."""
+        with self._lock:
+            if self._layers:
+                head = next(reversed(self._layers))
+                while self._layers:
+                    self._flatten_oldest(head)
+
+    def _flatten_oldest(self, head):
+        """Fusionne dans le disque la couche la plus basse de la chaîne qui mène à `head`."""
+        chain = []
+        root = head
+        while root in self._layers:
+            chain.append(root)
+            root = self._layers[root][0]
+
+        bottom = chain[-1] if chain else None
+        if bottom is None or root != self.disk_root or not self.generated:
+            # The chain isn't connected to the disk layer: it can't be merged, only dropped.
+            self._layers.clear()
+            return
+
+        _, changes = self._layers.pop(bottom)
+        puts = [(self._prefix + key, value) for key, value in changes.items()]
+        puts.append((self._prefix + b'root', bottom))
+        self.backend.batch(puts=puts)
+        self.disk_root = bottom
+
+        # Layers of abandoned forks can't be reached anymore.
+        for root in [r for r in self._layers if r not in chain]:
+            del self._layers[root]
+
+    def generate(self, storage):
+        """
+        Reconstruit la couche disque à partir de tout le contenu du trie d'un stockage.
+
+        Parameters:
+        ----------
+        storage : Storage
+            Stockage dont le snapshot reflète le trie.
+        """
+        with self._lock:
+            puts = {self._prefix + key: rlp.encode(value) for key, value in storage.trie.items()}
+            puts[self._prefix + b'generated'] = b'1'
+            root = storage.current_root
+            if root is not None:
+                puts[self._prefix + b'root'] = root
+            # Seules les clés du préfixe du snapshot sont parcourues, pas les nœuds du trie
+            stale = [key for key, _ in self.backend.iterate_prefix(self._prefix) if key not in puts]
+            self.backend.batch(puts=puts.items(), deletes=stale)
+            self._layers.clear()
+            self.disk_root = root
+            self.generated = True
@@ -1,3 +1,5 @@
+import copy
+
 import rlp
 from .storage import Storage
 from .handler import Service
@@ -5,8 +7,8 @@ from .handler import Service
 
 class State:
 
-    def __init__(self, name, storage_root=None):
-        self.storage = Storage(storage_root)
+    def __init__(self, name, storage_root=None, snapshot=None, backend="sqlite"):
+        self.storage = Storage(storage_root, backend=backend, snapshot=snapshot)
         self.name = f"{self.__class__.__name__}_{name}"
 
     def get(self, key):
@@ -15,6 +17,30 @@ class State:
     def update(self, key, value):
         self.storage[key] = value
 
+    def batch(self):
+        """Context manager groupant les écritures du state en une seule écriture atomique."""
+        return self.storage.batch()
+
+    def commit(self):
+        self.storage.commit()
+
+    def commit_snapshot(self):
+        """Publie les écritures du bloc dans le snapshot du state, s'il en a un."""
+        self.storage.commit_snapshot()
+
+    def get_proof(self, *keys):
+        """Preuve de Merkle des valeurs associées aux clés, vérifiable avec `State.verify_proof`."""
+        return self.storage.get_multi_proof(keys)
+
+    @staticmethod
+    def verify_proof(state_root, keys, proof):
+        """
+        Vérifie une preuve de `get_proof`, dans l'ordre d'arguments de `Storage.verify_proof`.
+
+        Retourne un dict clé -> valeur prouvée (None si absente). Lève ValueError si la preuve est incomplète.
+        """
+        return Storage.verify_multi_proof(state_root, keys, proof)
+
     def current_state_root(self):
         return self.storage.current_root
 
@@ -23,10 +49,111 @@ class State:
         copy_obj.storage = self.storage.copy()
         return copy_obj
 
+    def overlay(self):
+        """Vue en copie sur écriture du state, voir `StateOverlay`."""
+        return StateOverlay(self)
+
     def __repr__(self):
         return f"<{self.__class__.__name__} root={self.current_state_root()}>"
 
 
+class StateOverlay:
+    _MISSING = object()
+
+    def __init__(self, parent):
+        """
+        Écritures en mémoire au-dessus d'un state, sans toucher à son trie.
+
+        Les lectures cherchent d'abord dans les écritures de l'overlay puis dans le parent.
+        Chaque écriture est journalisée avec l'ancienne valeur, ce qui permet de revenir à
+        un point de contrôle. Créer un overlay ne coûte rien : rien n'est copié ni rouvert.
+
+        Parameters:
+        ----------
+        parent : State or StateOverlay
+            State sous-jacent, ou overlay parent pour des overlays imbriqués.
+        """
+        self.parent = parent
+        self._writes = {}
+        # (clé, valeur précédente dans l'overlay ou _MISSING), dans l'ordre des écritures
+        self._journal = []
+
+    def get(self, key):
+        value = self._writes.get(key, self._MISSING)
+        if value is self._MISSING:
+            return self.parent.get(key)
+        return value
+
+    def update(self, key, value):
+        self._journal.append((key, self._writes.get(key, self._MISSING)))
+        self._writes[key] = value
+
+    def overlay(self):
+        """Overlay imbriqué, dont `commit()` écrit dans cet overlay."""
+        return StateOverlay(self)
+
+    def checkpoint(self):
+        """Point de contrôle utilisable avec `revert`."""
+        return len(self._journal)
+
+    def revert(self, checkpoint=0):
+        """Annule les écritures faites depuis le point de contrôle (toutes par défaut)."""
+        while len(self._journal) > checkpoint:
+            key, previous = self._journal.pop()
+            if previous is self._MISSING:
+                del self._writes[key]
+            else:
+                self._writes[key] = previous
+
+    def commit(self):
+        """Écrit les changements dans le parent, en un seul batch si le parent est un state."""
+        if isinstance(self.parent, State):
+            with self.parent.batch():
+                self._apply()
+        else:
+            self._apply()
+        self._writes = {}
+        self._journal = []
+
+    def _apply(self):
+        for key, value in self._writes.items():
+            self.parent.update(key, value)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} writes={len(self._writes)} parent={self.parent!r}>"
+
+
+class RecordingOverlay(StateOverlay):
+
+    def __init__(self, parent):
+        """
+        Overlay qui note les clés lues dans son parent, pour l'exécution optimiste des transactions.
+
+        Les valeurs modifiables lues dans le parent sont copiées : une transaction ne peut pas
+        modifier un parent partagé avec les transactions exécutées en même temps.
+
+        Parameters:
+        ----------
+        parent : State or StateOverlay
+            State partagé, qui ne doit pas être modifié pendant l'exécution.
+        """
+        super().__init__(parent)
+        self.reads = set()
+
+    def get(self, key):
+        value = self._writes.get(key, self._MISSING)
+        if value is not self._MISSING:
+            return value
+        # Une clé absente du parent est aussi une lecture : une écriture concurrente changerait le résultat
+        self.reads.add(key)
+        return copy.deepcopy(self.parent.get(key))
+
+    @property
+    def writes(self):
+        """Clés écrites par l'overlay."""
+        return set(self._writes)
+
+
 if __name__ == "__main__":
     global_state = State("global")
     contract_state = State("contract")
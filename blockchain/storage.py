@@ -1,11 +1,14 @@
+from contextlib import contextmanager
+
 import rlp
 
 from .mpt.hash import keccak_hash
 from .mpt.mpt import MerklePatriciaTrie
+from .snapshot import SnapshotMiss
 
 
 class Storage:
-    def __init__(self, storage_root=None, in_memory=False, db_path="DB/"):
+    def __init__(self, storage_root=None, in_memory=False, db_path="DB/", backend=None, snapshot=None):
         """
         Initialise le stockage avec une instance de MerklePatriciaTrie.
 
@@ -16,27 +19,87 @@ class Storage:
         in_memory : bool, optional
             Si True, utilise uniquement le stockage en mémoire.
         db_path : str, optional
-            Chemin vers la base de données LevelDB.
+            Chemin vers le répertoire de la base de données.
+        backend : str or Backend, optional
+            Backend clé-valeur ("sqlite", "lmdb", "memory") ou instance déjà ouverte.
+            Par défaut "memory" si `in_memory` est vrai, "sqlite" sinon.
+        snapshot : Snapshot, optional
+            Vue plate du trie utilisée pour les lectures, mise à jour par `commit_snapshot`.
         """
-        self.current_root = storage_root
         self._in_memory = in_memory
         self.db_path = db_path
         self.trie = MerklePatriciaTrie(
             db_path=self.db_path,
             in_memory=self._in_memory,
-            root=self.current_root
+            root=storage_root,
+            backend=backend,
+            deferred=True
         )
+        self.backend = self.trie.backend
+        self._batch_depth = 0
+        self.snapshot = snapshot
+        # Racine de la dernière couche publiée dans le snapshot et écritures faites depuis.
+        self._snapshot_root = storage_root
+        self._snapshot_changes = {}
+
+    @classmethod
+    def from_items(cls, items, in_memory=False, db_path="DB/", backend=None):
+        """
+        Construit un stockage à partir de paires clé-valeur en une seule passe.
+
+        Les clés hashées sont triées puis le trie est construit directement par
+        MerklePatriciaTrie.from_sorted_items, sans passer par une insertion par clé.
+        La racine obtenue est la même qu'avec des insertions successives : une clé
+        répétée garde sa dernière valeur.
+
+        Parameters:
+        ----------
+        items : iterable de (bytes, bytes)
+            Paires clé-valeur.
+        in_memory, db_path, backend :
+            Voir `Storage.__init__`.
+
+        Returns:
+        -------
+        Storage
+            Le stockage construit.
+        """
+        storage = cls(in_memory=in_memory, db_path=db_path, backend=backend)
+        # Le dictionnaire ne garde que la dernière valeur d'une clé répétée
+        hashed_items = sorted({keccak_hash(key): value for key, value in items}.items())
+        storage.trie = MerklePatriciaTrie.from_sorted_items(
+            hashed_items,
+            db_path=db_path,
+            in_memory=in_memory,
+            backend=storage.backend,
+            deferred=True
+        )
+        return storage
+
+    @property
+    def current_root(self):
+        """
+        Racine actuelle du trie, ou None si le trie est vide.
+
+        Les nœuds modifiés ne sont encodés et hashés qu'au moment où la racine est demandée.
+        """
+        if self.trie.checkpoint() is None:
+            return None
+        return self.trie.root_hash()
 
     def set_root(self, root, save_previous=False):
         """Définit la racine actuelle du trie."""
-        self.current_root = root
         if save_previous:
             self.trie.commit()
         self.trie = MerklePatriciaTrie(
             db_path=self.db_path,
             in_memory=self._in_memory,
-            root=self.current_root
+            root=root,
+            backend=self.backend,
+            deferred=True
         )
+        self._snapshot_root = root
+        self._snapshot_changes = {}
 
     def save(self, data={}):
         """
@@ -48,7 +111,6 @@ class Storage:
             Paires clé-valeur à sauvegarder.
         """
         self._in_memory = False
-        self.current_root = None
         for k, v in data.items():
             self[k] = v
         self.trie.commit()
@@ -67,7 +129,15 @@ class Storage:
         bytes or None
             Valeur associée à la clé ou None si inexistante.
         """
-        return self.trie.get(keccak_hash(key))
+        hashed_key = keccak_hash(key)
+        if self.snapshot is not None:
+            if hashed_key in self._snapshot_changes:
+                return rlp.decode(self._snapshot_changes[hashed_key])
+            try:
+                return self.snapshot.get(self._snapshot_root, hashed_key)
+            except SnapshotMiss:
+                pass
+        return self.trie.get(hashed_key)
 
     def __setitem__(self, key, value):
         """
@@ -80,8 +150,78 @@ class Storage:
         value : bytes
             Valeur.
         """
-        self.trie.update(keccak_hash(key), value)
-        self.current_root = self.trie.root_hash()
+        hashed_key = keccak_hash(key)
+        self.trie.update(hashed_key, value)
+        if self.snapshot is not None:
+            # Encodée comme dans la feuille du trie : le snapshot rend ce que rendrait le trie relu
+            self._snapshot_changes[hashed_key] = rlp.encode(value)
+
+    def commit_snapshot(self):
+        """
+        Publie les écritures faites depuis le dernier appel comme une nouvelle couche du snapshot.
+
+        À appeler une fois par bloc, quand le state du bloc est définitif.
+        """
+        if self.snapshot is None:
+            return
+        root = self.current_root
+        if root != self._snapshot_root:
+            self.snapshot.update(root, self._snapshot_root, self._snapshot_changes)
+        self._snapshot_root = root
+        self._snapshot_changes = {}
+
+    def get_proof(self, key):
+        """
+        Retourne une preuve de Merkle pour une clé (voir MerklePatriciaTrie.get_proof).
+
+        Parameters:
+        ----------
+        key : bytes
+            Clé.
+
+        Returns:
+        -------
+        list of bytes
+            Nœuds encodés de la preuve.
+        """
+        return self.trie.get_proof(keccak_hash(key))
+
+    def get_multi_proof(self, keys):
+        """Retourne une preuve unique pour plusieurs clés, les nœuds communs n'y figurant qu'une fois."""
+        return self.trie.get_multi_proof([keccak_hash(key) for key in keys])
+
+    @staticmethod
+    def verify_proof(root, key, proof):
+        """
+        Vérifie une preuve de Merkle par rapport à une racine.
+
+        Parameters:
+        ----------
+        root : bytes
+            Racine du stockage.
+        key : bytes
+            Clé.
+        proof : list of bytes
+            Preuve retournée par `get_proof` ou `get_multi_proof`.
+
+        Returns:
+        -------
+        bytes or None
+            Valeur prouvée, ou None si la preuve montre que la clé est absente.
+
+        Raises:
+        ------
+        ValueError
+            Si la preuve est incomplète.
+        """
+        return MerklePatriciaTrie.verify_proof(root, keccak_hash(key), proof)
+
+    @staticmethod
+    def verify_multi_proof(root, keys, proof):
+        """Vérifie une preuve pour plusieurs clés. Retourne un dict clé -> valeur (ou None)."""
+        hashed_keys = {keccak_hash(key): key for key in keys}
+        results = MerklePatriciaTrie.verify_multi_proof(root, list(hashed_keys), proof)
+        return {hashed_keys[hashed_key]: value for hashed_key, value in results.items()}
 
     def copy(self):
         """
@@ -95,13 +235,47 @@ class Storage:
         new_storage = Storage(
             storage_root=self.current_root,
             in_memory=self._in_memory,
-            db_path=self.db_path
+            db_path=self.db_path,
+            backend=self.backend,
+            snapshot=self.snapshot
         )
+        new_storage._snapshot_root = self._snapshot_root
+        new_storage._snapshot_changes = dict(self._snapshot_changes)
         return new_storage
 
+    @contextmanager
+    def batch(self):
+        """
+        Regroupe les écritures jusqu'à la sortie du bloc `with`.
+
+        Les nœuds créés dans le bloc restent en mémoire puis seuls ceux encore
+        atteignables depuis la racine finale sont écrits, en une seule écriture
+        atomique du backend. Si une exception est levée, la racine revient à son
+        état d'entrée. Les appels peuvent être imbriqués : seul le plus externe écrit.
+
+        Yields:
+        ------
+        Storage
+            Le stockage lui-même.
+        """
+        root = self.trie.checkpoint()
+        snapshot_changes = dict(self._snapshot_changes)
+        self._batch_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self.trie.reset(root)
+            self._snapshot_changes = snapshot_changes
+            raise
+        finally:
+            self._batch_depth -= 1
+        if self._batch_depth == 0:
+            self.trie.commit()
+
     def commit(self):
         """Commit les changements dans le trie."""
-        self.trie.commit()
+        if self._batch_depth == 0:
+            self.trie.commit()
 
     def close(self):
         """Ferme proprement le trie."""
@@ -1,10 +1,23 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import rlp
-from kademlia.crypto import recover, sign, sha3
-from kademlia.utils import exclude, decode_hex, check_values, check_nonce, check_balance, check_signature, check_gas
+from coincurve import PrivateKey
+from repoze.lru import LRUCache
+from kademlia.crypto import recover, sha3
+from kademlia.utils import decode_hex, check_values, check_nonce, check_balance, check_signature, check_gas
+
+# Expéditeurs déjà retrouvés, par hash de transaction : chaque signature n'est vérifiée qu'une fois
+SENDER_CACHE_SIZE = 16384
+_senders = LRUCache(SENDER_CACHE_SIZE)
+# À partir de ce nombre de signatures à vérifier, recover_senders les répartit entre des processus
+PROCESS_BATCH = 256
 
 
 class Transaction(rlp.Serializable):
     fields = [
+        ("nonce", rlp.sedes.big_endian_int),
         ("gas_price", rlp.sedes.big_endian_int),
         ("gas", rlp.sedes.big_endian_int),
         ("to", rlp.sedes.binary),
@@ -15,10 +28,10 @@ class Transaction(rlp.Serializable):
         ("s", rlp.sedes.big_endian_int),
     ]
 
-    def __init__(self, gas_price, gas, to, value, data, v=0, r=0, s=0):
+    def __init__(self, nonce, gas_price, gas, to, value, data, v=0, r=0, s=0):
         data = rlp.decode(data) if isinstance(data, bytes) else data
         super(Transaction, self).__init__(
-            gas_price, gas, to, value, data, v, r, s
+            nonce, gas_price, gas, to, value, data, v, r, s
         )
 
     @property
@@ -27,23 +40,34 @@ class Transaction(rlp.Serializable):
 
     @property
     def sign_hash(self) -> bytes:
-        return sha3(rlp.encode(exclude(self, ["v", "r", "s"])))
+        # Hash des champs sans la signature (v, r, s)
+        values = [getattr(self, name) for name in self._meta.field_names[:-3]]
+        return sha3(rlp.encode(values, rlp.sedes.List(self._meta.sedes[:-3])))
 
     @property
     def sender(self) -> bytes:
-        return recover(self.hash, self.s)
+        hash = self.hash
+        sender = _senders.get(hash)
+        if sender is None:
+            sender = recover_sender(self.sign_hash, self.v, self.r, self.s)
+            _senders.put(hash, sender)
+        return sender
 
     def sign(self, key):
-        self.__dict__["_v"], self.__dict__["_r"], self.__dict__["_s"] = sign(self.sign_hash, key)
+        signature = PrivateKey(key).sign_recoverable(self.sign_hash, hasher=None)
+        self.__dict__["_v"] = signature[64] + 27
+        self.__dict__["_r"] = int.from_bytes(signature[0:32], "big")
+        self.__dict__["_s"] = int.from_bytes(signature[32:64], "big")
+        # Les champs sont écrits directement : oublier l'encodage mémorisé par rlp.encode
+        self.__dict__.pop("_cached_rlp", None)
 
-    @property
     def is_valid(self):
         if (
             (self.sender == self.to)
             | check_values(self)
             | check_gas(self.gas)
             | check_nonce(self.sender, self.nonce)
-            | check_balance(self.self.sender, self.value, self.gas_price)
+            | check_balance(self.sender, self.value, self.gas_price)
             | check_signature(self.sender, self.hash, self.s)
         ):
             return False
@@ -62,3 +86,59 @@ class Transaction(rlp.Serializable):
         if isinstance(hex_transaction, bytes):
             return rlp.decode(decode_hex(hex_transaction.decode("utf-8")), cls)
         return rlp.decode(decode_hex(hex_transaction), cls)
+
+
+def recover_sender(sign_hash, v, r, s):
+    """Retrouve la clé publique de l'expéditeur à partir de la signature (v, r, s)."""
+    signature = r.to_bytes(32, "big") + s.to_bytes(32, "big") + bytes([v - 27])
+    return recover(sign_hash, signature)
+
+
+def recover_senders(transactions, executor=None):
+    """
+    Retrouve les expéditeurs d'un lot de transactions et les garde dans le cache.
+
+    Seules les signatures absentes du cache sont vérifiées. Au-delà de PROCESS_BATCH
+    signatures, elles sont réparties entre les processus de `executor`, s'il est donné.
+
+    Parameters:
+    ----------
+    transactions : list of Transaction
+        Transactions dont l'expéditeur est cherché.
+    executor : ProcessPoolExecutor
+        Pool de processus, gardé par l'appelant, pour les gros lots (voir `sender_recovery_pool`).
+
+    Returns:
+    -------
+    list of bytes
+        Expéditeurs, dans l'ordre des transactions.
+    """
+    hashes = [tx.hash for tx in transactions]
+    senders = [_senders.get(hash) for hash in hashes]
+    missing = [i for i, sender in enumerate(senders) if sender is None]
+    if not missing:
+        return senders
+
+    signatures = [(transactions[i].sign_hash, transactions[i].v, transactions[i].r, transactions[i].s) for i in missing]
+    if executor is not None and len(missing) >= PROCESS_BATCH:
+        recovered = list(executor.map(recover_sender, *zip(*signatures), chunksize=64))
+    else:
+        recovered = [recover_sender(*signature) for signature in signatures]
+
+    for i, sender in zip(missing, recovered):
+        senders[i] = sender
+        _senders.put(hashes[i], sender)
+    return senders
+
+
+def sender_recovery_pool(processes=None):
+    """
+    Pool de processus pour `recover_senders`, à garder pour toute la durée du nœud.
+
+    Les processus sont créés par un serveur forkserver : le processus appelant a des threads,
+    il ne doit pas être forké. Retourne None sur une machine à un seul cœur.
+    """
+    processes = processes or os.cpu_count()
+    if processes <= 1:
+        return None
+    return ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("forkserver"))
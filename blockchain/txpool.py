@@ -0,0 +1,227 @@
+import bisect
+import heapq
+import itertools
+import threading
+
+from .transaction import recover_senders
+
+
+class TxPool:
+    def __init__(self, capacity=4096):
+        """
+        Pool des transactions en attente d'inclusion dans un bloc.
+
+        Les transactions sont indexées par hash et rangées par expéditeur, par nonce. Un tas
+        des prix du gaz (du moins cher au plus cher) sert à évincer la transaction la moins
+        chère quand le pool est plein. Les entrées du tas ne sont pas retirées à la
+        suppression d'une transaction mais ignorées quand elles remontent, et le tas est
+        reconstruit quand elles deviennent majoritaires : une suppression coûte O(log n).
+
+        Les nonces de chaque expéditeur sont gardés triés, et un second tas range par prix
+        décroissant la transaction de plus petit nonce de chaque expéditeur. Les deux sont
+        tenus à jour à l'ajout et au retrait, si bien que `pending` n'a rien à retrier.
+
+        Parameters:
+        ----------
+        capacity : int
+            Nombre maximal de transactions dans le pool.
+        """
+        self.capacity = capacity
+        self.lock = threading.RLock()
+        # Hash -> (transaction, expéditeur, ordre d'arrivée)
+        self._all = {}
+        # Expéditeur -> {nonce: hash}
+        self._queues = {}
+        # Expéditeur -> nonces de ses transactions, triés
+        self._nonces = {}
+        # (-prix du gaz, ordre d'arrivée, expéditeur, hash) de la transaction de plus petit nonce
+        # de chaque expéditeur, y compris les entrées des transactions qui ne le sont plus
+        self._heads = []
+        # (prix du gaz, ordre d'arrivée, hash), y compris les entrées des transactions retirées
+        self._by_price = []
+        self._order = itertools.count()
+        # Appelés avec chaque transaction ajoutée, hors du verrou
+        self._listeners = []
+
+    def __len__(self):
+        return len(self._all)
+
+    def __contains__(self, tx):
+        return self._key(tx) in self._all
+
+    def __iter__(self):
+        with self.lock:
+            return iter([entry[0] for entry in self._all.values()])
+
+    @staticmethod
+    def _key(tx):
+        return tx if isinstance(tx, bytes) else tx.hash
+
+    def get(self, hash):
+        """Retourne la transaction de ce hash, ou None."""
+        entry = self._all.get(hash)
+        return entry[0] if entry is not None else None
+
+    def sender(self, hash):
+        """Retourne l'expéditeur de la transaction de ce hash, ou None."""
+        entry = self._all.get(hash)
+        return entry[1] if entry is not None else None
+
+    def subscribe(self, callback):
+        """Appelle `callback(tx)` après chaque transaction ajoutée au pool."""
+        self._listeners.append(callback)
+
+    def add(self, tx, sender=None):
+        """
+        Ajoute une transaction au pool.
+
+        Une transaction de même expéditeur et de même nonce n'est remplacée que par une
+        transaction de prix du gaz plus élevé. Quand le pool est plein, la transaction la
+        moins chère est évincée, sauf si la nouvelle n'est pas plus chère qu'elle.
+
+        Parameters:
+        ----------
+        tx : Transaction
+            Transaction à ajouter.
+        sender : bytes
+            Expéditeur, s'il est déjà connu ; sinon il est retrouvé à partir de la signature.
+
+        Returns:
+        -------
+        bool
+            True si la transaction a été ajoutée.
+        """
+        hash = tx.hash
+        sender = tx.sender if sender is None else sender
+        with self.lock:
+            if hash in self._all:
+                return False
+            queue = self._queues.get(sender, {})
+            replaced = queue.get(tx.nonce)
+            if replaced is not None:
+                if self._all[replaced][0].gas_price >= tx.gas_price:
+                    return False
+                self._remove(replaced)
+            elif len(self._all) >= self.capacity:
+                cheapest = self._cheapest()
+                if cheapest is None or self._all[cheapest][0].gas_price >= tx.gas_price:
+                    return False
+                self._remove(cheapest)
+
+            order = next(self._order)
+            self._all[hash] = (tx, sender, order)
+            self._queues.setdefault(sender, {})[tx.nonce] = hash
+            nonces = self._nonces.setdefault(sender, [])
+            bisect.insort(nonces, tx.nonce)
+            heapq.heappush(self._by_price, (tx.gas_price, order, hash))
+            if nonces[0] == tx.nonce:
+                heapq.heappush(self._heads, (-tx.gas_price, order, sender, hash))
+        for callback in self._listeners:
+            callback(tx)
+        return True
+
+    def remove(self, tx):
+        """Retire une transaction (ou un hash) du pool. Retourne False si elle n'y était pas."""
+        with self.lock:
+            return self._remove(self._key(tx))
+
+    def remove_included(self, transactions):
+        """
+        Retire les transactions incluses dans un bloc, ainsi que les transactions de leurs
+        expéditeurs dont le nonce est déjà utilisé.
+
+        L'expéditeur d'une transaction incluse absente du pool (reçue par un autre nœud, ou
+        remplacée ici par une autre de même nonce) est retrouvé à partir de sa signature.
+        """
+        transactions = list(transactions)
+        with self.lock:
+            unknown = [tx for tx in transactions if tx.hash not in self._all]
+        # Hors du verrou : la vérification des signatures est coûteuse
+        recovered = dict(zip((tx.hash for tx in unknown), recover_senders(unknown)))
+        with self.lock:
+            for tx in transactions:
+                entry = self._all.get(tx.hash)
+                sender = entry[1] if entry is not None else recovered.get(tx.hash)
+                queue = self._queues.get(sender)
+                if queue is None:
+                    continue
+                for nonce in [n for n in queue if n <= tx.nonce]:
+                    self._remove(queue[nonce])
+
+    def pending(self):
+        """
+        Parcourt les transactions dans l'ordre d'inclusion : la plus chère d'abord, sans jamais
+        placer une transaction avant celle de nonce inférieur du même expéditeur.
+
+        Returns:
+        -------
+        generator of (bytes, Transaction)
+            Expéditeur et transaction.
+        """
+        with self.lock:
+            heads = self._current_heads()
+        # Dernier nonce parcouru de chaque expéditeur
+        done = {}
+        while heads:
+            _, _, sender, hash = heapq.heappop(heads)
+            with self.lock:
+                expected = self._next(sender, done.get(sender))
+                if expected is None:
+                    continue
+                tx, _, order = self._all[expected]
+                if expected != hash:
+                    # Le pool a changé depuis le début du parcours
+                    heapq.heappush(heads, (-tx.gas_price, order, sender, expected))
+                    continue
+                done[sender] = tx.nonce
+                following = self._next(sender, tx.nonce)
+                if following is not None:
+                    entry = self._all[following]
+                    heapq.heappush(heads, (-entry[0].gas_price, entry[2], sender, following))
+            yield sender, tx
+
+    def _cheapest(self):
+        while self._by_price and not self._live(self._by_price[0]):
+            heapq.heappop(self._by_price)
+        return self._by_price[0][2] if self._by_price else None
+
+    def _current_heads(self):
+        """Tas des seules entrées de `_heads` encore valides, une par expéditeur."""
+        heads = list({item[2]: item for item in self._heads if item[3] == self._next(item[2])}.values())
+        heapq.heapify(heads)
+        return heads
+
+    def _next(self, sender, after=None):
+        """Hash de la transaction de l'expéditeur de plus petit nonce supérieur à `after`, ou None."""
+        nonces = self._nonces.get(sender)
+        if not nonces:
+            return None
+        index = 0 if after is None else bisect.bisect_right(nonces, after)
+        return self._queues[sender][nonces[index]] if index < len(nonces) else None
+
+    def _live(self, item):
+        entry = self._all.get(item[2])
+        return entry is not None and entry[2] == item[1]
+
+    def _remove(self, hash):
+        entry = self._all.pop(hash, None)
+        if entry is None:
+            return False
+        tx, sender, _ = entry
+        queue = self._queues[sender]
+        del queue[tx.nonce]
+        nonces = self._nonces[sender]
+        index = bisect.bisect_left(nonces, tx.nonce)
+        del nonces[index]
+        if not queue:
+            del self._queues[sender]
+            del self._nonces[sender]
+        elif index == 0:
+            head = self._all[queue[nonces[0]]]
+            heapq.heappush(self._heads, (-head[0].gas_price, head[2], sender, queue[nonces[0]]))
+        if len(self._heads) > 2 * len(self._queues) + 64:
+            self._heads = self._current_heads()
+        if len(self._by_price) > 2 * len(self._all) + 64:
+            self._by_price = [item for item in self._by_price if self._live(item)]
+            heapq.heapify(self._by_price)
+        return True
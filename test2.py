@@ -24,17 +24,17 @@ class Blockchain:
 blockchain = Blockchain()
 print(blockchain)
 b = Block((1, blockchain.last_hash, b'', b'', 0, 0, 0, 0, 0, b'', b'', b'', b''), [])
-b.add_transaction(Transaction(0, 0, b'', 0, b''))
+b.add_transaction(Transaction(0, 0, 0, b'', 0, b''))
 print(b)
-b.add_transaction(Transaction(0, 0, b'', 0, b''))
+b.add_transaction(Transaction(0, 0, 0, b'', 0, b''))
 print(b)
 blockchain.add(b)
 print(blockchain)
 
 b = Block((2, blockchain.last_hash, b'', b'', 0, 0, 0, 0, 0, b'', b'', b'', b''), [])
-b.add_transaction(Transaction(0, 0, b'toi', 0, b''))
+b.add_transaction(Transaction(0, 0, 0, b'toi', 0, b''))
 print(b)
-b.add_transaction(Transaction(0, 0, b'toi', 0, b''))
+b.add_transaction(Transaction(0, 0, 0, b'toi', 0, b''))
 print(b)
 blockchain.add(b)
 print(blockchain)
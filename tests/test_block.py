@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from blockchain.block import Block, BlockHeader
+
+
+def make_header(nonce=0):
+    return BlockHeader(1, b'parent', b'', b'', 10, nonce, 1000, 0, 5, b'', b'', b'', b'', b'')
+
+
+def test_hashes_are_memoized():
+    block = Block(make_header())
+    assert block.hash is block.hash
+    assert block.header.hash is block.header.hash
+    assert block.encode_block is block.encode_block
+    assert block.hash == Block(make_header()).hash
+
+
+def test_hashes_follow_field_changes():
+    block = Block(make_header())
+    block_hash, header_hash, encoded = block.hash, block.header.hash, block.encode_block
+
+    block.header._in_mutable_context = True
+    block.header.nonce = 42
+    block.header._in_mutable_context = False
+
+    assert block.header.hash != header_hash
+    assert block.header.hash == make_header(nonce=42).hash
+    assert block.hash != block_hash
+    assert block.hash == Block(make_header(nonce=42)).hash
+    assert block.encode_block != encoded
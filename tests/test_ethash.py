@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import queue
+import socket
+import threading
+import time
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from blockchain.Consensus.Pow.consensus import ProofOfWork, hashimotoFull, hashimotoLight, params
+from blockchain.Consensus.Pow.dataset import Dataset, calcCacheSize, calcDatasetSize, generateCache, generateDataset, \
+    generate_dataset_item, memoryMapAndGenerate, removeOldEpochs
+from blockchain.Consensus.Pow.hashrate import HashrateMeter, Meter
+from blockchain.Consensus.consensus import ConcreteChainHeaderReader
+from blockchain.block import Block, BlockHeader
+from blockchain.header_index import HeaderIndex
+from blockchain.mpt.Database import MemoryBackend
+
+
+def test_sizes():
+    assert calcCacheSize(0) == 16776896
+    assert calcDatasetSize(0) == 1073739904
+
+
+def test_cache_and_dataset_generation():
+    cache = generateCache(1024, bytes(32))
+    assert cache.tobytes()[:32].hex() == "7ce2991c951f7bf4c4c1bb119887ee07871eb5339d7b97b8588e85c742de90e5"
+
+    dataset = generateDataset(32 * 1024, cache, batch=100)
+    assert dataset.tobytes()[:32].hex() == "4bc09fbd530a041dd2ec296110a29e8f130f179c59d223f51ecce3126e8b0c74"
+    for index in (0, 1, 99, 100, 511):
+        assert np.array_equal(dataset[index * 16:(index + 1) * 16], generate_dataset_item(cache, index))
+
+
+def test_memory_mapped_files(tmp_path):
+    calls = []
+
+    def generator(out):
+        calls.append(out)
+        return generateCache(1024, bytes(32), out=out)
+
+    path = str(tmp_path / "0-0000000000000000.cache")
+    cache = memoryMapAndGenerate(path, 1024, generator)
+    assert np.array_equal(memoryMapAndGenerate(path, 1024, generator), cache)
+    assert len(calls) == 1
+    assert np.array_equal(cache, generateCache(1024, bytes(32)))
+    with pytest.raises(ValueError):
+        cache[0] = 0
+    assert os.listdir(tmp_path) == ["0-0000000000000000.cache"]
+
+    (tmp_path / "1-0000000000000000.dataset").write_bytes(b"")
+    (tmp_path / "2-0000000000000000.cache").write_bytes(b"")
+    removeOldEpochs(str(tmp_path), 2, "cache")
+    assert sorted(os.listdir(tmp_path)) == ["1-0000000000000000.dataset", "2-0000000000000000.cache"]
+    removeOldEpochs(str(tmp_path), 2, "dataset")
+    assert os.listdir(tmp_path) == ["2-0000000000000000.cache"]
+
+
+def test_dataset_generation_prunes_old_epochs(tmp_path):
+    (tmp_path / "0-0000000000000000.cache").write_bytes(b"")
+    (tmp_path / "0-0000000000000000.dataset").write_bytes(b"")
+    Dataset(1).generate(str(tmp_path), 1, False, True)
+    assert all(name.startswith("1-") for name in os.listdir(tmp_path))
+    assert len(os.listdir(tmp_path)) == 2
+
+
+def test_next_epoch_is_pregenerated():
+    engine = ProofOfWork(test=True, pregenerate_after=0.5)
+    engine.dataset(100, False)
+    assert engine.future is None
+
+    engine.dataset(params["epochLength"] // 2 + 1, False)
+    future = engine.future
+    assert future.epoch == 1
+    while not future.generated():
+        time.sleep(0.01)
+
+    engine.dataset(params["epochLength"], False)
+    assert engine.datasets.get(1) is future
+    assert engine.datasets.get(0) is None
+
+
+@pytest.mark.parametrize("process_sealing", [True, False])
+def test_seal(tmp_path, monkeypatch, process_sealing):
+    monkeypatch.chdir(tmp_path)
+    engine = ProofOfWork(dataset_dir=str(tmp_path / "ethash"), process_sealing=process_sealing, test=True)
+    engine.threads = 2
+    header = BlockHeader(1, b'', b'', b'', 16, 0, 1000, 0, 1, b'', b'', b'', b'', b'')
+    results, stop = queue.Queue(), threading.Event()
+    assert engine.seal(None, Block(header), results, stop)
+    assert engine.mining_stats()["shares"] == 1
+
+    sealed = results.get_nowait()
+    _, result = hashimotoFull(engine.dataset(1, False), engine.seal_hash(sealed.header), sealed.header.nonce)
+    assert int.from_bytes(result, "big") <= 2 ** 256 // 16
+
+    # The worker processes are kept for the next block
+    pool = engine.seal_pool
+    assert (pool is not None) == process_sealing
+    assert engine.seal(None, Block(header.copy(timestamp=2)), results, stop)
+    assert engine.seal_pool is pool and results.get_nowait().header.timestamp == 2
+    engine.close()
+
+
+def test_remote_sealer(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    engine = ProofOfWork(test=True)
+    engine.threads = -1
+    server = engine.start_remote_sealer(str(tmp_path / "work.sock"))
+    header = BlockHeader(1, b'parent', b'', b'', 16, 0, 1000, 0, 1, b'', b'', b'', b'', b'')
+    results, stop = queue.Queue(), threading.Event()
+    sealing = threading.Thread(target=engine.seal, args=(None, Block(header), results, stop))
+    sealing.start()
+
+    with socket.socket(socket.AF_UNIX) as client:
+        client.connect(server.server_address)
+        stream = client.makefile("rwb")
+
+        def call(method, *params):
+            stream.write(json.dumps({"id": 1, "method": method, "params": params}).encode() + b"\n")
+            stream.flush()
+            return json.loads(stream.readline())
+
+        response = call("eth_getWork")
+        while response["error"] is not None:
+            time.sleep(0.01)
+            response = call("eth_getWork")
+        seal_hash, seed_hash, target, number = response["result"]
+        assert bytes.fromhex(seal_hash[2:]) == engine.seal_hash(header)
+        assert int(target, 16) == 2 ** 256 // 16 and int(number, 16) == 1
+        assert bytes.fromhex(seed_hash[2:]) == engine.cache(1).seedHash(1)
+
+        # An unreadable request doesn't reuse the id of the previous one
+        stream.write(b"{not json\n")
+        stream.flush()
+        error = json.loads(stream.readline())
+        assert error["id"] is None and error["error"] is not None
+
+        nonce = 0
+        while not engine.verify_seal(header.copy(nonce=nonce)):
+            nonce += 1
+        assert call("eth_submitWork", hex(nonce + 2 ** 40), "0x" + "00" * 32, seal_hash)["result"] is False
+        assert call("eth_submitWork", hex(nonce), "0x" + "00" * 32, seal_hash)["result"] is True
+        # The work was sealed, a second submission is stale
+        assert call("eth_submitWork", hex(nonce), "0x" + "00" * 32, seal_hash)["result"] is False
+
+    sealing.join(5)
+    assert not sealing.is_alive()
+    assert results.get_nowait().header.nonce == nonce
+    assert engine.mining_stats()["shares"] == 1
+
+    # Work built on a previous head is dropped when the head changes
+    engine.remote.new_work(Block(header.copy(parent_hash=b'other')), results, threading.Event())
+    assert not engine.remote.submit_work(nonce, b'', seal_hash)
+    assert engine.mining_stats()["stale_work"] == 2
+    engine.close()
+    assert not os.path.exists(server.address)
+
+
+def test_hashrate_meter():
+    meter = Meter(window=10)
+    for second in range(100):
+        meter.mark(500, now=second)
+    assert meter.rate(now=99) == pytest.approx(500, rel=0.1)
+    assert meter.rate(now=199) < 1
+
+    hashrate = HashrateMeter()
+    hashrate.start_work(1000)
+    hashrate.mark("thread-0", 64)
+    hashrate.mark("thread-1", 64)
+    hashrate.share()
+    stats = hashrate.stats()
+    assert stats["hashes"] == 128 and stats["shares"] == 1
+    assert set(stats["workers"]) == {"thread-0", "thread-1"}
+    assert stats["time_to_block"] == pytest.approx(1000 / stats["hashrate"])
+
+
+def test_light_verification():
+    engine = ProofOfWork(test=True)
+    dataset = engine.dataset(1, False)
+    cache = engine.cache(1)
+    seal_hash = bytes(range(32))
+    for nonce in range(20):
+        assert hashimotoLight(cache.dataset_size, cache, seal_hash, nonce) == hashimotoFull(dataset, seal_hash, nonce)
+
+    header = BlockHeader(1, b'', b'', b'', 16, 0, 1000, 0, 1, b'', b'', b'', b'', b'')
+    nonces = [nonce for nonce in range(64) if engine.verify_seal(header.copy(nonce=nonce))]
+    assert 0 < len(nonces) < 64
+    for nonce in nonces:
+        _, result = hashimotoFull(dataset, engine.seal_hash(header), nonce)
+        assert int.from_bytes(result, "big") <= 2 ** 256 // 16
+
+
+class HeaderChain:
+    def __init__(self, headers):
+        self.headers = {header.hash: header for header in headers}
+
+    def config(self):
+        return {}
+
+    def get_header(self, hash, number):
+        return self.headers.get(hash)
+
+
+@pytest.mark.parametrize("on_disk", [True, False])
+def test_verify_headers(tmp_path, monkeypatch, on_disk):
+    monkeypatch.setitem(params, "MinimumDifficulty", 2)
+    engine = ProofOfWork(dataset_dir=str(tmp_path) if on_disk else "", test=True)
+    engine.threads = 2
+    genesis = BlockHeader(0, b'', b'', b'', 2, 0, 1000, 0, 1, b'', b'', b'', b'', b'')
+    headers, parent = [], genesis
+    for number in range(1, 9):
+        header = BlockHeader(number, parent.hash, b'', b'', 2, 0, 1000, 0, 1 + number * 20, b'', b'', b'', b'', b'')
+        nonce = next(nonce for nonce in range(1000) if engine.verify_seal(header.copy(nonce=nonce)))
+        parent = header.copy(nonce=nonce)
+        headers.append(parent)
+
+    def verify(headers):
+        abort, results = engine.verify_headers(HeaderChain([genesis]), headers)
+        return [results.get(timeout=30) for _ in headers]
+
+    assert verify(headers) == [None] * len(headers)
+    assert engine.verify_stats["headers"] == len(headers)
+
+    bad_nonce = next(nonce for nonce in range(1000) if not engine.verify_seal(headers[3].copy(nonce=nonce)))
+    errors = verify(headers[:3] + [headers[3].copy(nonce=bad_nonce)])
+    assert errors == [None, None, None, "invalid seal #4"]
+
+    class BrokenChain(HeaderChain):
+        def get_header(self, hash, number):
+            raise ValueError("missing header")
+
+    # Une erreur dans le pipeline refuse les en-têtes restants au lieu de bloquer l'appelant
+    abort, results = engine.verify_headers(BrokenChain([genesis]), headers[1:4])
+    errors = [results.get(timeout=30) for _ in range(3)]
+    assert all(error.startswith("verification failed") for error in errors)
+    engine.close()
+
+
+def test_verify_header_through_header_index(monkeypatch):
+    monkeypatch.setitem(params, "MinimumDifficulty", 2)
+    engine = ProofOfWork(test=True)
+    genesis = Block(BlockHeader(0, b'', b'', b'', 2, 0, 1000, 0, 1, b'', b'', b'', b'', b''))
+    index = HeaderIndex(MemoryBackend())
+    index.add(genesis)
+    reader = ConcreteChainHeaderReader(SimpleNamespace(header_index=index, version='0.1'))
+
+    header = BlockHeader(1, genesis.hash, b'', b'', 2, 0, 1000, 0, 21, b'', b'', b'', b'', b'')
+    nonce = next(nonce for nonce in range(1000) if engine.verify_seal(header.copy(nonce=nonce)))
+    bad_nonce = next(nonce for nonce in range(1000) if not engine.verify_seal(header.copy(nonce=nonce)))
+    assert engine.verify_header(reader, header.copy(nonce=nonce))
+    assert not engine.verify_header(reader, header.copy(nonce=bad_nonce))
+    assert not engine.verify_header(reader, header.copy(nonce=nonce, parent_hash=b'unknown'))
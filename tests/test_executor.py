@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from collections import namedtuple
+
+import pytest
+
+from blockchain.executor import ParallelExecutor
+from blockchain.mpt.Database import MemoryBackend
+from blockchain.state import State
+
+Transfer = namedtuple('Transfer', 'to value')
+
+
+def transfer(tx, address_state, contract_state, sender):
+    overlay = address_state.overlay()
+    balance = int(overlay.get(sender))
+    if balance < tx.value:
+        return False
+    try:
+        received = int(overlay.get(tx.to))
+    except KeyError:
+        received = 0
+    overlay.update(sender, b'%d' % (balance - tx.value))
+    overlay.update(tx.to, b'%d' % (received + tx.value))
+    overlay.commit()
+    return True
+
+
+@pytest.fixture
+def states():
+    def make(name):
+        address_state = State(name + '-address', backend=MemoryBackend())
+        contract_state = State(name + '-contract', backend=MemoryBackend())
+        with address_state.batch():
+            for account in (b'alice', b'bob', b'carol', b'dave'):
+                address_state.update(account, b'100')
+        return address_state, contract_state
+    return make
+
+
+def test_parallel_execution_matches_serial(states):
+    transactions = [
+        (Transfer(b'erin', 10), b'alice'),
+        (Transfer(b'frank', 10), b'bob'),
+        # Reads the balances written by the two first transfers
+        (Transfer(b'alice', 50), b'erin'),
+        (Transfer(b'erin', 95), b'carol'),
+        (Transfer(b'bob', 500), b'dave'),
+        (Transfer(b'carol', 1), b'dave'),
+    ]
+    serial_address, serial_contract = states('serial')
+    expected = [transfer(tx, serial_address, serial_contract, sender) for tx, sender in transactions]
+
+    address_state, contract_state = states('parallel')
+    executor = ParallelExecutor(workers=4)
+    results = executor.execute(transfer, transactions, address_state, contract_state)
+    assert results == expected == [True, True, False, True, False, True]
+    assert address_state.current_state_root() == serial_address.current_state_root()
+    # The transfers that read erin and carol after they were written are executed again
+    assert executor.stats()["reexecuted_transactions"] == 3
+
+    skipped = executor.execute(transfer, [(Transfer(b'bob', 500), b'dave'), (Transfer(b'bob', 1), b'dave')],
+                               address_state.overlay(), contract_state, skip_failed_senders=True)
+    assert skipped == [False, None]
+    executor.close()
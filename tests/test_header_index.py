@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from types import SimpleNamespace
+
+import pytest
+
+from blockchain.Consensus.consensus import ConcreteChainReader
+from blockchain.block import Block, BlockHeader
+from blockchain.header_index import HeaderIndex
+from blockchain.mpt.Database import MemoryBackend
+
+
+def make_chain(length):
+    blocks, parent_hash = [], b''
+    for number in range(length):
+        header = BlockHeader(number, parent_hash, b'', b'', 10 + number, 0, 1000, 0, number, b'', b'', b'', b'', b'')
+        blocks.append(Block(header))
+        parent_hash = blocks[-1].hash
+    return blocks
+
+
+def test_header_index():
+    backend = MemoryBackend()
+    index = HeaderIndex(backend)
+    blocks = make_chain(5)
+    for block in blocks:
+        index.add(block)
+
+    assert index.hash_by_number(3) == blocks[3].hash
+    assert index.header(blocks[3].hash.hex()).number == 3
+    assert index.td(blocks[4].hash) == sum(10 + number for number in range(5))
+    assert index.header_by_number(7) is None
+
+    reopened = HeaderIndex(backend)
+    assert reopened.header_by_number(2) == blocks[2].header
+    assert reopened.td(blocks[2].hash) == 10 + 11 + 12
+
+
+def test_chain_reader_uses_header_index():
+    blocks = make_chain(4)
+    index = HeaderIndex(MemoryBackend())
+    for block in blocks:
+        index.add(block)
+    app = SimpleNamespace(header_index=index, chain=blocks, version='0.1', get_latest_block=lambda: blocks[-1])
+    reader = ConcreteChainReader(app)
+
+    assert reader.get_block(blocks[2].hash, 2) is blocks[2]
+    header_reader = reader.chainReaderHeader
+    assert header_reader.current_header() == blocks[3].header
+    assert header_reader.get_header_by_number(1) == blocks[1].header
+    assert header_reader.get_header_by_hash(blocks[1].hash.hex()) == blocks[1].header
+    assert header_reader.get_td(blocks[1].hash, 1) == 10 + 11
+    with pytest.raises(ValueError):
+        header_reader.get_header(blocks[1].hash, 2)
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from blockchain.block import Block, BlockHeader
+from blockchain.importer import BlockImporter
+
+
+def make_block(number, transactions=()):
+    header = BlockHeader(number, b'', b'', b'', 1, 0, 1000, 0, number, b'', b'', b'', b'', b'')
+    return Block(header, transactions)
+
+
+def test_import_order_and_stats():
+    imported = []
+    importer = BlockImporter(lambda block, transactions: imported.append(block.header.number) or True, workers=2)
+    results = []
+    for number in range(10):
+        importer.submit(make_block(number), lambda block, added: results.append(added))
+    # Undecodable transactions reject the block without executing it
+    importer.submit(make_block(10, [b'\xff']), lambda block, added: results.append(added))
+    importer.wait()
+
+    assert imported == list(range(10))
+    assert results == [True] * 10 + [False]
+    stats = importer.stats()
+    assert stats["imported_blocks"] == 10 and stats["rejected_blocks"] == 1
+    assert stats["pending_blocks"] == 0
+    importer.close()
+
+
+def test_backpressure():
+    release = threading.Event()
+    importer = BlockImporter(lambda block, transactions: release.wait(5), max_pending=2)
+    importer.submit(make_block(0))
+    importer.submit(make_block(1))
+    blocked = threading.Thread(target=importer.submit, args=(make_block(2),))
+    blocked.start()
+    blocked.join(0.2)
+    assert blocked.is_alive()
+
+    release.set()
+    blocked.join(5)
+    assert not blocked.is_alive()
+    importer.wait()
+    assert importer.stats()["imported_blocks"] == 3
+    importer.close()
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from types import SimpleNamespace
+
+from blockchain.Consensus.Pow.consensus import ProofOfWork, params
+from blockchain.Consensus.consensus import ConcreteChainHeaderReader
+from blockchain.block import Block, BlockHeader
+from blockchain.header_index import HeaderIndex
+from blockchain.miner import Miner
+from blockchain.mpt.Database import MemoryBackend
+from blockchain.state import State
+from blockchain.txpool import TxPool
+
+
+def test_block_candidate_passes_header_verification(monkeypatch):
+    monkeypatch.setitem(params, "MinimumDifficulty", 2)
+    engine = ProofOfWork(test=True)
+    parent = Block(BlockHeader(0, b'', b'', b'', 2, 0, 1000, 0, 1, b'', b'', b'', b'', b''))
+    index = HeaderIndex(MemoryBackend())
+    index.add(parent)
+    global_state = State('global', backend=MemoryBackend())
+    global_state.update(b'contract_state', b'root')
+    blockchain = SimpleNamespace(
+        consensus_engine=engine,
+        tx_executor=None,
+        header_index=index,
+        version='0.1',
+        state=global_state,
+        address_state=State('address', backend=MemoryBackend()),
+        contract_state=State('contract', backend=MemoryBackend()),
+        get_latest_block=lambda: parent,
+        compute_transactions_root=lambda transactions: b'',
+        compute_receipts_root=lambda receipts: b'',
+    )
+    blockchain.header_reader = ConcreteChainHeaderReader(blockchain)
+    miner = Miner(blockchain, TxPool(), SimpleNamespace(get_address=lambda: b'miner'), None)
+
+    block = miner.create_block_candidate()
+    assert block.header.number == 1 and block.header.parent_hash == parent.hash
+    header = block.header
+    nonce = next(nonce for nonce in range(1000) if engine.verify_seal(header.copy(nonce=nonce)))
+    assert engine.verify_header(blockchain.header_reader, header.copy(nonce=nonce))
+    miner.executor.close()
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import random
+
+import pytest
+
+from blockchain.mpt.Database import MemoryBackend
+from blockchain.mpt.mpt import MerklePatriciaTrie
+
+random.seed(42)
+
+
+def random_items(count=200):
+    return {random.randbytes(32): random.randbytes(random.randint(1, 64)) for _ in range(count)}
+
+
+def test_node_cache_is_shared_per_backend():
+    backend = MemoryBackend()
+    trie = MerklePatriciaTrie(backend=backend)
+    items = random_items()
+    for key, value in items.items():
+        trie.update(key, value)
+    trie.flush()
+
+    other = MerklePatriciaTrie(backend=backend, root=trie.root())
+    for key, value in items.items():
+        assert other.get(key) == value
+    misses = trie.node_cache_stats()["misses"]
+    for key, value in items.items():
+        assert other.get(key) == value
+    stats = trie.node_cache_stats()
+    assert stats["misses"] == misses
+    assert stats["hits"] > 0
+
+
+def test_node_cache_only_holds_flushed_nodes():
+    backend = MemoryBackend()
+    trie = MerklePatriciaTrie(backend=backend)
+    trie.update(b'a' * 32, b'1' * 40)
+    trie.flush()
+    checkpoint = trie.checkpoint()
+
+    trie.update(b'b' * 32, b'2' * 40)
+    abandoned = trie.root()
+    assert abandoned not in trie._node_cache.data
+    trie.reset(checkpoint)
+    assert trie._storage.cache == {}
+    trie.flush()
+    assert abandoned not in backend and abandoned not in trie._node_cache.data
+    assert trie.get(b'a' * 32) == b'1' * 40
+    with pytest.raises(KeyError):
+        trie.get(b'b' * 32)
+
+    trie.update(b'c' * 32, b'3' * 40)
+    trie.flush()
+    assert trie.root() in trie._node_cache.data
+
+    # Other tries read flushed values as the backend stores them
+    trie.update(b'd' * 32, 1000)
+    trie.flush()
+    assert MerklePatriciaTrie(backend=backend, root=trie.root()).get(b'd' * 32) == (1000).to_bytes(2, 'big')
+
+
+def test_node_cache_does_not_change_roots():
+    cached = MerklePatriciaTrie(backend=MemoryBackend())
+    uncached = MerklePatriciaTrie(backend=MemoryBackend(), node_cache_size=0)
+    items = random_items()
+    for key, value in items.items():
+        cached.update(key, value)
+        uncached.update(key, value)
+    for key in list(items)[:100]:
+        cached.delete(key)
+        uncached.delete(key)
+    assert cached.root_hash() == uncached.root_hash()
+
+
+def test_deferred_hashing_matches_eager():
+    eager = MerklePatriciaTrie(backend=MemoryBackend())
+    deferred = MerklePatriciaTrie(backend=MemoryBackend(), deferred=True)
+    items = random_items()
+    for key, value in items.items():
+        eager.update(key, value)
+        deferred.update(key, value)
+    for key in list(items)[:50]:
+        eager.delete(key)
+        deferred.delete(key)
+    assert deferred.get(list(items)[60]) == items[list(items)[60]]
+    assert deferred.root_hash() == eager.root_hash()
+
+
+def test_from_sorted_items_matches_incremental_insertion():
+    items = random_items()
+    items.update({b'\x01': b'short', b'\x01\x02': b'prefixed'})
+    incremental = MerklePatriciaTrie(backend=MemoryBackend())
+    for key, value in items.items():
+        incremental.update(key, value)
+    built = MerklePatriciaTrie.from_sorted_items(sorted(items.items()), backend=MemoryBackend())
+    assert built.root_hash() == incremental.root_hash()
+    for key, value in items.items():
+        assert built.get(key) == value
+
+
+def test_proofs():
+    trie = MerklePatriciaTrie(backend=MemoryBackend(), deferred=True)
+    items = random_items()
+    for key, value in items.items():
+        trie.update(key, value)
+    root_hash = trie.root_hash()
+    keys = list(items)[:10]
+
+    for key in keys:
+        assert MerklePatriciaTrie.verify_proof(root_hash, key, trie.get_proof(key)) == items[key]
+
+    missing = random.randbytes(32)
+    assert MerklePatriciaTrie.verify_proof(root_hash, missing, trie.get_proof(missing)) is None
+
+    multi_proof = trie.get_multi_proof(keys)
+    assert len(multi_proof) < sum(len(trie.get_proof(key)) for key in keys)
+    assert MerklePatriciaTrie.verify_multi_proof(root_hash, keys, multi_proof) == {key: items[key] for key in keys}
+
+    with pytest.raises(ValueError):
+        MerklePatriciaTrie.verify_proof(root_hash, keys[0], trie.get_proof(keys[0])[:-1])
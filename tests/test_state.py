@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from blockchain.mpt.Database import MemoryBackend
+from blockchain.state import State
+
+
+@pytest.fixture
+def state():
+    state = State('address', backend=MemoryBackend())
+    with state.batch():
+        state.update(b'alice', b'100')
+    return state
+
+
+def test_overlay_commit_and_revert(state):
+    root = state.current_state_root()
+    overlay = state.overlay()
+    overlay.update(b'alice', b'90')
+    checkpoint = overlay.checkpoint()
+    overlay.update(b'alice', b'80')
+    overlay.update(b'bob', b'10')
+    assert overlay.get(b'alice') == b'80'
+
+    overlay.revert(checkpoint)
+    assert overlay.get(b'alice') == b'90'
+    with pytest.raises(KeyError):
+        overlay.get(b'bob')
+    assert state.current_state_root() == root
+
+    overlay.commit()
+    assert state.get(b'alice') == b'90'
+    assert state.current_state_root() != root
+
+
+def test_nested_overlay(state):
+    outer = state.overlay()
+    inner = outer.overlay()
+    inner.update(b'bob', b'10')
+    assert outer.get(b'alice') == b'100'
+    inner.commit()
+    assert outer.get(b'bob') == b'10'
+    with pytest.raises(KeyError):
+        state.get(b'bob')
+    outer.revert()
+    with pytest.raises(KeyError):
+        outer.get(b'bob')
+
+
+def test_state_proof(state):
+    proof = state.get_proof(b'alice', b'bob')
+    assert State.verify_proof(state.current_state_root(), [b'alice', b'bob'], proof) == {
+        b'alice': b'100', b'bob': None
+    }
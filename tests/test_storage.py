@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from blockchain.mpt.Database import MemoryBackend, SQLiteBackend
+from blockchain.mpt.hash import keccak_hash
+from blockchain.mpt.pruner import Pruner
+from blockchain.snapshot import Snapshot, SnapshotMiss
+from blockchain.storage import Storage
+
+
+def test_sqlite_backend(tmp_path):
+    backend = SQLiteBackend(str(tmp_path))
+    backend.put(b'a', b'1')
+    backend.batch(puts=[(b'b', b'2'), (b'c', b'3')], deletes=[b'a'])
+    assert b'a' not in backend
+    assert backend.get(b'b') == b'2'
+    assert sorted(backend.iterate()) == [(b'b', b'2'), (b'c', b'3')]
+    with pytest.raises(KeyError):
+        backend.get(b'a')
+    backend.batch(puts=[(b'p:1', b'4'), (b'p:\xff', b'5'), (b'p;', b'6')])
+    assert sorted(backend.iterate_prefix(b'p:')) == [(b'p:1', b'4'), (b'p:\xff', b'5')]
+    backend.close()
+
+
+@pytest.mark.parametrize("kind", ["memory", "sqlite"])
+def test_backend_atomic(tmp_path, kind):
+    backend = MemoryBackend() if kind == "memory" else SQLiteBackend(str(tmp_path))
+    backend.put(b'a', b'1')
+    with backend.atomic():
+        backend.put(b'b', b'2')
+        with backend.atomic():
+            backend.delete(b'a')
+        assert backend.get(b'b') == b'2' and b'a' not in backend
+        assert sorted(backend.iterate()) == [(b'a', b'1')]
+    assert sorted(backend.iterate()) == [(b'b', b'2')]
+
+    with pytest.raises(ValueError):
+        with backend.atomic():
+            storage = Storage(backend=backend)
+            with storage.batch():
+                storage[b'key'] = b'value' * 10
+            raise ValueError
+    assert sorted(backend.iterate()) == [(b'b', b'2')]
+    with pytest.raises(KeyError):
+        Storage(storage.current_root, backend=backend)[b'key']
+    backend.close()
+
+
+def test_storage_reopen_from_root(tmp_path):
+    storage = Storage(db_path=str(tmp_path))
+    with storage.batch():
+        for i in range(100):
+            storage[str(i).encode()] = b'value-%d' % i
+    reopened = Storage(storage.current_root, db_path=str(tmp_path))
+    assert reopened[b'42'] == b'value-42'
+
+
+def test_in_memory_uses_memory_backend():
+    storage = Storage(in_memory=True)
+    storage[b'a'] = b'1'
+    assert isinstance(storage.backend, MemoryBackend)
+    assert isinstance(Storage.from_items([(b'a', b'1')], in_memory=True).backend, MemoryBackend)
+    assert Storage(in_memory=True).backend is not storage.backend
+
+
+def test_from_items_keeps_last_value():
+    items = [(b'a', b'1'), (b'b', b'2'), (b'a', b'3')]
+    built = Storage.from_items(items, backend=MemoryBackend())
+    inserted = Storage(backend=MemoryBackend())
+    for key, value in items:
+        inserted[key] = value
+    assert built.current_root == inserted.current_root
+    assert built[b'a'] == b'3'
+
+
+def test_batch_writes_only_reachable_nodes():
+    backend = MemoryBackend()
+    storage = Storage(backend=backend)
+    with storage.batch():
+        for i in range(50):
+            storage[b'key'] = b'value-%d' % i
+    assert len(backend) == 1
+    assert storage[b'key'] == b'value-49'
+
+
+def test_batch_rollback_on_error():
+    storage = Storage(backend=MemoryBackend())
+    storage[b'key'] = b'before'
+    root = storage.current_root
+    with pytest.raises(ValueError):
+        with storage.batch():
+            storage[b'key'] = b'after'
+            raise ValueError
+    assert storage.current_root == root
+    assert storage[b'key'] == b'before'
+
+
+def test_storage_proof():
+    storage = Storage(backend=MemoryBackend())
+    storage[b'alice'] = b'100'
+    storage[b'bob'] = b'50'
+    proof = storage.get_multi_proof([b'alice', b'carol'])
+    assert Storage.verify_multi_proof(storage.current_root, [b'alice', b'carol'], proof) == {
+        b'alice': b'100', b'carol': None
+    }
+
+
+def test_pruner_keeps_retained_roots():
+    backend = MemoryBackend()
+    pruner = Pruner(backend, retain=2)
+    storage = Storage(backend=backend)
+    roots = []
+    for number in range(5):
+        with storage.batch():
+            for i in range(20):
+                storage[b'key-%d' % i] = b'value-%d-%d' % (number, i) * 4
+        roots.append(storage.current_root)
+        pruner.retain(number, [storage.current_root])
+    pruner.wait()
+
+    stats = pruner.stats()
+    assert stats["deleted_nodes"] > 0
+    assert stats["reclaimed_bytes"] > 0
+    assert Storage(roots[3], backend=backend)[b'key-3'] == b'value-3-3' * 4
+    assert Storage(roots[4], backend=backend)[b'key-3'] == b'value-4-3' * 4
+    # Pruned nodes are gone from the shared node cache too
+    assert roots[0] not in backend and roots[0] not in storage.trie._node_cache.data
+    with pytest.raises(KeyError):
+        Storage(roots[0], backend=backend)[b'key-3']
+    assert pruner.lock is backend.write_lock
+    pruner.close()
+
+
+def test_snapshot_layers():
+    backend = MemoryBackend()
+    snapshot = Snapshot(backend, 'address', max_layers=2)
+    storage = Storage(backend=backend)
+    with storage.batch():
+        storage[b'alice'] = b'100'
+    snapshot.generate(storage)
+    genesis = storage.current_root
+    storage = Storage(genesis, backend=backend, snapshot=snapshot)
+
+    roots = []
+    for number in range(4):
+        storage[b'alice'] = b'%d' % number
+        storage[b'bob-%d' % number] = b'1'
+        storage.commit_snapshot()
+        roots.append(storage.current_root)
+        assert storage[b'alice'] == b'%d' % number
+
+    # Only the last `max_layers` layers stay in memory, older ones were merged on disk.
+    assert not snapshot.knows(genesis)
+    assert snapshot.disk_root == roots[1]
+    assert snapshot.get(roots[3], keccak_hash(b'bob-0')) == b'1'
+    assert snapshot.get(roots[2], keccak_hash(b'alice')) == b'2'
+    with pytest.raises(KeyError):
+        snapshot.get(roots[2], keccak_hash(b'bob-3'))
+    with pytest.raises(SnapshotMiss):
+        snapshot.get(genesis, keccak_hash(b'alice'))
+
+    snapshot.flatten()
+    reopened = Snapshot(backend, 'address')
+    assert reopened.knows(roots[3])
+    assert Storage(roots[3], backend=backend, snapshot=reopened)[b'alice'] == b'3'
+
+
+def test_snapshot_returns_trie_values():
+    backend = MemoryBackend()
+    snapshot = Snapshot(backend, 'address')
+    snapshot.generate(Storage(backend=backend))
+    storage = Storage(backend=backend, snapshot=snapshot)
+    storage[b'alice'] = 10 ** 18
+    storage.commit()
+    storage.commit_snapshot()
+    assert storage[b'alice'] == (10 ** 18).to_bytes(8, 'big')
+
+    snapshot.flatten()
+    root = storage.current_root
+    from_snapshot = Storage(root, backend=backend, snapshot=Snapshot(backend, 'address'))
+    assert from_snapshot[b'alice'] == Storage(root, backend=backend)[b'alice'] == (10 ** 18).to_bytes(8, 'big')
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import rlp
+
+from blockchain import transaction as transaction_module
+from blockchain.transaction import Transaction, recover_senders, sender_recovery_pool
+from kademlia.crypto import mk_privkey, privtopub
+
+
+def signed_transactions(count):
+    keys = [mk_privkey(b'key-%d' % i) for i in range(count)]
+    transactions = []
+    for i, key in enumerate(keys):
+        tx = Transaction(i, 1, 21000, b'to', 1, rlp.encode(b''))
+        tx.sign(key)
+        transactions.append(tx)
+    return transactions, [privtopub(key) for key in keys]
+
+
+def test_sender_is_recovered_once(monkeypatch):
+    tx, = signed_transactions(1)[0]
+    assert tx.sender == privtopub(mk_privkey(b'key-0'))
+
+    def fail(*args):
+        raise AssertionError("signature recovered twice")
+
+    monkeypatch.setattr(transaction_module, "recover_sender", fail)
+    assert tx.sender == privtopub(mk_privkey(b'key-0'))
+
+
+def test_recover_senders(monkeypatch):
+    monkeypatch.setattr(transaction_module, "_senders", transaction_module.LRUCache(100))
+    monkeypatch.setattr(transaction_module, "PROCESS_BATCH", 4)
+    transactions, senders = signed_transactions(6)
+    assert recover_senders(transactions[:2]) == senders[:2]
+    # The first two come from the cache, the others are recovered in worker processes
+    executor = sender_recovery_pool(2)
+    assert recover_senders(transactions, executor) == senders
+    executor.shutdown()
+    assert [tx.sender for tx in transactions] == senders
+
+
+def test_is_valid():
+    tx, = signed_transactions(1)[0]
+    assert tx.is_valid()
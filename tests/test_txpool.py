@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import rlp
+
+from blockchain.transaction import Transaction
+from blockchain.txpool import TxPool
+from kademlia.crypto import mk_privkey, privtopub
+
+
+def make_tx(nonce, gas_price):
+    return Transaction(nonce, gas_price, 21000, b'to', 1, rlp.encode(b''))
+
+
+def test_pending_orders_by_price_and_nonce():
+    pool = TxPool()
+    assert pool.add(make_tx(0, 5), sender=b'alice')
+    assert pool.add(make_tx(1, 50), sender=b'alice')
+    assert pool.add(make_tx(0, 10), sender=b'bob')
+    assert pool.add(make_tx(1, 1), sender=b'bob')
+    assert not pool.add(make_tx(0, 10), sender=b'bob')
+
+    order = [(sender, tx.nonce) for sender, tx in pool.pending()]
+    assert order == [(b'bob', 0), (b'alice', 0), (b'alice', 1), (b'bob', 1)]
+
+
+def test_pending_follows_pool_updates():
+    pool = TxPool()
+    late = make_tx(1, 50)
+    assert pool.add(late, sender=b'alice')
+    assert pool.add(make_tx(0, 5), sender=b'alice')
+    assert pool.add(make_tx(0, 10), sender=b'bob')
+    assert pool.add(make_tx(0, 20), sender=b'bob')
+    assert [(sender, tx.nonce, tx.gas_price) for sender, tx in pool.pending()] == [
+        (b'bob', 0, 20), (b'alice', 0, 5), (b'alice', 1, 50)
+    ]
+
+    pending = pool.pending()
+    assert next(pending)[0] == b'bob'
+    pool.remove(late)
+    assert pool.add(make_tx(2, 1), sender=b'alice')
+    assert [(sender, tx.nonce) for sender, tx in pending] == [(b'alice', 0), (b'alice', 2)]
+
+
+def test_replacement_and_eviction():
+    pool = TxPool(capacity=3)
+    cheap = make_tx(0, 1)
+    assert pool.add(cheap, sender=b'alice')
+    assert not pool.add(make_tx(0, 1), sender=b'alice')
+    replacement = make_tx(0, 2)
+    assert pool.add(replacement, sender=b'alice')
+    assert cheap not in pool and replacement in pool
+
+    assert pool.add(make_tx(0, 10), sender=b'bob')
+    assert pool.add(make_tx(0, 20), sender=b'carol')
+    # Full: a transaction cheaper than all of the pool is rejected, a more expensive one evicts the cheapest
+    assert not pool.add(make_tx(0, 1), sender=b'dave')
+    assert pool.add(make_tx(0, 30), sender=b'dave')
+    assert len(pool) == 3 and replacement not in pool
+
+
+def test_remove_included():
+    pool = TxPool()
+    txs = [make_tx(nonce, 1) for nonce in range(4)]
+    for tx in txs:
+        pool.add(tx, sender=b'alice')
+    assert pool.add(make_tx(0, 2), sender=b'bob')
+    pool.remove_included([txs[2]])
+    assert [(sender, tx.nonce) for sender, tx in pool.pending()] == [(b'bob', 0), (b'alice', 3)]
+    assert txs[3] in pool and txs[0] not in pool
+    assert pool.remove(txs[3].hash)
+    assert not pool.remove(txs[3])
+
+
+def test_remove_included_from_other_node():
+    pool = TxPool()
+    key = mk_privkey(b'alice')
+    for nonce in range(3):
+        tx = make_tx(nonce, 1)
+        tx.sign(key)
+        assert pool.add(tx)
+    # Same nonce as a pool transaction but another hash: the sender is recovered from the signature
+    included = make_tx(1, 7)
+    included.sign(key)
+    assert included not in pool
+    pool.remove_included([included])
+    assert [(sender, tx.nonce) for sender, tx in pool.pending()] == [(privtopub(key), 2)]
+
+
+def test_subscribe():
+    pool = TxPool()
+    added = []
+    pool.subscribe(added.append)
+    tx = make_tx(0, 1)
+    assert pool.add(tx, sender=b'alice')
+    assert not pool.add(tx, sender=b'alice')
+    assert added == [tx]
+    assert pool.sender(tx.hash) == b'alice'